@@ -0,0 +1,51 @@
+"""Micro-benchmark of the /search result page parsers.
+
+Parses the saved result pages in benchmarks/fixtures with every installed
+backend (BeautifulSoup with html.parser or lxml, and selectolax). Run from the
+repository root:
+
+    python -m benchmarks.search_parsers [rounds]
+"""
+import os
+import sys
+import time
+import statistics
+from utils.search_parsers import parse_bing, parse_duckduckgo
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+PARSERS = {
+    "duckduckgo.html": parse_duckduckgo,
+    "bing.html": parse_bing,
+}
+BACKENDS = ("html.parser", "lxml", "selectolax")
+
+def _available(backend: str) -> bool:
+    if backend == "html.parser":
+        return True
+    try:
+        __import__(backend)
+        return True
+    except ImportError:
+        return False
+
+def run(rounds: int = 50):
+    print(f"{'fixture':<18}{'backend':<13}{'results':>8}{'median ms':>11}{'p90 ms':>9}")
+    for fixture, parse in PARSERS.items():
+        with open(os.path.join(FIXTURES_DIR, fixture), encoding="utf-8") as file:
+            html = file.read()
+        for backend in BACKENDS:
+            if not _available(backend):
+                print(f"{fixture:<18}{backend:<13}{'not installed':>28}")
+                continue
+            results = parse(html, backend)
+            timings = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                parse(html, backend)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p90 = timings[min(len(timings) - 1, int(0.9 * len(timings)))]
+            print(f"{fixture:<18}{backend:<13}{len(results):>8}{statistics.median(timings):>11.2f}{p90:>9.2f}")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
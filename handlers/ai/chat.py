@@ -1,4 +1,3 @@
-import asyncio
 import builtins
 from google import genai
 from pyrogram import Client, types
@@ -83,8 +82,8 @@ async def gemini_command(client: Client, message: types.Message):
         if len(response_text) > limit:
             parts = [response_text[i: i + limit] for i in range(0, len(response_text), limit)]
             for part in parts:
+                # The outbound scheduler spaces the chunks out per chat
                 await message.reply(f"**{GEMINI_MODEL.title()}:** {part}")
-                await asyncio.sleep(0.5)
         else:
             await message.reply(f"**{GEMINI_MODEL.title()}:** {response_text}")
         
@@ -3,6 +3,7 @@ import io
 from pyrogram import Client, types
 from config import BOT_USERNAME, HUGGINGFACE_TOKEN
 from utils.usage import save_usage
+from utils.http import get_session
 
 # Track active requests per chat
 active_imagine_requests = set()
@@ -34,22 +35,22 @@ async def imagine_command(client: Client, message: types.Message):
         headers = {"Authorization": f"Bearer {API_TOKEN}"}
         payload = {"inputs": something_to_imagine}
         
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.post(API_URL, json=payload) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    print(f"API Error: {response.status} - {error_text}")
-                    await waiting_msg.edit(f"Failed to generate image. API Error {response.status}: {error_text}")
-                    active_imagine_requests.discard(chat_id)
-                    return
-                content_type = response.headers.get('content-type', '')
-                if not content_type.startswith('image/'):
-                    error_text = await response.text()
-                    print(f"Invalid response type: {content_type}, Response: {error_text}")
-                    await waiting_msg.edit(f"Image generation failed. Error: {error_text}")
-                    active_imagine_requests.discard(chat_id)
-                    return
-                image_bytes = await response.read()
+        session = get_session()
+        async with session.post(API_URL, json=payload, headers=headers, timeout=aiohttp.ClientTimeout(total=300)) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                print(f"API Error: {response.status} - {error_text}")
+                await waiting_msg.edit(f"Failed to generate image. API Error {response.status}: {error_text}")
+                active_imagine_requests.discard(chat_id)
+                return
+            content_type = response.headers.get('content-type', '')
+            if not content_type.startswith('image/'):
+                error_text = await response.text()
+                print(f"Invalid response type: {content_type}, Response: {error_text}")
+                await waiting_msg.edit(f"Image generation failed. Error: {error_text}")
+                active_imagine_requests.discard(chat_id)
+                return
+            image_bytes = await response.read()
         
         file = io.BytesIO(image_bytes)
         file.name = "image.png"
@@ -1,12 +1,13 @@
 import io
-import aiohttp
-import aiosqlite
-import ast
 from pyrogram import Client, types
-from pyrogram.types import InlineKeyboardButton, InputMediaPhoto, InlineKeyboardMarkup
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from pyrogram.errors import FloodWait
 from config import BOT_USERNAME
 from utils.usage import save_usage
+from utils.http import get_session
+from .jikan import jikan_search, JikanError
+from .carousel_store import save_carousel, get_carousel, set_carousel_index
+from .carousel_media import remember_photo, prefetch_photos, neighbour_urls, edit_carousel_photo
 
 
 # ---------------------------
@@ -25,13 +26,7 @@ async def anime_command(client: Client, message: types.Message):
     index = 0
     anime_results_list = []
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://api.jikan.moe/v4/anime?q={query}&order_by=favorites&sort=desc&sfw=true") as response:
-                if response.status == 200:
-                    results = await response.json()
-                else:
-                    await message.reply(f"API Error: Status {response.status}")
-                    return
+        results = await jikan_search("anime", query, sfw=True)
 
         for result in results.get('data', []):
             # Skip unwanted genres
@@ -61,6 +56,9 @@ async def anime_command(client: Client, message: types.Message):
             index += 1
             if index == 10:
                 break
+    except JikanError as e:
+        await message.reply(f"API Error: Status {e.status}")
+        return
     except Exception as e:
         await message.reply(f"Error fetching data: {str(e)}")
         return
@@ -100,16 +98,10 @@ async def anime_command(client: Client, message: types.Message):
             caption=caption,
             reply_markup=types.InlineKeyboardMarkup(buttons)
         )
-        async with aiosqlite.connect("db/database.db") as connection:
-            async with connection.cursor() as cursor:
-                await cursor.execute(
-                    "CREATE TABLE IF NOT EXISTS anime (message_id TEXT, current_index INTEGER, anime_result_list TEXT)"
-                )
-                await cursor.execute(
-                    "INSERT INTO anime (message_id, current_index, anime_result_list) VALUES (?, ?, ?)",
-                    (str(sent_msg.id), 0, str(anime_results_list))
-                )
-                await connection.commit()
+        await save_carousel("anime", chat.id, sent_msg.id, anime_results_list)
+        remember_photo(anime_results_list[0]['image_url'], sent_msg)
+        # Have the next page's image on Telegram before it is asked for
+        prefetch_photos(client, chat.id, neighbour_urls(anime_results_list, 0))
     except Exception as e:
         await message.reply(f"Error displaying results: {str(e)}")
 
@@ -129,32 +121,29 @@ async def character_command(client: Client, message: types.Message):
     
     index = 0
     character_results_list = []
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(f"https://api.jikan.moe/v4/characters?q={query}&order_by=favorites&sort=desc") as response:
-                if response.status == 200:
-                    results = await response.json()
-                else:
-                    await message.reply(f"API Error: Status {response.status}")
-                    return
+    try:
+        results = await jikan_search("characters", query)
                 
-            for result in results.get('data', []):
-                this_result = {
-                    'url': result["url"],
-                    'image_url': result["images"]["jpg"]["image_url"],
-                    'name': result["name"],
-                    'favorites': result["favorites"],
-                    'about': "" if result["about"] is None else (
-                        result["about"][:800] + "..." if len(result["about"]) > 800 else result["about"]
-                    )
-                }
-                character_results_list.append(this_result)
-                index += 1
-                if index == 10:
-                    break
-        except Exception as e:
-            await message.reply(f"Error fetching data: {str(e)}")
-            return
+        for result in results.get('data', []):
+            this_result = {
+                'url': result["url"],
+                'image_url': result["images"]["jpg"]["image_url"],
+                'name': result["name"],
+                'favorites': result["favorites"],
+                'about': "" if result["about"] is None else (
+                    result["about"][:800] + "..." if len(result["about"]) > 800 else result["about"]
+                )
+            }
+            character_results_list.append(this_result)
+            index += 1
+            if index == 10:
+                break
+    except JikanError as e:
+        await message.reply(f"API Error: Status {e.status}")
+        return
+    except Exception as e:
+        await message.reply(f"Error fetching data: {str(e)}")
+        return
 
     if index == 0:
         await message.reply("No results found.")
@@ -173,16 +162,7 @@ async def character_command(client: Client, message: types.Message):
             reply_markup=types.InlineKeyboardMarkup(buttons)
         )
 
-        async with aiosqlite.connect("db/database.db") as connection:
-            async with connection.cursor() as cursor:
-                await cursor.execute(
-                    "CREATE TABLE IF NOT EXISTS character (message_id TEXT, current_index INTEGER, character_result_list TEXT)"
-                )
-                await cursor.execute(
-                    "INSERT INTO character (message_id, current_index, character_result_list) VALUES (?, ?, ?)",
-                    (str(msg.id), 0, str(character_results_list))
-                )
-                await connection.commit()
+        await save_carousel("character", chat.id, msg.id, character_results_list)
     except Exception as e:
         await message.reply(f"Error displaying results: {str(e)}")
 
@@ -195,15 +175,15 @@ async def aghpb_command(client: Client, message: types.Message):
     
     url = "https://api.devgoldy.xyz/aghpb/v1/random"
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    image_bytes = await response.read()
-                    image_file = io.BytesIO(image_bytes)
-                    image_file.name = "aghpb.jpg"  # Add a filename
-                    await message.reply_photo(photo=image_file)
-                else:
-                    await message.reply(f"API Error: Status {response.status}")
+        session = get_session()
+        async with session.get(url) as response:
+            if response.status == 200:
+                image_bytes = await response.read()
+                image_file = io.BytesIO(image_bytes)
+                image_file.name = "aghpb.jpg"  # Add a filename
+                await message.reply_photo(photo=image_file)
+            else:
+                await message.reply(f"API Error: Status {response.status}")
     except Exception as e:
         await message.reply(f"Error fetching image: {str(e)}")
 
@@ -211,19 +191,13 @@ async def handle_anime_callback(client: Client, callback_query):
     """Handle anime pagination callbacks."""
     data = callback_query.data
     
-    async with aiosqlite.connect("db/database.db") as connection:
-        async with connection.cursor() as cursor:
-            await cursor.execute(
-                "SELECT * FROM anime WHERE message_id = ?", (str(callback_query.message.id),)
-            )
-            db_data = await cursor.fetchall()
-
-    if not db_data:
+    carousel = await get_carousel("anime", callback_query.message.chat.id, callback_query.message.id)
+    if not carousel:
         await callback_query.answer("No data found.")
         return
 
-    current_index = db_data[0][1]
-    anime_results_list = ast.literal_eval(db_data[0][2].replace("'", "\"").replace("None", "\"None\""))
+    current_index = carousel['index']
+    anime_results_list = carousel['results']
     btn_type = "prev" if "prev" in data else "next" if "next" in data else None
     
     if current_index == 0 and btn_type == "prev":
@@ -280,10 +254,7 @@ async def handle_anime_callback(client: Client, callback_query):
 
     # Edit the message with new content and buttons
     try:
-        await callback_query.message.edit_media(
-            media=InputMediaPhoto(media=image_link, caption=message_content),
-            reply_markup=InlineKeyboardMarkup(buttons)
-        )
+        await edit_carousel_photo(callback_query.message, image_link, message_content, InlineKeyboardMarkup(buttons))
     except FloodWait as e:
         await callback_query.answer(f"Please wait {e.value} seconds before trying again.", show_alert=True)
         return
@@ -293,10 +264,5 @@ async def handle_anime_callback(client: Client, callback_query):
     
     await callback_query.answer()
 
-    async with aiosqlite.connect("db/database.db") as connection:
-        async with connection.cursor() as cursor:
-            await cursor.execute(
-                "UPDATE anime SET current_index = ? WHERE message_id = ?",
-                (updated_index, str(callback_query.message.id))
-            )
-            await connection.commit()
\ No newline at end of file
+    prefetch_photos(client, callback_query.message.chat.id, neighbour_urls(anime_results_list, updated_index))
+    await set_carousel_index(callback_query.message.chat.id, callback_query.message.id, updated_index)
\ No newline at end of file
@@ -0,0 +1,107 @@
+import io
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+from pyrogram import Client, raw, types
+from pyrogram.errors import FloodWait
+from pyrogram.types import InputMediaPhoto
+from utils.http import get_session
+
+logger = logging.getLogger(__name__)
+
+PHOTO_CACHE_SIZE = 1000  # Image URLs whose Telegram file_id is remembered
+MAX_PREFETCH_BYTES = 10 * 1024 * 1024  # Telegram's limit for photos
+PREFETCH_WAIT = 5  # Seconds a page flip waits for its image's prefetch to finish
+
+# image_url -> Telegram file_id, least recently used first
+photo_file_ids: "OrderedDict[str, str]" = OrderedDict()
+# image_url -> running prefetch
+prefetching: Dict[str, asyncio.Task] = {}
+
+def _store_file_id(image_url: str, file_id: str):
+    photo_file_ids[image_url] = file_id
+    photo_file_ids.move_to_end(image_url)
+    while len(photo_file_ids) > PHOTO_CACHE_SIZE:
+        photo_file_ids.popitem(last=False)
+
+def remember_photo(image_url: str, message: Optional[types.Message]):
+    """Keep the file_id Telegram assigned to a photo we sent from image_url."""
+    if image_url and message and message.photo:
+        _store_file_id(image_url, message.photo.file_id)
+
+def forget_photo(image_url: str):
+    """Drop a file_id Telegram no longer accepts."""
+    photo_file_ids.pop(image_url, None)
+
+def photo_media(image_url: str) -> str:
+    """The cached file_id for an image, or its URL when it was never uploaded."""
+    file_id = photo_file_ids.get(image_url)
+    if file_id:
+        photo_file_ids.move_to_end(image_url)
+    return file_id or image_url
+
+async def _upload_photo(client: Client, chat_id: int, image_url: str):
+    """Upload an image to Telegram without sending it, and cache its file_id."""
+    peer = await client.resolve_peer(chat_id)
+    try:
+        # Let Telegram fetch the URL itself
+        media = await client.invoke(raw.functions.messages.UploadMedia(
+            peer=peer,
+            media=raw.types.InputMediaPhotoExternal(url=image_url)
+        ))
+    except Exception as e:
+        # Some hosts refuse Telegram's fetcher, so download the bytes and upload them
+        logger.info(f"External photo upload failed for {image_url}, uploading bytes instead: {e}")
+        async with get_session().get(image_url) as response:
+            response.raise_for_status()
+            image_bytes = await response.content.read(MAX_PREFETCH_BYTES + 1)
+        if len(image_bytes) > MAX_PREFETCH_BYTES:
+            return
+        image_file = io.BytesIO(image_bytes)
+        image_file.name = "cover.jpg"
+        media = await client.invoke(raw.functions.messages.UploadMedia(
+            peer=peer,
+            media=raw.types.InputMediaUploadedPhoto(file=await client.save_file(image_file))
+        ))
+
+    if isinstance(media, raw.types.MessageMediaPhoto) and isinstance(media.photo, raw.types.Photo):
+        _store_file_id(image_url, types.Photo._parse(client, media.photo).file_id)
+
+async def _prefetch(client: Client, chat_id: int, image_url: str):
+    try:
+        await _upload_photo(client, chat_id, image_url)
+    except Exception as e:
+        logger.warning(f"Could not prefetch carousel image {image_url}: {e}")
+    finally:
+        prefetching.pop(image_url, None)
+
+def prefetch_photos(client: Client, chat_id: int, image_urls: Iterable[str]):
+    """Upload the images of neighbouring carousel pages in the background."""
+    for image_url in image_urls:
+        if image_url and image_url not in photo_file_ids and image_url not in prefetching:
+            prefetching[image_url] = asyncio.create_task(_prefetch(client, chat_id, image_url))
+
+def neighbour_urls(results, index: int):
+    """Image URLs of the pages next to index."""
+    return [results[i]['image_url'] for i in (index - 1, index + 1) if 0 <= i < len(results)]
+
+async def edit_carousel_photo(message: types.Message, image_url: str, caption: str, reply_markup) -> types.Message:
+    """Show another carousel page, using the image's cached file_id when there is one."""
+    # The user flipped faster than the prefetch, finishing it is still quicker than starting over
+    pending = prefetching.get(image_url)
+    if pending:
+        await asyncio.wait({pending}, timeout=PREFETCH_WAIT)
+    media = photo_media(image_url)
+    try:
+        edited = await message.edit_media(media=InputMediaPhoto(media=media, caption=caption), reply_markup=reply_markup)
+    except FloodWait:
+        raise
+    except Exception:
+        if media == image_url:
+            raise
+        # The cached file_id was rejected, fall back to the URL
+        forget_photo(image_url)
+        edited = await message.edit_media(media=InputMediaPhoto(media=image_url, caption=caption), reply_markup=reply_markup)
+    remember_photo(image_url, edited)
+    return edited
@@ -0,0 +1,95 @@
+import json
+import time
+import logging
+import aiosqlite
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CAROUSEL_DB = "db/database.db"
+CAROUSEL_TTL = 7 * 24 * 3600  # Seconds a result carousel can still be paged
+CAROUSEL_HOT_SIZE = 200  # Carousels kept in memory
+CAROUSEL_SWEEP_INTERVAL = 3600  # Seconds between deletions of expired carousels
+
+# (chat_id, message_id) -> {'kind', 'index', 'results', 'created_at'}, least recently used first
+hot_carousels: "OrderedDict[Tuple[int, int], Dict[str, Any]]" = OrderedDict()
+db_ready = False
+last_sweep = 0.0
+
+async def _ensure_schema(connection: aiosqlite.Connection):
+    global db_ready
+    if not db_ready:
+        await connection.execute(
+            "CREATE TABLE IF NOT EXISTS carousels ("
+            "chat_id INTEGER, message_id INTEGER, kind TEXT, current_index INTEGER, "
+            "results TEXT, created_at REAL, PRIMARY KEY (chat_id, message_id))"
+        )
+        await connection.execute("CREATE INDEX IF NOT EXISTS carousels_created_at ON carousels (created_at)")
+        # The old per-kind tables stored Python reprs and were never pruned
+        for legacy_table in ("anime", "manga", "character"):
+            await connection.execute(f"DROP TABLE IF EXISTS {legacy_table}")
+        await connection.commit()
+        db_ready = True
+
+def _remember(key: Tuple[int, int], carousel: Dict[str, Any]):
+    hot_carousels[key] = carousel
+    hot_carousels.move_to_end(key)
+    while len(hot_carousels) > CAROUSEL_HOT_SIZE:
+        hot_carousels.popitem(last=False)
+
+async def save_carousel(kind: str, chat_id: int, message_id: int, results: List[Dict[str, Any]]):
+    """Store a freshly sent carousel's results, starting at the first entry."""
+    global last_sweep
+    now = time.time()
+    _remember((chat_id, message_id), {'kind': kind, 'index': 0, 'results': results, 'created_at': now})
+
+    async with aiosqlite.connect(CAROUSEL_DB) as connection:
+        await _ensure_schema(connection)
+        await connection.execute(
+            "INSERT OR REPLACE INTO carousels (chat_id, message_id, kind, current_index, results, created_at) "
+            "VALUES (?, ?, ?, 0, ?, ?)",
+            (chat_id, message_id, kind, json.dumps(results, separators=(",", ":"), ensure_ascii=False), now)
+        )
+        if now - last_sweep >= CAROUSEL_SWEEP_INTERVAL:
+            last_sweep = now
+            cursor = await connection.execute("DELETE FROM carousels WHERE created_at < ?", (now - CAROUSEL_TTL,))
+            if cursor.rowcount:
+                logger.info(f"Deleted {cursor.rowcount} expired carousels")
+        await connection.commit()
+
+async def get_carousel(kind: str, chat_id: int, message_id: int) -> Optional[Dict[str, Any]]:
+    """Return a carousel's state from memory, or from the database after a restart."""
+    key = (chat_id, message_id)
+    carousel = hot_carousels.get(key)
+    if carousel is None:
+        async with aiosqlite.connect(CAROUSEL_DB) as connection:
+            await _ensure_schema(connection)
+            async with connection.execute(
+                "SELECT kind, current_index, results, created_at FROM carousels WHERE chat_id = ? AND message_id = ?",
+                key
+            ) as cursor:
+                row = await cursor.fetchone()
+        if not row:
+            return None
+        carousel = {'kind': row[0], 'index': row[1], 'results': json.loads(row[2]), 'created_at': row[3]}
+        _remember(key, carousel)
+    else:
+        hot_carousels.move_to_end(key)
+
+    if carousel['kind'] != kind or time.time() - carousel['created_at'] > CAROUSEL_TTL:
+        return None
+    return carousel
+
+async def set_carousel_index(chat_id: int, message_id: int, index: int):
+    """Record the page a carousel is showing now."""
+    key = (chat_id, message_id)
+    if key in hot_carousels:
+        hot_carousels[key]['index'] = index
+    async with aiosqlite.connect(CAROUSEL_DB) as connection:
+        await _ensure_schema(connection)
+        await connection.execute(
+            "UPDATE carousels SET current_index = ? WHERE chat_id = ? AND message_id = ?",
+            (index, chat_id, message_id)
+        )
+        await connection.commit()
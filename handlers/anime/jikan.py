@@ -0,0 +1,158 @@
+import json
+import time
+import asyncio
+import logging
+import aiosqlite
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from utils.http import get_session
+from utils.outbound import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+JIKAN_API_BASE = "https://api.jikan.moe/v4"
+JIKAN_FRESH_TTL = 6 * 3600  # Seconds a response is served without asking Jikan again
+JIKAN_STALE_TTL = 7 * 24 * 3600  # Older responses are still served while a refresh runs in the background
+JIKAN_CACHE_SIZE = 500  # Responses kept in memory
+JIKAN_CACHE_DB = "db/jikan_cache.db"  # Set to None to keep the cache in memory only
+JIKAN_MAX_RETRIES = 2  # Retries after a 429
+
+# Jikan allows 3 requests per second and 60 per minute. A bucket refilling at 0.5/s
+# with room for 30 never lets more than 60 through in any 60 second window.
+jikan_second_bucket = TokenBucket(3.0, 3)
+jikan_minute_bucket = TokenBucket(0.5, 30)
+jikan_lock = asyncio.Lock()
+
+# Normalized query key -> (fetched_at, response), least recently used first
+memory_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+# Requests currently being fetched, shared by everyone asking for the same key
+in_flight: Dict[str, asyncio.Task] = {}
+db_ready = False
+
+class JikanError(Exception):
+    """Jikan answered with an error status."""
+    def __init__(self, status: int):
+        super().__init__(f"API Error: Status {status}")
+        self.status = status
+
+def normalize_query(query: str) -> str:
+    """Case and whitespace differences don't change Jikan's results."""
+    return " ".join(query.lower().split())
+
+async def _wait_for_quota():
+    """Block until one more request fits both Jikan quotas."""
+    async with jikan_lock:
+        while True:
+            now = time.monotonic()
+            delay = max(jikan_second_bucket.delay(now), jikan_minute_bucket.delay(now))
+            if delay <= 0:
+                jikan_second_bucket.take()
+                jikan_minute_bucket.take()
+                return
+            await asyncio.sleep(delay)
+
+async def _fetch(endpoint: str, params: Dict[str, str]) -> Dict[str, Any]:
+    """Call Jikan within the rate limit, backing off when it still answers 429."""
+    for attempt in range(JIKAN_MAX_RETRIES + 1):
+        await _wait_for_quota()
+        async with get_session().get(f"{JIKAN_API_BASE}/{endpoint}", params=params) as response:
+            if response.status == 200:
+                return await response.json()
+            if response.status != 429 or attempt == JIKAN_MAX_RETRIES:
+                raise JikanError(response.status)
+            retry_after = response.headers.get("Retry-After", "")
+            pause = float(retry_after) if retry_after.isdigit() else 1.0 * (attempt + 1)
+        logger.warning(f"Jikan rate limited /{endpoint}, retrying in {pause:.0f}s")
+        jikan_second_bucket.pause(pause)
+        jikan_minute_bucket.pause(pause)
+
+async def _db_get(key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+    global db_ready
+    if not JIKAN_CACHE_DB:
+        return None
+    async with aiosqlite.connect(JIKAN_CACHE_DB) as connection:
+        if not db_ready:
+            await connection.execute(
+                "CREATE TABLE IF NOT EXISTS jikan_cache (key TEXT PRIMARY KEY, fetched_at REAL, response TEXT)"
+            )
+            await connection.commit()
+            db_ready = True
+        async with connection.execute("SELECT fetched_at, response FROM jikan_cache WHERE key = ?", (key,)) as cursor:
+            row = await cursor.fetchone()
+    return (row[0], json.loads(row[1])) if row else None
+
+async def _db_put(key: str, fetched_at: float, response: Dict[str, Any]):
+    if not JIKAN_CACHE_DB:
+        return
+    async with aiosqlite.connect(JIKAN_CACHE_DB) as connection:
+        await connection.execute(
+            "INSERT OR REPLACE INTO jikan_cache (key, fetched_at, response) VALUES (?, ?, ?)",
+            (key, fetched_at, json.dumps(response, separators=(",", ":")))
+        )
+        await connection.execute("DELETE FROM jikan_cache WHERE fetched_at < ?", (time.time() - JIKAN_STALE_TTL,))
+        await connection.commit()
+
+def _remember(key: str, fetched_at: float, response: Dict[str, Any]):
+    memory_cache[key] = (fetched_at, response)
+    memory_cache.move_to_end(key)
+    while len(memory_cache) > JIKAN_CACHE_SIZE:
+        memory_cache.popitem(last=False)
+
+async def _refresh(key: str, endpoint: str, params: Dict[str, str]) -> Dict[str, Any]:
+    try:
+        response = await _fetch(endpoint, params)
+        fetched_at = time.time()
+        _remember(key, fetched_at, response)
+        try:
+            await _db_put(key, fetched_at, response)
+        except Exception as e:
+            logger.error(f"Error saving Jikan response to cache: {e}")
+        return response
+    finally:
+        in_flight.pop(key, None)
+
+def _start_refresh(key: str, endpoint: str, params: Dict[str, str]) -> asyncio.Task:
+    task = in_flight.get(key)
+    if task is None:
+        task = in_flight[key] = asyncio.create_task(_refresh(key, endpoint, params))
+        # Background refreshes may fail with nobody waiting on them
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+async def jikan_search(endpoint: str, query: str, **filters) -> Dict[str, Any]:
+    """Search a Jikan endpoint (anime, manga, characters), ordered by favorites.
+
+    Fresh responses come from the cache; stale ones are returned right away and
+    refreshed in the background; missing ones are fetched once no matter how
+    many requests ask for them at the same time.
+    """
+    params = {"q": normalize_query(query), "order_by": "favorites", "sort": "desc"}
+    params.update({name: str(value).lower() for name, value in filters.items()})
+    key = f"{endpoint}?" + "&".join(f"{name}={value}" for name, value in sorted(params.items()))
+
+    cached = memory_cache.get(key)
+    if cached is None:
+        try:
+            cached = await _db_get(key)
+        except Exception as e:
+            logger.error(f"Error reading Jikan cache: {e}")
+        if cached:
+            _remember(key, *cached)
+    else:
+        memory_cache.move_to_end(key)
+
+    age = time.time() - cached[0] if cached else None
+    if cached and age < JIKAN_FRESH_TTL:
+        return cached[1]
+    if cached and age < JIKAN_STALE_TTL:
+        _start_refresh(key, endpoint, params)
+        return cached[1]
+
+    try:
+        return await asyncio.shield(_start_refresh(key, endpoint, params))
+    except Exception:
+        # An expired answer is still better than an error
+        if cached:
+            logger.warning(f"Serving expired Jikan response for {key}")
+            return cached[1]
+        raise
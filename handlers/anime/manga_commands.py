@@ -1,11 +1,11 @@
-import aiohttp
-import aiosqlite
-import ast
 from pyrogram import Client, types
-from pyrogram.types import InlineKeyboardButton, InputMediaPhoto, InlineKeyboardMarkup
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from pyrogram.errors import FloodWait
 from config import BOT_USERNAME
 from utils.usage import save_usage
+from .jikan import jikan_search, JikanError
+from .carousel_store import save_carousel, get_carousel, set_carousel_index
+from .carousel_media import remember_photo, prefetch_photos, neighbour_urls, edit_carousel_photo
 
 
 # ---------------------------
@@ -24,13 +24,7 @@ async def manga_command(client: Client, message: types.Message):
     index = 0
     manga_results_list = []
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://api.jikan.moe/v4/manga?q={query}&order_by=favorites&sort=desc&sfw=true") as response:
-                if response.status == 200:
-                    results = await response.json()
-                else:
-                    await message.reply(f"API Error: Status {response.status}")
-                    return
+        results = await jikan_search("manga", query, sfw=True)
         
         for result in results.get('data', []):
             # Skip unwanted tags
@@ -56,6 +50,9 @@ async def manga_command(client: Client, message: types.Message):
             index += 1
             if index == 10:
                 break
+    except JikanError as e:
+        await message.reply(f"API Error: Status {e.status}")
+        return
     except Exception as e:
         await message.reply(f"Error fetching data: {str(e)}")
         return
@@ -86,16 +83,10 @@ async def manga_command(client: Client, message: types.Message):
             caption=caption,
             reply_markup=types.InlineKeyboardMarkup(buttons)
         )
-        async with aiosqlite.connect("db/database.db") as connection:
-            async with connection.cursor() as cursor:
-                await cursor.execute(
-                    "CREATE TABLE IF NOT EXISTS manga (message_id TEXT, current_index INTEGER, manga_result_list TEXT)"
-                )
-                await cursor.execute(
-                    "INSERT INTO manga (message_id, current_index, manga_result_list) VALUES (?, ?, ?)",
-                    (str(sent_msg.id), 0, str(manga_results_list))
-                )
-                await connection.commit()
+        await save_carousel("manga", chat.id, sent_msg.id, manga_results_list)
+        remember_photo(manga_results_list[0]['image_url'], sent_msg)
+        # Have the next page's image on Telegram before it is asked for
+        prefetch_photos(client, chat.id, neighbour_urls(manga_results_list, 0))
     except Exception as e:
         await message.reply(f"Error displaying results: {str(e)}")
 
@@ -104,19 +95,13 @@ async def handle_manga_callback(client: Client, callback_query):
     """Handle manga pagination callbacks."""
     data = callback_query.data
     
-    async with aiosqlite.connect("db/database.db") as connection:
-        async with connection.cursor() as cursor:
-            await cursor.execute(
-                "SELECT * FROM manga WHERE message_id = ?", (str(callback_query.message.id),)
-            )
-            db_data = await cursor.fetchall()
-
-    if not db_data:
+    carousel = await get_carousel("manga", callback_query.message.chat.id, callback_query.message.id)
+    if not carousel:
         await callback_query.answer("No data found.")
         return
 
-    current_index = db_data[0][1]
-    manga_results_list = ast.literal_eval(db_data[0][2].replace("'", "\"").replace("None", "\"None\""))
+    current_index = carousel['index']
+    manga_results_list = carousel['results']
     btn_type = "prev" if "prev" in data else "next" if "next" in data else None
     
     if current_index == 0 and btn_type == "prev":
@@ -165,10 +150,7 @@ async def handle_manga_callback(client: Client, callback_query):
 
     # Edit the message with new content and buttons
     try:
-        await callback_query.message.edit_media(
-            media=InputMediaPhoto(media=image_link, caption=message_content),
-            reply_markup=InlineKeyboardMarkup(buttons)
-        )
+        await edit_carousel_photo(callback_query.message, image_link, message_content, InlineKeyboardMarkup(buttons))
     except FloodWait as e:
         await callback_query.answer(f"Please wait {e.value} seconds before trying again.", show_alert=True)
         return
@@ -178,10 +160,5 @@ async def handle_manga_callback(client: Client, callback_query):
         
     await callback_query.answer()
 
-    async with aiosqlite.connect("db/database.db") as connection:
-        async with connection.cursor() as cursor:
-            await cursor.execute(
-                "UPDATE manga SET current_index = ? WHERE message_id = ?",
-                (updated_index, str(callback_query.message.id))
-            )
-            await connection.commit()
+    prefetch_photos(client, callback_query.message.chat.id, neighbour_urls(manga_results_list, updated_index))
+    await set_carousel_index(callback_query.message.chat.id, callback_query.message.id, updated_index)
@@ -8,6 +8,7 @@ from pyrogram.errors import UserAdminInvalid
 from pyrogram.enums import ChatMembersFilter
 from utils.usage import save_usage
 from utils.decorators import admin_only, protect_admins, require_permission
+from utils.outbound import outbound_priority, PRIORITY_BACKGROUND
 from utils.helpers import create_pagination_keyboard, extract_user_and_reason, split_text_into_pages, get_markdown_mention
 
 logger = logging.getLogger(__name__)
@@ -131,6 +132,8 @@ async def check_pending_unmutes(client: Client):
 # Background task to check for pending unmutes
 async def unmute_checker_task(client: Client):
     """Background task that runs every 10 seconds to check for pending unmutes."""
+    # Unmute notices yield to command replies
+    outbound_priority.set(PRIORITY_BACKGROUND)
     while True:
         try:
             await check_pending_unmutes(client)
@@ -3,6 +3,7 @@ import datetime
 import aiosqlite
 import os
 from utils.helpers import get_markdown_mention
+from utils.outbound import outbound_priority, PRIORITY_BACKGROUND
 
 # Dictionary to track active timer tasks
 # Key: (chat_id, timer_id), Value: asyncio task
@@ -121,6 +122,8 @@ async def schedule_timer(client, chat_id, timer_id, delay, reason, message_id=No
     Sleeps for the specified delay, then notifies the user that the timer has ended.
     After sending a message, update the timer status to 'ended'.
     """
+    # Timer notifications yield to command replies
+    outbound_priority.set(PRIORITY_BACKGROUND)
     try:
         await asyncio.sleep(delay)
         
@@ -0,0 +1,91 @@
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CONTENT_POOL_SIZE = 5  # Ready items kept per source
+CONTENT_HISTORY_SIZE = 50  # Served items kept to fall back on while a source is down
+REFILL_DELAY = 0.5  # Seconds between requests while refilling
+REFILL_RETRY_DELAY = 15  # First wait after a failed request, doubled up to REFILL_MAX_RETRY_DELAY
+REFILL_MAX_RETRY_DELAY = 300
+REFILL_MAX_DUPLICATES = 5  # Duplicates in a row after which a refill gives up until the next get()
+
+# Every pool, so they can be warmed at startup
+content_pools: List["ContentPool"] = []
+
+class ContentPool:
+    """A few ready items from one random-content API, refilled in the background.
+
+    fetch returns one item (a dict) or None when the response had nothing usable.
+    Items that were sent as media get a 'file_id' so repeats and fallbacks are
+    sent from Telegram's copy instead of the source URL.
+    """
+    def __init__(self, name: str, fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]], size: int = CONTENT_POOL_SIZE):
+        self.name = name
+        self.fetch = fetch
+        self.size = size
+        self.items = deque()
+        self.history = deque(maxlen=CONTENT_HISTORY_SIZE)
+        self.refill_task = None
+        content_pools.append(self)
+
+    async def get(self) -> Optional[Dict[str, Any]]:
+        """Take a ready item, fetching one directly only when the pool is empty."""
+        if self.items:
+            item = self.items.popleft()
+        else:
+            try:
+                item = await self.fetch()
+            except Exception:
+                # The source is down: repeat something we already sent rather than fail
+                if not self.history:
+                    raise
+                item = random.choice(self.history)
+                logger.warning(f"{self.name} source failed, serving a previous item")
+        self.refill()
+        if item is not None and item not in self.history:
+            self.history.append(item)
+        return item
+
+    def refill(self):
+        """Start topping the pool up unless that is already happening."""
+        if len(self.items) < self.size and (self.refill_task is None or self.refill_task.done()):
+            self.refill_task = asyncio.create_task(self._refill())
+
+    def _is_duplicate(self, item: Dict[str, Any]) -> bool:
+        return item in self.items or any(
+            item.get(key) and item.get(key) == previous.get(key)
+            for previous in self.history for key in ('text', 'url')
+        )
+
+    async def _refill(self):
+        retry_delay = REFILL_RETRY_DELAY
+        duplicates = 0
+        while len(self.items) < self.size:
+            try:
+                item = await self.fetch()
+                retry_delay = REFILL_RETRY_DELAY
+                # Some APIs answer the same item for a while, keep only new ones
+                if item is not None and not self._is_duplicate(item):
+                    self.items.append(item)
+                    duplicates = 0
+                    await asyncio.sleep(REFILL_DELAY)
+                    continue
+                duplicates += 1
+                if duplicates >= REFILL_MAX_DUPLICATES:
+                    # A small corpus can't fill the pool, stop asking until the pool is used
+                    logger.info(f"{self.name} pool stopped refilling after {duplicates} duplicates in a row")
+                    return
+                await asyncio.sleep(min(REFILL_DELAY * 2 ** duplicates, REFILL_MAX_RETRY_DELAY))
+            except Exception as e:
+                logger.warning(f"Refilling the {self.name} pool failed, retrying in {retry_delay}s: {e}")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, REFILL_MAX_RETRY_DELAY)
+
+def start_content_pools():
+    """Fill every pool in the background so the first commands are served locally."""
+    for pool in content_pools:
+        pool.refill()
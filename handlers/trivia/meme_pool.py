@@ -0,0 +1,120 @@
+import time
+import random
+import asyncio
+import logging
+import aiohttp
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+from config import REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT
+from utils.http import get_session
+
+logger = logging.getLogger(__name__)
+
+MEME_SUBREDDITS = ("memes", "animemes")
+MEME_FETCH_LIMIT = 50  # Hot posts read per refresh
+MEME_REFRESH_INTERVAL = 600  # Seconds between refreshes of every subreddit pool
+MEME_RECENT_PER_CHAT = 30  # Posts a chat won't be sent again until others were
+MEME_TRACKED_CHATS = 1000  # Chats whose recent memes are remembered
+MEME_FILE_ID_CACHE_SIZE = 1000
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+
+# subreddit -> eligible posts ({'id', 'title', 'url'}) from the last refresh
+meme_pools: Dict[str, List[Dict[str, Any]]] = {}
+# chat_id -> ids of posts recently sent there
+recent_memes: "OrderedDict[int, deque]" = OrderedDict()
+# post id -> Telegram file_id of the copy we sent
+meme_file_ids: "OrderedDict[str, str]" = OrderedDict()
+refresh_locks: Dict[str, asyncio.Lock] = {}
+reddit_token = {'value': None, 'expires_at': 0}
+
+async def _get_token() -> str:
+    """Application-only OAuth token, reused until shortly before it expires."""
+    if reddit_token['value'] and time.time() < reddit_token['expires_at'] - 60:
+        return reddit_token['value']
+    async with get_session().post(
+        "https://www.reddit.com/api/v1/access_token",
+        data={"grant_type": "client_credentials"},
+        auth=aiohttp.BasicAuth(REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET),
+        headers={"User-Agent": REDDIT_USER_AGENT}
+    ) as response:
+        if response.status != 200:
+            raise ValueError(f"Reddit auth failed: Status {response.status}")
+        data = await response.json()
+    reddit_token['value'] = data['access_token']
+    reddit_token['expires_at'] = time.time() + data.get('expires_in', 3600)
+    return reddit_token['value']
+
+async def refresh_subreddit(subreddit: str) -> List[Dict[str, Any]]:
+    """Replace a subreddit's pool with its current hot image posts."""
+    lock = refresh_locks.setdefault(subreddit, asyncio.Lock())
+    async with lock:
+        token = await _get_token()
+        async with get_session().get(
+            f"https://oauth.reddit.com/r/{subreddit}/hot",
+            params={"limit": MEME_FETCH_LIMIT, "raw_json": 1},
+            headers={"Authorization": f"bearer {token}", "User-Agent": REDDIT_USER_AGENT}
+        ) as response:
+            if response.status == 401:
+                reddit_token['value'] = None
+            if response.status != 200:
+                raise ValueError(f"Reddit API Error: Status {response.status}")
+            listing = await response.json()
+
+        posts = []
+        for child in listing.get('data', {}).get('children', []):
+            post = child.get('data', {})
+            # Filter out non-image posts and stickied posts
+            if (post.get('url', '').lower().endswith(IMAGE_EXTENSIONS) and
+                    not post.get('stickied') and not post.get('is_self') and not post.get('over_18')):
+                posts.append({'id': post['id'], 'title': post.get('title', ''), 'url': post['url']})
+        meme_pools[subreddit] = posts
+        return posts
+
+async def pick_meme(chat_id: int, subreddit: str) -> Optional[Dict[str, Any]]:
+    """Pick a pooled post that this chat hasn't been sent recently."""
+    posts = meme_pools.get(subreddit) or await refresh_subreddit(subreddit)
+    if not posts:
+        return None
+
+    recent = recent_memes.get(chat_id)
+    if recent is None:
+        recent = recent_memes[chat_id] = deque(maxlen=MEME_RECENT_PER_CHAT)
+        while len(recent_memes) > MEME_TRACKED_CHATS:
+            recent_memes.popitem(last=False)
+    recent_memes.move_to_end(chat_id)
+
+    fresh = [post for post in posts if post['id'] not in recent]
+    if fresh:
+        post = random.choice(fresh)
+    else:
+        # Everything was sent lately: repeat the post sent longest ago
+        by_id = {post['id']: post for post in posts}
+        post = next(by_id[post_id] for post_id in recent if post_id in by_id)
+    recent.append(post['id'])
+    return post
+
+def meme_media(post: Dict[str, Any]) -> str:
+    """The file_id of a post we already sent, or its URL."""
+    return meme_file_ids.get(post['id']) or post['url']
+
+def remember_meme(post: Dict[str, Any], file_id: str):
+    meme_file_ids[post['id']] = file_id
+    meme_file_ids.move_to_end(post['id'])
+    while len(meme_file_ids) > MEME_FILE_ID_CACHE_SIZE:
+        meme_file_ids.popitem(last=False)
+
+async def meme_refresh_task():
+    """Refresh every subreddit pool on a schedule."""
+    while True:
+        for subreddit in MEME_SUBREDDITS:
+            try:
+                posts = await refresh_subreddit(subreddit)
+                logger.info(f"Refreshed r/{subreddit} meme pool: {len(posts)} posts")
+            except Exception as e:
+                logger.error(f"Error refreshing r/{subreddit} meme pool: {e}")
+        await asyncio.sleep(MEME_REFRESH_INTERVAL)
+
+def start_meme_refresher():
+    """Start the background meme pool refresher."""
+    asyncio.create_task(meme_refresh_task())
+    logger.info("Meme pool refresher started")
@@ -1,12 +1,12 @@
 import random
-import praw
-import aiohttp
 import asyncio
 import time
 from pyrogram import Client, types, filters
 from pyrogram.handlers import MessageHandler
-from config import REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT
 from utils.usage import save_usage
+from utils.http import get_session
+from .content_pool import ContentPool
+from .meme_pool import pick_meme, meme_media, remember_meme
 
 # ---------------------------
 # Coinflip Command Handler
@@ -24,21 +24,13 @@ async def coinflip_command(client: Client, message: types.Message):
         await message.reply(f"Coin flip result: **{result}**")
 
 # ---------------------------
-# Meme Command Handler (using PRAW)
+# Meme Command Handler
 # ---------------------------
 async def meme_command(client: Client, message: types.Message):
     chat = message.chat
     await save_usage(chat, "meme")
     
     try:
-        # Initialize Reddit API
-        reddit = praw.Reddit(
-            client_id=REDDIT_CLIENT_ID,
-            client_secret=REDDIT_CLIENT_SECRET,
-            user_agent=REDDIT_USER_AGENT,
-            check_for_async=False
-        )
-        
         # Check if user specified "anime" parameter
         parts = message.text.split()
         if len(parts) > 1 and parts[1].lower() == "anime":
@@ -46,31 +38,95 @@ async def meme_command(client: Client, message: types.Message):
         else:
             subreddit_name = "memes"
         
-        # Choose the appropriate subreddit
-        subreddit = reddit.subreddit(subreddit_name)
-        
-        # Get hot submissions
-        all_subs = []
-        for submission in subreddit.hot(limit=50):
-            # Filter out non-image posts and stickied posts
-            if (submission.url.endswith(('.jpg', '.jpeg', '.png', '.gif')) and 
-                not submission.stickied and not submission.is_self):
-                all_subs.append(submission)
-        
-        if not all_subs:
+        # Pick from the pool the refresher keeps up to date
+        post = await pick_meme(chat.id, subreddit_name)
+        if not post:
             await message.reply("No suitable memes found. Try again later.")
             return
-            
-        # Select a random submission
-        random_sub = random.choice(all_subs)
-        name = random_sub.title
-        url = random_sub.url
         
         # Send the meme
-        await client.send_photo(chat.id, url, caption=name)
+        if post['url'].lower().endswith(".gif"):
+            sent = await client.send_animation(chat.id, meme_media(post), caption=post['title'])
+            sent_media = sent.animation
+        else:
+            sent = await client.send_photo(chat.id, meme_media(post), caption=post['title'])
+            sent_media = sent.photo
+        if sent_media:
+            remember_meme(post, sent_media.file_id)
     except Exception as e:
         await message.reply(f"Error fetching meme: {str(e)}")
 
+# ---------------------------
+# Random content sources
+# ---------------------------
+def media_kind(url):
+    """How a random media URL has to be sent, or None if Telegram can't show it."""
+    url = url.lower()
+    if url.endswith((".mp4", ".webm")):
+        return "video"
+    if url.endswith((".jpg", ".jpeg", ".png")):
+        return "photo"
+    if url.endswith(".gif"):
+        return "animation"
+    return None
+
+async def _fetch_json(url, **kwargs):
+    async with get_session().get(url, **kwargs) as response:
+        if response.status != 200:
+            raise ValueError(f"API Error: Status {response.status}")
+        return await response.json(content_type=None)
+
+async def fetch_geekjoke():
+    data = await _fetch_json("https://geek-jokes.sameerkumar.website/api?format=json")
+    joke = data.get('joke', '')
+    return {'text': joke} if joke else None
+
+async def fetch_dadjoke():
+    data = await _fetch_json("https://icanhazdadjoke.com/slack")
+    if 'attachments' in data and data['attachments']:
+        return {'text': data['attachments'][0]['text']}
+    return None
+
+async def fetch_dog():
+    data = await _fetch_json("https://random.dog/woof.json")
+    dog_url = data.get('url', '')
+    return {'url': dog_url} if media_kind(dog_url) else None
+
+async def fetch_cat():
+    data = await _fetch_json("https://api.thecatapi.com/v1/images/search")
+    cat_url = data[0].get('url', '') if data else ''
+    return {'url': cat_url} if media_kind(cat_url) else None
+
+async def fetch_affirmation():
+    data = await _fetch_json("https://www.affirmations.dev/")
+    affirmation_text = data.get('affirmation', '')
+    return {'text': affirmation_text} if affirmation_text else None
+
+async def fetch_advice():
+    data = await _fetch_json("https://api.adviceslip.com/advice", headers={"Accept": "application/json"})
+    return {'text': data['slip']['advice']}
+
+geekjoke_pool = ContentPool("geekjoke", fetch_geekjoke)
+dadjoke_pool = ContentPool("dadjoke", fetch_dadjoke)
+dog_pool = ContentPool("dog", fetch_dog)
+cat_pool = ContentPool("cat", fetch_cat)
+affirmation_pool = ContentPool("affirmation", fetch_affirmation)
+advice_pool = ContentPool("advice", fetch_advice)
+
+async def send_pooled_media(message, item):
+    """Send a pooled media item, from its Telegram file_id once it has been sent before."""
+    media = item.get('file_id') or item['url']
+    kind = media_kind(item['url'])
+    if kind == "video":
+        sent = await message.reply_video(media, supports_streaming=True)
+    elif kind == "photo":
+        sent = await message.reply_photo(media)
+    else:
+        sent = await message.reply_animation(media)
+    sent_media = getattr(sent, kind, None)
+    if sent_media:
+        item['file_id'] = sent_media.file_id
+
 # ---------------------------
 # Geekjoke Command Handler
 # ---------------------------
@@ -79,17 +135,11 @@ async def geekjoke_command(client: Client, message: types.Message):
     await save_usage(chat, "geekjoke")
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("https://geek-jokes.sameerkumar.website/api?format=json") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    joke = data.get('joke', '')
-                    if joke:
-                        await message.reply(joke)
-                    else:
-                        await message.reply("Couldn't fetch a joke. Try again later.")
-                else:
-                    await message.reply(f"API Error: Status {response.status}")
+        item = await geekjoke_pool.get()
+        if item:
+            await message.reply(item['text'])
+        else:
+            await message.reply("Couldn't fetch a joke. Try again later.")
     except Exception as e:
         await message.reply(f"Error fetching joke: {str(e)}")
 
@@ -101,17 +151,11 @@ async def dadjoke_command(client: Client, message: types.Message):
     await save_usage(chat, "dadjoke")
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("https://icanhazdadjoke.com/slack") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if 'attachments' in data and data['attachments']:
-                        joke = data['attachments'][0]['text']
-                        await message.reply(joke)
-                    else:
-                        await message.reply("Couldn't fetch a joke. Try again later.")
-                else:
-                    await message.reply(f"API Error: Status {response.status}")
+        item = await dadjoke_pool.get()
+        if item:
+            await message.reply(item['text'])
+        else:
+            await message.reply("Couldn't fetch a joke. Try again later.")
     except Exception as e:
         await message.reply(f"Error fetching joke: {str(e)}")
 
@@ -123,26 +167,11 @@ async def dog_command(client: Client, message: types.Message):
     await save_usage(chat, "dog")
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("https://random.dog/woof.json") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    dog_url = data.get('url', '')
-                    
-                    if not dog_url:
-                        await message.reply("Couldn't fetch a dog image. Try again later.")
-                        return
-                        
-                    if dog_url.lower().endswith((".mp4", ".webm")):
-                        await message.reply_video(dog_url, supports_streaming=True)
-                    elif dog_url.lower().endswith((".jpg", ".jpeg", ".png")):
-                        await message.reply_photo(dog_url)
-                    elif dog_url.lower().endswith(".gif"):
-                        await message.reply_animation(dog_url)
-                    else:
-                        await message.reply(f"Unsupported file type: {dog_url}")
-                else:
-                    await message.reply(f"API Error: Status {response.status}")
+        item = await dog_pool.get()
+        if not item:
+            await message.reply("Couldn't fetch a dog image. Try again later.")
+            return
+        await send_pooled_media(message, item)
     except Exception as e:
         await message.reply(f"Error fetching dog image: {str(e)}")
 
@@ -154,28 +183,13 @@ async def cat_command(client: Client, message: types.Message):
     await save_usage(chat, "cat")
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("https://api.thecatapi.com/v1/images/search") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    cat_url = data[0].get('url', '')
-
-                    if not cat_url:
-                        await message.reply("Couldn't fetch a cat image. Try again later.")
-                        return
-
-                    if cat_url.lower().endswith((".mp4", ".webm")):
-                        await message.reply_video(cat_url, supports_streaming=True)
-                    elif cat_url.lower().endswith((".jpg", ".jpeg", ".png")):
-                        await message.reply_photo(cat_url)
-                    elif cat_url.lower().endswith(".gif"):
-                        await message.reply_animation(cat_url)
-                    else:
-                        await message.reply(f"Unsupported file type: {cat_url}")
-                else:
-                    await message.reply(f"API Error: Status {response.status}")
+        item = await cat_pool.get()
+        if not item:
+            await message.reply("Couldn't fetch a cat image. Try again later.")
+            return
+        await send_pooled_media(message, item)
     except Exception as e:
-        await message.reply(f"Error fetching cat image: {str(e)}\nURL: {cat_url}")
+        await message.reply(f"Error fetching cat image: {str(e)}")
 
 # ---------------------------
 # Affirmation Command Handler
@@ -185,17 +199,11 @@ async def affirmation_command(client: Client, message: types.Message):
     await save_usage(chat, "affirmation")
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("https://www.affirmations.dev/") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    affirmation_text = data.get('affirmation', '')
-                    if affirmation_text:
-                        await message.reply(affirmation_text)
-                    else:
-                        await message.reply("Couldn't fetch an affirmation. Try again later.")
-                else:
-                    await message.reply(f"API Error: Status {response.status}")
+        item = await affirmation_pool.get()
+        if item:
+            await message.reply(item['text'])
+        else:
+            await message.reply("Couldn't fetch an affirmation. Try again later.")
     except Exception as e:
         await message.reply(f"Error fetching affirmation: {str(e)}")
 
@@ -207,12 +215,8 @@ async def advice_command(client: Client, message: types.Message):
     await save_usage(chat, "advice")
     
     try:
-        headers = {"Accept": "application/json"}
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get("https://api.adviceslip.com/advice") as response:
-                data = await response.json(content_type="text/html")
-                advice_text = data['slip']['advice']
-                await message.reply(advice_text)
+        item = await advice_pool.get()
+        await message.reply(item['text'])
     except Exception as e:
         await message.reply(f"Error fetching advice: {str(e)}")
 
@@ -1,21 +1,21 @@
 import aiohttp
-import urllib.parse
 import logging
 import re
 from pyrogram import Client, types
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from utils.usage import save_usage
+from utils.http import get_session
 from config import HADITH_API_BASE
-
-# Store hadith search results for pagination
-hadith_cache = {}
+from .hadith_search import (
+    HadithAPIError, search_hadith, get_search, load_results, prefetch_results, has_more, total_label
+)
 
 logger = logging.getLogger(__name__)
 
 
 async def hs_command(client: Client, message: types.Message):
     """
-    Search for hadiths using the Dorar API.
+    Search for hadiths in the local index, falling back to the Dorar API.
     Usage: /hs <search query>
     """
     chat = message.chat
@@ -49,36 +49,10 @@ async def hs_command(client: Client, message: types.Message):
     logger.info(f"Cleaned query: {search_query_cleaned}, grade filter: {grade_filter}")
 
     try:
-        # Build the API URL
-        params = {
-            "value": search_query_cleaned,
-            "removehtml": "false",
-            "specialist": "true",
-            "d[]": grade_filter
-        }
-        
-        url = f"{HADITH_API_BASE}/v1/site/hadith/search?" + urllib.parse.urlencode(params)
-        
-        logger.info(f"Making API request to: {url}")
-        
-        # Make the API request
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                logger.info(f"API response status: {response.status}")
-                
-                if response.status != 200:
-                    logger.error(f"API returned error status: {response.status}")
-                    await status_msg.edit_text(
-                        f"حدث خطأ في الاتصال بالخادم: {response.status}\n"
-                        "يرجى المحاولة مرة أخرى لاحقاً."
-                    )
-                    return
-                
-                data = await response.json()
-                logger.info(f"API returned {len(data.get('data', []))} results")
+        cache_key, search = await search_hadith(search_query_cleaned, grade_filter)
         
         # Check if we got results
-        if not data.get("data") or len(data["data"]) == 0:
+        if not search['results']:
             logger.warning("No hadiths found for query")
             await status_msg.edit_text(
                 "لم يتم العثور على أحاديث لهذا البحث.\n"
@@ -86,20 +60,6 @@ async def hs_command(client: Client, message: types.Message):
             )
             return
         
-        # Take the first 15 results
-        results = data["data"][:15]
-        
-        logger.info(f"Processing {len(results)} results")
-        
-        # Store results in cache for pagination
-        cache_key = f"hadith_{message.from_user.id}_{hash(search_query)}"
-        hadith_cache[cache_key] = {
-            'query': search_query_cleaned,
-            'results': results,
-            'grade_filter': grade_filter,
-            'total_results': len(results)
-        }
-        
         logger.info(f"Showing first hadith with cache_key: {cache_key}")
         
         # Show first hadith
@@ -107,6 +67,12 @@ async def hs_command(client: Client, message: types.Message):
         
         logger.info("Hadith search completed successfully")
         
+    except HadithAPIError as e:
+        logger.error(f"API returned error status: {e.status}")
+        await status_msg.edit_text(
+            f"حدث خطأ في الاتصال بالخادم: {e.status}\n"
+            "يرجى المحاولة مرة أخرى لاحقاً."
+        )
     except aiohttp.ClientError as e:
         logger.error(f"Network error in hadith search: {str(e)}", exc_info=True)
         await status_msg.edit_text(
@@ -125,23 +91,25 @@ async def show_hadith_page(message, cache_key, index):
     """Display a single hadith with navigation buttons."""
     logger.info(f"show_hadith_page called with cache_key: {cache_key}, index: {index}")
     
-    if cache_key not in hadith_cache:
+    data = get_search(cache_key)
+    if data is None:
         logger.error(f"Cache key not found: {cache_key}")
         await message.edit_text("انتهت صلاحية نتائج البحث. يرجى البحث مرة أخرى باستخدام /hs")
         return
     
-    data = hadith_cache[cache_key]
     results = data['results']
     query = data['query']
-    total = data['total_results']
+    total = total_label(data)
     
     logger.info(f"Displaying hadith {index+1} of {total}")
     
-    if index < 0 or index >= total:
+    if index < 0 or index >= len(results):
         logger.warning(f"Invalid index: {index} (total: {total})")
         return
     
     hadith = results[index]
+    # Have the next page ready before the user reaches the end of this one
+    prefetch_results(data, index)
     
     # Format the hadith message
     text = f"**البحث:** `{query}`\n"
@@ -187,7 +155,7 @@ async def show_hadith_page(message, cache_key, index):
     nav_row = []
     if index > 0:
         nav_row.append(InlineKeyboardButton("السابق", callback_data=f"hadith_nav_{cache_key}_{index-1}"))
-    if index < total - 1:
+    if has_more(data, index):
         nav_row.append(InlineKeyboardButton("التالي", callback_data=f"hadith_nav_{cache_key}_{index+1}"))
     
     if nav_row:
@@ -294,22 +262,22 @@ async def handle_hadith_callback(client: Client, callback_query):
             try:
                 # Fetch sharh from API
                 url = f"{HADITH_API_BASE}/v1/site/sharh/{sharh_id}"
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                        if response.status == 200:
-                            sharh_data = await response.json()
-                            sharh_text = sharh_data.get('data', {}).get('sharhMetadata', {}).get('sharh', 'الشرح غير متوفر.')
+                session = get_session()
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    if response.status == 200:
+                        sharh_data = await response.json()
+                        sharh_text = sharh_data.get('data', {}).get('sharhMetadata', {}).get('sharh', 'الشرح غير متوفر.')
                             
-                            # Send sharh as a new message
-                            sharh_msg = f"**شرح الحديث:**\n\n{sharh_text}"
+                        # Send sharh as a new message
+                        sharh_msg = f"**شرح الحديث:**\n\n{sharh_text}"
                             
-                            # Truncate if too long
-                            if len(sharh_msg) > 4000:
-                                sharh_msg = sharh_msg[:4000] + "\n\n*[تم اختصار الشرح بسبب الطول]*"
+                        # Truncate if too long
+                        if len(sharh_msg) > 4000:
+                            sharh_msg = sharh_msg[:4000] + "\n\n*[تم اختصار الشرح بسبب الطول]*"
                             
-                            await callback_query.message.reply(sharh_msg)
-                        else:
-                            await callback_query.answer("فشل في جلب الشرح.", show_alert=True)
+                        await callback_query.message.reply(sharh_msg)
+                    else:
+                        await callback_query.answer("فشل في جلب الشرح.", show_alert=True)
             except Exception as e:
                 await callback_query.answer(f"خطأ: {str(e)}", show_alert=True)
         return
@@ -324,10 +292,26 @@ async def handle_hadith_callback(client: Client, callback_query):
             cache_key = parts[0]
             try:
                 index = int(parts[1])
-                await show_hadith_page(callback_query.message, cache_key, index)
-                await callback_query.answer()
             except ValueError:
                 await callback_query.answer("رقم الصفحة غير صحيح.", show_alert=True)
+                return
+            search = get_search(cache_key)
+            if search is not None:
+                try:
+                    # Results past the loaded pages are fetched as the user reaches them
+                    await load_results(search, index)
+                except Exception as e:
+                    logger.error(f"Error loading more hadith results: {str(e)}", exc_info=True)
+                    await callback_query.answer("تعذر جلب المزيد من النتائج. حاول مرة أخرى.", show_alert=True)
+                    return
+                if index >= len(search['results']) > 0:
+                    # The last page was full and the one after it empty: show the last
+                    # result again, this time without the "next" button
+                    await show_hadith_page(callback_query.message, cache_key, len(search['results']) - 1)
+                    await callback_query.answer("لا توجد نتائج أخرى.")
+                    return
+            await show_hadith_page(callback_query.message, cache_key, index)
+            await callback_query.answer()
         else:
             await callback_query.answer("بيانات غير صحيحة.", show_alert=True)
     else:
@@ -0,0 +1,136 @@
+import time
+import asyncio
+import hashlib
+import logging
+import aiohttp
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from utils.http import get_session
+from utils.hadith_index import normalize_arabic, search_local
+from config import HADITH_API_BASE
+
+logger = logging.getLogger(__name__)
+
+HADITH_PAGE_SIZE = 15  # Results per page of the Dorar search API
+HADITH_CACHE_TTL = 6 * 3600  # Seconds a search is answered from the cache
+HADITH_CACHE_SIZE = 200  # Searches kept in memory
+HADITH_PREFETCH_MARGIN = 3  # Start loading the next page this many results before the end
+HADITH_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+# Search key -> {'query', 'grade_filter', 'results', 'next_page', 'fetched_at', 'lock'},
+# least recently used first
+search_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# First pages currently being fetched, shared by everyone searching the same thing
+in_flight: Dict[str, asyncio.Task] = {}
+
+class HadithAPIError(Exception):
+    """The hadith API answered with an error status."""
+    def __init__(self, status: int):
+        super().__init__(f"API Error: Status {status}")
+        self.status = status
+
+def search_key(query: str, grade_filter: str) -> str:
+    """A short key for a search, small enough to fit in callback data."""
+    normalized = f"{grade_filter}:{normalize_arabic(query)}"
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+async def _fetch_page(query: str, grade_filter: str, page: int) -> List[Dict[str, Any]]:
+    params = {
+        "value": query,
+        "page": str(page),
+        "removehtml": "false",
+        "specialist": "true",
+        "d[]": grade_filter
+    }
+    session = get_session()
+    async with session.get(f"{HADITH_API_BASE}/v1/site/hadith/search", params=params, timeout=HADITH_TIMEOUT) as response:
+        logger.info(f"Hadith API page {page} for '{query}': status {response.status}")
+        if response.status != 200:
+            raise HadithAPIError(response.status)
+        data = await response.json()
+    return data.get("data") or []
+
+def _remember(key: str, entry: Dict[str, Any]):
+    search_cache[key] = entry
+    search_cache.move_to_end(key)
+    while len(search_cache) > HADITH_CACHE_SIZE:
+        search_cache.popitem(last=False)
+
+def cache_results(key: str, query: str, grade_filter: str, results: List[Dict[str, Any]], next_page: Optional[int] = None) -> Dict[str, Any]:
+    """Store a search's results; next_page is None when there is nothing more to load."""
+    entry = {
+        'query': query,
+        'grade_filter': grade_filter,
+        'results': results,
+        'next_page': next_page,
+        'fetched_at': time.time(),
+        'lock': asyncio.Lock()
+    }
+    _remember(key, entry)
+    return entry
+
+async def _search(key: str, query: str, grade_filter: str) -> Dict[str, Any]:
+    try:
+        try:
+            local_results = await search_local(query, grade_filter)
+        except Exception as e:
+            logger.error(f"Error searching the local hadith index: {e}")
+            local_results = None
+        if local_results:
+            # The local index returns every match at once, there are no further pages
+            return cache_results(key, query, grade_filter, local_results)
+
+        results = await _fetch_page(query, grade_filter, 1)
+        next_page = 2 if len(results) >= HADITH_PAGE_SIZE else None
+        return cache_results(key, query, grade_filter, results, next_page)
+    finally:
+        in_flight.pop(key, None)
+
+async def search_hadith(query: str, grade_filter: str) -> Tuple[str, Dict[str, Any]]:
+    """Return the key and cached entry of a search. On a miss the local index is
+    searched first, then the first page is fetched from the API.
+
+    Queries that only differ in diacritics, hamza forms or spacing share an entry.
+    """
+    key = search_key(query, grade_filter)
+    entry = search_cache.get(key)
+    if entry and time.time() - entry['fetched_at'] < HADITH_CACHE_TTL:
+        search_cache.move_to_end(key)
+        return key, entry
+
+    task = in_flight.get(key)
+    if task is None:
+        task = in_flight[key] = asyncio.create_task(_search(key, query, grade_filter))
+    return key, await asyncio.shield(task)
+
+def get_search(key: str) -> Optional[Dict[str, Any]]:
+    """The entry of an earlier search, or None once it was evicted."""
+    entry = search_cache.get(key)
+    if entry:
+        search_cache.move_to_end(key)
+    return entry
+
+async def load_results(entry: Dict[str, Any], index: int):
+    """Fetch further pages until the result at index is loaded or there are no more."""
+    async with entry['lock']:
+        while index >= len(entry['results']) and entry['next_page'] is not None:
+            page = entry['next_page']
+            results = await _fetch_page(entry['query'], entry['grade_filter'], page)
+            entry['results'].extend(results)
+            entry['next_page'] = page + 1 if len(results) >= HADITH_PAGE_SIZE else None
+
+def prefetch_results(entry: Dict[str, Any], index: int):
+    """Load the next page in the background when index is close to the end of the loaded ones."""
+    if (entry['next_page'] is not None and not entry['lock'].locked()
+            and index >= len(entry['results']) - HADITH_PREFETCH_MARGIN):
+        task = asyncio.create_task(load_results(entry, len(entry['results'])))
+        # Nobody waits on a prefetch, a failure is retried when the user gets there
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+def has_more(entry: Dict[str, Any], index: int) -> bool:
+    return index < len(entry['results']) - 1 or entry['next_page'] is not None
+
+def total_label(entry: Dict[str, Any]) -> str:
+    """The result count, marked with + while more pages can still be loaded."""
+    total = len(entry['results'])
+    return f"{total}+" if entry['next_page'] is not None else str(total)
@@ -1,14 +1,46 @@
+import time
+import asyncio
 import aiohttp
 import urllib.parse
-from bs4 import BeautifulSoup
+from collections import OrderedDict
 from pyrogram import Client, types
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from utils.usage import save_usage
+from utils.http import get_session
+from utils.search_parsers import parse_bing, parse_duckduckgo
+from .search_engines import hedged_search
+
+SEARCH_RESULTS_TTL = 600  # Seconds a query's results are reused
+SEARCH_RESULTS_CACHE_SIZE = 200
 
 search_results_storage = {}
 
 search_cache = {}
 
+# Normalized query -> (fetched_at, engine, results), least recently used first
+query_cache = OrderedDict()
+
+def normalize_query(query):
+    """Case and whitespace differences don't change the results."""
+    return " ".join(query.lower().split())
+
+async def cached_search(query):
+    """Search with the hedged engines, reusing results of the same query for a while."""
+    key = normalize_query(query)
+    cached = query_cache.get(key)
+    if cached and time.time() - cached[0] < SEARCH_RESULTS_TTL:
+        query_cache.move_to_end(key)
+        return cached[1], cached[2]
+
+    # DuckDuckGo first, Bing raced against it when DuckDuckGo is slow or failing
+    search_engine, results = await hedged_search(query, SEARCH_ENGINES)
+    if results:
+        query_cache[key] = (time.time(), search_engine, results)
+        query_cache.move_to_end(key)
+        while len(query_cache) > SEARCH_RESULTS_CACHE_SIZE:
+            query_cache.popitem(last=False)
+    return search_engine, results
+
 # ---------------------------
 # Search command
 # ---------------------------
@@ -24,29 +56,11 @@ async def search_command(client: Client, message: types.Message):
     
     status_msg = await message.reply("🔍 Searching...")
 
-    search_engine = None
-    all_results = []
+    search_engine, all_results = await cached_search(search_query)
     
-    # Try DuckDuckGo first
-    try:
-        all_results = await search_duckduckgo(search_query)
-        if all_results:
-            search_engine = "DuckDuckGo"
-        else:
-            raise Exception("No results from DuckDuckGo")
-    except Exception as e:
-        print(f"DuckDuckGo search failed: {e}")
-        # Fallback to Bing search
-        try:
-            all_results = await search_bing(search_query)
-            if all_results:
-                search_engine = "Bing"
-            else:
-                raise Exception("No results from Bing")
-        except Exception as e:
-            print(f"Bing search failed: {e}")
-            await status_msg.edit_text("❌ Search service temporarily unavailable. Please try again later.")
-            return
+    if search_engine is None:
+        await status_msg.edit_text("❌ Search service temporarily unavailable. Please try again later.")
+        return
     
     if not all_results:
         await status_msg.edit_text("❌ No results found for your query.")
@@ -140,116 +154,25 @@ async def handle_search_callback(client: Client, callback_query):
     elif data == "search_info":
         await callback_query.answer("Use Previous/Next buttons to navigate", show_alert=False)
 
+SEARCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+
+async def _fetch_results_page(url):
+    session = get_session()
+    async with session.get(url, headers=SEARCH_HEADERS, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+        if resp.status != 200:
+            raise ValueError(f"Search engine returned status {resp.status}")
+        return await resp.text()
+
 async def search_duckduckgo(query):
-    url = f"https://html.duckduckgo.com/html/?q={urllib.parse.quote_plus(query)}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    }
-    
-    async with aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=15)) as session:
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                return []
-            html = await resp.text()
-    
-    soup = BeautifulSoup(html, "html.parser")
-    results = []
-    
-    # Multiple selector strategies for DuckDuckGo
-    selectors = [
-        ".result",
-        ".web-result",
-        "[class*='result']",
-        ".links_main"
-    ]
-    
-    search_results = []
-    for selector in selectors:
-        search_results = soup.select(selector)
-        if search_results:
-            break
-    
-    if not search_results:
-        # Try finding any links with titles
-        search_results = soup.find_all("a", href=True)
-        search_results = [a for a in search_results if a.get_text(strip=True) and len(a.get_text(strip=True)) > 10]
-    
-    for result in search_results[:15]:  # Get more results for pagination
-        title = None
-        link = None
-        snippet = "No description available"
-        
-        if result.name == "a":
-            title = result.get_text(strip=True)
-            link = result.get("href", "")
-        else:
-            # Try to find title and link within result
-            title_elem = result.select_one("a[href]")
-            if title_elem:
-                title = title_elem.get_text(strip=True)
-                link = title_elem.get("href", "")
-            
-            # Try to find snippet
-            snippet_selectors = [".result__snippet", ".snippet", "[class*='snippet']"]
-            for sel in snippet_selectors:
-                snippet_elem = result.select_one(sel)
-                if snippet_elem:
-                    snippet = snippet_elem.get_text(strip=True)
-                    break
-        
-        # Clean up link
-        if link:
-            if link.startswith("/l/?uddg="):
-                try:
-                    parsed_url = urllib.parse.parse_qs(urllib.parse.urlparse(link).query)
-                    if 'uddg' in parsed_url:
-                        link = urllib.parse.unquote(parsed_url['uddg'][0])
-                except:
-                    continue
-            elif link.startswith("//"):
-                link = "https:" + link
-            elif not link.startswith("http"):
-                continue
-        
-        # Validate and add result
-        if title and link and len(title) > 3:
-            if len(snippet) > 150:
-                snippet = snippet[:150] + "..."
-            results.append(f"🔹 [{title}]({link})\n_{snippet}_\n")
-    
-    return results
+    html = await _fetch_results_page(f"https://html.duckduckgo.com/html/?q={urllib.parse.quote_plus(query)}")
+    # Parsing a full result page takes long enough to hold up other chats
+    return await asyncio.to_thread(parse_duckduckgo, html)
 
 async def search_bing(query):
-    url = f"https://www.bing.com/search?q={urllib.parse.quote_plus(query)}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    }
-    
-    async with aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=15)) as session:
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                return []
-            html = await resp.text()
-    
-    soup = BeautifulSoup(html, "html.parser")
-    results = []
-    
-    # Bing selectors
-    search_results = soup.select(".b_algo")
-    
-    for result in search_results[:15]:  # Get more results for pagination
-        title_elem = result.select_one("h2 a")
-        snippet_elem = result.select_one(".b_caption p") or result.select_one(".b_snippet")
-        
-        if title_elem:
-            title = title_elem.get_text(strip=True)
-            link = title_elem.get("href", "")
-            snippet = snippet_elem.get_text(strip=True) if snippet_elem else "No description available"
-            
-            if len(snippet) > 150:
-                snippet = snippet[:150] + "..."
-            
-            if title and link and link.startswith("http"):
-                results.append(f"🔹 [{title}]({link})\n_{snippet}_\n")
-    
-    return results
\ No newline at end of file
+    html = await _fetch_results_page(f"https://www.bing.com/search?q={urllib.parse.quote_plus(query)}")
+    return await asyncio.to_thread(parse_bing, html)
+
+# Engines in order of preference
+SEARCH_ENGINES = (("DuckDuckGo", search_duckduckgo), ("Bing", search_bing))
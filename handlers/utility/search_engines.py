@@ -0,0 +1,142 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEDGE_DELAY = 1.5  # Seconds to wait for an engine before also asking the next one
+HEDGE_MIN_DELAY = 0.3
+HEDGE_LATENCY_SAMPLES = 10  # Successful requests needed before the delay follows measured latency
+LATENCY_WINDOW = 100  # Latencies kept per engine
+CIRCUIT_FAILURES = 3  # Consecutive failures that take an engine out of rotation
+CIRCUIT_COOLDOWN = 120  # Seconds before a broken engine is tried again
+
+SearchFunction = Callable[[str], Awaitable[List[str]]]
+
+class EngineHealth:
+    """Latency and failure record of one search engine, with a circuit breaker.
+
+    After CIRCUIT_FAILURES consecutive failures the engine is skipped for
+    CIRCUIT_COOLDOWN seconds, then tried again; one success closes the circuit.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def record_latency(self, latency: float):
+        self.latencies.append(latency)
+
+    def record_success(self, latency: float):
+        self.record_latency(latency)
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self, error: BaseException):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= CIRCUIT_FAILURES:
+            self.open_until = time.monotonic() + CIRCUIT_COOLDOWN
+            logger.warning(
+                f"{self.name} failed {self.consecutive_failures} times in a row, "
+                f"skipping it for {CIRCUIT_COOLDOWN}s: {error}"
+            )
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        """How long to wait for this engine before racing the next one.
+
+        An engine that just failed is raced at once; otherwise its usual (p90)
+        latency is waited for, within HEDGE_MIN_DELAY and HEDGE_DELAY.
+        """
+        if self.consecutive_failures:
+            return 0
+        if len(self.latencies) < HEDGE_LATENCY_SAMPLES:
+            return HEDGE_DELAY
+        return min(HEDGE_DELAY, max(HEDGE_MIN_DELAY, self.percentile(0.9)))
+
+engine_health: Dict[str, EngineHealth] = {}
+
+def get_engine_health(name: str) -> EngineHealth:
+    health = engine_health.get(name)
+    if health is None:
+        health = engine_health[name] = EngineHealth(name)
+    return health
+
+async def _timed_search(name: str, search: SearchFunction, query: str) -> Optional[List[str]]:
+    health = get_engine_health(name)
+    started = time.monotonic()
+    try:
+        results = await search(query)
+    except asyncio.CancelledError:
+        # It lost the race: it would have taken at least this long, and leaving it out
+        # would make the engine look only as slow as the races it wins
+        health.record_latency(time.monotonic() - started)
+        raise
+    except Exception as e:
+        logger.warning(f"{name} search failed after {time.monotonic() - started:.2f}s: {e}")
+        health.record_failure(e)
+        return None
+    if not results:
+        # A page without results is usually a CAPTCHA or a layout we can't parse
+        health.record_failure(ValueError("the result page had no results"))
+        return []
+    health.record_success(time.monotonic() - started)
+    return results
+
+async def hedged_search(query: str, engines: Sequence[Tuple[str, SearchFunction]]) -> Tuple[Optional[str], List[str]]:
+    """Ask the engines in order, starting the next one whenever the running ones
+    are slower than the hedge delay or fail, and return the first non-empty results.
+
+    Returns (engine name, results). When nothing was found the name is that of an
+    engine that answered with no results, or None if every engine failed.
+    Engines whose circuit is open are skipped unless every engine is broken.
+    """
+    waiting = [engine for engine in engines if get_engine_health(engine[0]).available()] or list(engines)
+    running: Dict[asyncio.Task, str] = {}
+    answered = None
+
+    def start_next() -> float:
+        name, search = waiting.pop(0)
+        running[asyncio.create_task(_timed_search(name, search, query))] = name
+        return get_engine_health(name).hedge_delay()
+
+    delay = start_next()
+    try:
+        while running:
+            done, _ = await asyncio.wait(
+                running, timeout=delay if waiting else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                # Nothing back within the hedge delay, race the next engine
+                delay = start_next()
+                continue
+            for task in done:
+                name = running.pop(task)
+                results = task.result()
+                if results:
+                    return name, results
+                if results is not None:
+                    answered = name
+            # The finished engines had nothing, don't wait out the delay for the next one
+            if waiting:
+                delay = start_next()
+        return answered, []
+    finally:
+        # The slower engines lost the race
+        for task in running:
+            task.cancel()
@@ -0,0 +1,247 @@
+import os
+import asyncio
+import logging
+import yt_dlp
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from .constants import (
+    MAX_FILESIZE, BATCH_MAX_ITEMS, BATCH_WORKERS, BATCH_QUEUE_SIZE, BATCH_MAX_HEIGHT,
+    active_downloads, download_cancellations, download_locks, disk_reservations
+)
+from .format_utils import add_cookies_to_opts, add_download_tuning_opts
+from .file_utils import get_user_downloads_dir, safe_delete, format_bytes, delete_matching
+from .download_manager import download_with_retry
+from .upload_manager import send_media_file
+from .transcode import generate_thumbnail
+from .progress_service import progress_service
+from .disk_quota import check_admission, wait_for_space, reserve_space, release_space
+
+logger = logging.getLogger(__name__)
+
+def is_playlist_url(url: str) -> bool:
+    """Playlist pages, but not a single video opened from inside a playlist."""
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    return parsed.path.rstrip('/').endswith('/playlist') or ('list' in query and 'v' not in query)
+
+def _open_playlist(url: str):
+    """Start a flat, lazy playlist extraction. Returns the YoutubeDL and an entry iterator."""
+    ydl = yt_dlp.YoutubeDL(add_cookies_to_opts({
+        'quiet': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    }))
+    info = ydl.extract_info(url, download=False, process=False)
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        return ydl, iter([info])
+    return ydl, iter(info.get('entries') or [])
+
+async def iter_batch_items(urls: List[str]) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """Yield (url, title) for every requested video, pulling playlist entries one at a time."""
+    for url in urls:
+        if not is_playlist_url(url):
+            yield url, None
+            continue
+
+        ydl, entries = await asyncio.to_thread(_open_playlist, url)
+        try:
+            while True:
+                entry = await asyncio.to_thread(next, entries, None)
+                if entry is None:
+                    break
+                entry_url = entry.get('webpage_url') or entry.get('url')
+                if entry_url:
+                    yield entry_url, entry.get('title')
+        finally:
+            ydl.close()
+
+class BatchStatus:
+    """Aggregated state of a batch, rendered into one status message."""
+    def __init__(self, client, chat_id, message_id, reply_markup):
+        self.client = client
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.reply_markup = reply_markup
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.extracting = True
+        self.error = None  # Why extraction stopped early, if it did
+        self.running = {}  # worker number -> {'title', 'bytes', 'total', 'stage'}
+
+    def render(self) -> str:
+        total = "" if self.extracting else f"/{self.queued}"
+        lines = [f"📦 Batch download: {self.sent}{total} sent, {self.failed} failed"]
+        for item in self.running.values():
+            if item['stage'] == 'uploading':
+                lines.append(f"⬆️ {item['title']} - uploading")
+            elif item['stage'] == 'waiting':
+                lines.append(f"⏳ {item['title']} - waiting for disk space")
+            elif item['total']:
+                lines.append(f"⬇️ {item['title']} - {item['bytes'] / item['total'] * 100:.0f}%")
+            else:
+                lines.append(f"⬇️ {item['title']} - {format_bytes(item['bytes'])}")
+        waiting = self.queued - self.sent - self.failed - len(self.running)
+        if waiting > 0 or self.extracting:
+            lines.append(f"⏳ Waiting: {max(waiting, 0)}{'+' if self.extracting else ''}")
+        return "\n".join(lines)
+
+    def report(self):
+        progress_service.submit(self.client, self.chat_id, self.message_id, self.render(), self.reply_markup)
+
+    async def finish(self, text: str):
+        await progress_service.send_now(self.client, self.chat_id, self.message_id, f"{text}\n\n{self.render()}")
+
+def _batch_opts(outtmpl: str, audio_only: bool, progress_hook) -> Dict:
+    """yt-dlp options for one batch item: a compatible MP4 up to BATCH_MAX_HEIGHT, or m4a audio."""
+    if audio_only:
+        format_selector = 'bestaudio[ext=m4a]/bestaudio'
+    else:
+        height = BATCH_MAX_HEIGHT
+        format_selector = (
+            f'bestvideo[height<={height}][vcodec^=avc1]+bestaudio[ext=m4a]/'
+            f'best[height<={height}][ext=mp4]/best[height<={height}]'
+        )
+    return add_cookies_to_opts(add_download_tuning_opts({
+        'format': format_selector,
+        'merge_output_format': 'mp4',
+        'outtmpl': outtmpl,
+        'max_filesize': MAX_FILESIZE,
+        'continuedl': True,
+        'noplaylist': True,
+        'progress_hooks': [progress_hook],
+        'quiet': True,
+    }))
+
+def _expected_size(info: Dict) -> int:
+    """Bytes the formats yt-dlp selected for an item will take on disk."""
+    formats = info.get('requested_formats') or [info]
+    return sum(fmt.get('filesize') or fmt.get('filesize_approx') or 0 for fmt in formats)
+
+async def run_batch(client, chat_id, message_id, reply_to, user_id, urls: List[str], audio_only: bool = False):
+    """Download and upload every item of a playlist or URL list through a bounded pipeline.
+
+    One producer extracts items lazily into a small queue and BATCH_WORKERS
+    consumers download and upload them, so at most a few items are on disk at once.
+    """
+    cancel_button = InlineKeyboardMarkup([
+        [InlineKeyboardButton("❌ Cancel Batch", callback_data=f"cancel_{user_id}")]
+    ])
+    status = BatchStatus(client, chat_id, message_id, cancel_button)
+    queue = asyncio.Queue(maxsize=BATCH_QUEUE_SIZE)
+    user_downloads_dir = await get_user_downloads_dir(user_id)
+    loop = asyncio.get_running_loop()
+
+    async def producer():
+        try:
+            async for url, title in iter_batch_items(urls):
+                if user_id in download_cancellations or status.queued >= BATCH_MAX_ITEMS:
+                    break
+                status.queued += 1
+                status.report()
+                await queue.put((url, title))
+        except Exception as e:
+            logger.error(f"Batch extraction failed: {e}")
+            status.error = str(e)
+        finally:
+            status.extracting = False
+            status.report()
+            for _ in range(BATCH_WORKERS):
+                await queue.put(None)
+
+    async def consumer(worker):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            url, title = item
+            if user_id in download_cancellations:
+                continue
+            state = {'title': title or url, 'bytes': 0, 'total': 0, 'stage': 'downloading'}
+            status.running[worker] = state
+
+            def progress_hook(d):
+                if user_id in download_cancellations:
+                    raise Exception("DOWNLOAD_CANCELLED_BY_USER")
+                if d['status'] == 'downloading':
+                    state['bytes'] = d.get('downloaded_bytes', 0)
+                    state['total'] = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
+                    loop.call_soon_threadsafe(status.report)
+
+            file_path = thumb = None
+            reserved = 0
+            try:
+                outtmpl = os.path.join(user_downloads_dir, f"batch.{worker}.%(id)s.%(ext)s")
+                with yt_dlp.YoutubeDL(_batch_opts(outtmpl, audio_only, progress_hook)) as ydl:
+                    # Resolve the formats first so the item can be admitted like a single download
+                    info = await asyncio.to_thread(ydl.extract_info, url, download=False)
+                    expected_size = _expected_size(info)
+                    admitted, reason = await check_admission(user_id, expected_size)
+                    if not admitted and disk_reservations:
+                        state['stage'] = 'waiting'
+                        status.report()
+                        admitted, reason = await wait_for_space(user_id, expected_size)
+                    if not admitted:
+                        raise ValueError(f"Can't start this download: {reason}")
+                    reserve_space(user_id, expected_size)
+                    reserved = expected_size
+                    state['stage'] = 'downloading'
+                    info = await download_with_retry(ydl, info)
+                downloads = info.get('requested_downloads') or []
+                file_path = downloads[0]['filepath'] if downloads else ydl.prepare_filename(info)
+                state['title'] = info.get('title') or state['title']
+                state['stage'] = 'uploading'
+                status.report()
+
+                metadata = {
+                    'duration': int(info.get('duration') or 0),
+                    'width': info.get('width') or 0,
+                    'height': info.get('height') or 0,
+                }
+                if not audio_only:
+                    thumb = metadata['thumb'] = await generate_thumbnail(file_path, metadata['duration'])
+                await send_media_file(client, chat_id, file_path, info.get('title'), reply_to, metadata)
+                status.sent += 1
+            except Exception as e:
+                if "DOWNLOAD_CANCELLED_BY_USER" in str(e) or user_id in download_cancellations:
+                    await delete_matching(os.path.join(user_downloads_dir, f"batch.{worker}.*"))
+                else:
+                    logger.warning(f"Batch item {url} failed: {e}")
+                    status.failed += 1
+            finally:
+                release_space(user_id, reserved)
+                status.running.pop(worker, None)
+                status.report()
+                for path in (file_path, thumb):
+                    if path:
+                        await safe_delete(path)
+
+    if user_id not in download_locks:
+        download_locks[user_id] = asyncio.Lock()
+    
+    # Same rule as single downloads: one download or batch per user at a time
+    async with download_locks[user_id]:
+        if user_id in active_downloads:
+            await progress_service.send_now(
+                client, chat_id, message_id,
+                f"⚠️ You already have an active download in progress:\n\n{active_downloads[user_id]}\n\nPlease wait for it to complete before starting a new one."
+            )
+            return
+        active_downloads[user_id] = f"Batch download ({len(urls)} link(s))"
+        download_cancellations.pop(user_id, None)
+        status.report()
+        try:
+            await asyncio.gather(producer(), *(consumer(worker) for worker in range(BATCH_WORKERS)))
+            if user_id in download_cancellations:
+                await status.finish("❌ Batch cancelled.")
+            elif status.error and not status.sent:
+                await status.finish(f"❌ Batch failed: {status.error}")
+            elif status.error:
+                await status.finish(f"⚠️ Batch stopped early, some links couldn't be read: {status.error}")
+            else:
+                await status.finish("✅ Batch complete.")
+        finally:
+            active_downloads.pop(user_id, None)
+            download_cancellations.pop(user_id, None)
+            release_space(user_id)
@@ -7,12 +7,42 @@ DOWNLOADS_DIR = 'downloads'  # Base downloads directory
 MAX_RETRIES = 3  # Maximum number of retry attempts
 INITIAL_RETRY_DELAY = 2  # Initial delay between retries in seconds
 MAX_RETRY_DELAY = 10  # Maximum delay between retries in seconds
+INFO_CACHE_TTL = 600  # Seconds an extracted info dict is reused (format URLs expire after a few hours)
+INFO_CACHE_SIZE = 200  # Most info dicts kept in memory
+DOWNLOAD_CONNECTIONS = 4  # Concurrent connections per download (fragments or external downloader)
+HTTP_CHUNK_SIZE = 10 * 1024 * 1024  # Ranged request size for non-fragmented formats
+EXTERNAL_DOWNLOADER = 'aria2c'  # Fetches plain HTTP formats with multiple connections when installed, None to disable
+UPLOAD_PART_SIZE = 512 * 1024  # Telegram big file part size (must divide 512 KB)
+STREAM_UPLOAD_WORKERS = 4  # Parts of a streamed upload in flight at once, as save_file does for big files
+STREAMING_PIPELINE_ENABLED = True  # Upload large videos while they are still downloading
+STREAMING_MIN_SIZE = 50 * 1024 * 1024  # Only pipeline videos at least this large
+MEMORY_AUDIO_MAX_SIZE = 25 * 1024 * 1024  # Audio up to this size is downloaded and converted in memory
+DOWNLOADS_QUOTA = 20 * 1024 * 1024 * 1024  # Total bytes allowed in the downloads directory
+USER_DOWNLOADS_QUOTA = 4 * 1024 * 1024 * 1024  # Bytes allowed per user directory
+MIN_FREE_DISK = 2 * 1024 * 1024 * 1024  # Free space to always leave on the disk
+STALE_PARTIAL_AGE = 6 * 3600  # Partial files untouched this long are abandoned
+OUTPUT_MAX_AGE = 24 * 3600  # Finished files left behind are deleted after this long
+JANITOR_INTERVAL = 600  # Seconds between background janitor sweeps
+SPACE_WAIT_TIMEOUT = 300  # Seconds a download may queue waiting for disk space
+BATCH_MAX_ITEMS = 50  # Most videos taken from one playlist or batch
+BATCH_WORKERS = 2  # Items downloaded and uploaded at the same time in a batch
+BATCH_QUEUE_SIZE = 2  # Items extracted ahead of the workers
+BATCH_MAX_HEIGHT = 720  # Video height used for batch downloads
+PROGRESS_MIN_INTERVAL = 3  # Minimum seconds between edits of one progress message
+PROGRESS_CHAT_EDITS_PER_MINUTE = 20  # Progress edits allowed per chat per minute
+PROGRESS_GLOBAL_EDITS_PER_SECOND = 10  # Progress edits allowed per second across all chats
+STATS_WINDOW = 3600  # Seconds of stage timings covered by /ytstats
+STATS_MAX_SPANS = 5000  # Most stage timings kept in memory
 
 # Track active downloads per user (make it a proper singleton with global scope)
 active_downloads = {}
 download_locks = {}  # Add locks per user to prevent race conditions
 # Track cancellation requests
 download_cancellations = {}  # user_id -> True if cancelled
+# Track shared in-flight jobs so identical requests can attach to them
+active_jobs = {}  # (normalized url, format) -> DownloadJob
+# Disk space promised to admitted downloads that haven't landed yet
+disk_reservations = {}  # user_id -> reserved bytes
 
 # Ensure downloads directory exists
 os.makedirs(DOWNLOADS_DIR, exist_ok=True)
@@ -0,0 +1,215 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+import aiofiles.os
+from typing import Dict, List, Any, Tuple
+from .constants import (
+    DOWNLOADS_DIR, DOWNLOADS_QUOTA, USER_DOWNLOADS_QUOTA, MIN_FREE_DISK,
+    STALE_PARTIAL_AGE, OUTPUT_MAX_AGE, JANITOR_INTERVAL, SPACE_WAIT_TIMEOUT,
+    active_downloads, disk_reservations
+)
+from .file_utils import format_bytes
+from .download_journal import get_pending_downloads
+
+logger = logging.getLogger(__name__)
+
+# Name fragments of files that are still being written by a download, merge or stream
+PARTIAL_MARKERS = ('.part', '.ytdl', '.stream.mp4', '.processing.mp4', '.video.', '.audio.', '.temp.')
+
+def _scan_downloads_sync() -> List[Dict[str, Any]]:
+    """Walk the downloads directory once and describe every file in it."""
+    entries = []
+    if not os.path.isdir(DOWNLOADS_DIR):
+        return entries
+    with os.scandir(DOWNLOADS_DIR) as user_dirs:
+        for user_dir in user_dirs:
+            if not user_dir.is_dir():
+                continue
+            with os.scandir(user_dir.path) as files:
+                for file in files:
+                    if not file.is_file():
+                        continue
+                    stat = file.stat()
+                    entries.append({
+                        'path': file.path,
+                        'user': user_dir.name,
+                        'size': stat.st_size,
+                        # Last use: uploads read the file, downloads write it
+                        'last_used': max(stat.st_atime, stat.st_mtime),
+                        'modified': stat.st_mtime,
+                        'partial': any(marker in file.name for marker in PARTIAL_MARKERS),
+                    })
+    return entries
+
+async def scan_downloads() -> List[Dict[str, Any]]:
+    """Scan the downloads directory in a worker thread."""
+    return await asyncio.to_thread(_scan_downloads_sync)
+
+async def get_free_disk() -> int:
+    """Return the free bytes on the disk holding the downloads directory."""
+    usage = await asyncio.to_thread(shutil.disk_usage, DOWNLOADS_DIR)
+    return usage.free
+
+def _usage_by_user(entries: List[Dict[str, Any]]) -> Dict[str, int]:
+    usage = {}
+    for entry in entries:
+        usage[entry['user']] = usage.get(entry['user'], 0) + entry['size']
+    return usage
+
+# Users with journaled downloads that a restart will resume
+journaled_users = set()
+
+def _is_protected(entry: Dict[str, Any]) -> bool:
+    """Files of users with a running or resumable download are never evicted."""
+    return entry['user'] in journaled_users or entry['user'] in {str(user_id) for user_id in active_downloads}
+
+async def _refresh_journaled_users():
+    try:
+        pending = await get_pending_downloads()
+    except Exception as e:
+        logger.warning(f"Could not read the download journal, protecting nothing extra: {e}")
+        return
+    journaled_users.clear()
+    journaled_users.update(str(entry['user_id']) for entry in pending if not entry['stale'])
+
+async def _evict(entries: List[Dict[str, Any]], bytes_needed: int) -> Tuple[int, int]:
+    """Delete least recently used files until bytes_needed are freed."""
+    freed = 0
+    deleted = 0
+    for entry in sorted(entries, key=lambda e: e['last_used']):
+        if freed >= bytes_needed:
+            break
+        if _is_protected(entry):
+            continue
+        try:
+            await aiofiles.os.remove(entry['path'])
+            entries.remove(entry)
+            freed += entry['size']
+            deleted += 1
+        except FileNotFoundError:
+            entries.remove(entry)
+        except Exception as e:
+            logger.warning(f"Failed to evict {entry['path']}: {e}")
+    return freed, deleted
+
+async def run_janitor(max_age: int = OUTPUT_MAX_AGE) -> Dict[str, int]:
+    """Sweep the downloads directory once.
+
+    Stale partials and old outputs are removed first, then files are evicted in
+    LRU order until every user and the whole directory are back under quota.
+    """
+    # Partial files the journal will resume must outlive STALE_PARTIAL_AGE
+    await _refresh_journaled_users()
+    entries = await scan_downloads()
+    now = time.time()
+    freed = 0
+    deleted = 0
+
+    for entry in list(entries):
+        if _is_protected(entry):
+            continue
+        age = now - entry['modified']
+        if (entry['partial'] and age > STALE_PARTIAL_AGE) or age > max_age:
+            try:
+                await aiofiles.os.remove(entry['path'])
+                freed += entry['size']
+                deleted += 1
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"Failed to delete {entry['path']}: {e}")
+                continue
+            entries.remove(entry)
+
+    # Per-user quotas
+    for user, used in _usage_by_user(entries).items():
+        if used > USER_DOWNLOADS_QUOTA:
+            user_entries = [entry for entry in entries if entry['user'] == user]
+            user_freed, user_deleted = await _evict(user_entries, used - USER_DOWNLOADS_QUOTA)
+            entries = [entry for entry in entries if entry['user'] != user] + user_entries
+            freed += user_freed
+            deleted += user_deleted
+
+    # Global quota and free disk space
+    used = sum(entry['size'] for entry in entries)
+    overflow = max(used - DOWNLOADS_QUOTA, MIN_FREE_DISK - await get_free_disk(), 0)
+    if overflow:
+        global_freed, global_deleted = await _evict(entries, overflow)
+        freed += global_freed
+        deleted += global_deleted
+
+    if deleted:
+        logger.info(f"Download janitor deleted {deleted} files ({format_bytes(freed)})")
+    return {'deleted': deleted, 'freed': freed}
+
+async def check_admission(user_id: int, expected_size: int = 0) -> Tuple[bool, str]:
+    """Check whether a download of expected_size fits the quotas, evicting if needed.
+
+    Returns (admitted, reason). Space that is only held by other running
+    downloads is reported as such so the caller can queue instead of refusing.
+    """
+    entries = await scan_downloads()
+    user_key = str(user_id)
+    user_used = sum(entry['size'] for entry in entries if entry['user'] == user_key)
+    user_needed = user_used + disk_reservations.get(user_id, 0) + expected_size - USER_DOWNLOADS_QUOTA
+    if user_needed > 0:
+        user_entries = [entry for entry in entries if entry['user'] == user_key]
+        freed, _ = await _evict(user_entries, user_needed)
+        if freed < user_needed:
+            return False, f"your download folder is over its {format_bytes(USER_DOWNLOADS_QUOTA)} quota"
+        entries = await scan_downloads()
+
+    reserved = sum(disk_reservations.values())
+    used = sum(entry['size'] for entry in entries)
+    free_disk = await get_free_disk()
+    needed = max(
+        used + reserved + expected_size - DOWNLOADS_QUOTA,
+        MIN_FREE_DISK + reserved + expected_size - free_disk,
+        0
+    )
+    if needed:
+        freed, _ = await _evict(entries, needed)
+        if freed < needed:
+            if reserved:
+                return False, "the bot is waiting for other downloads to free disk space"
+            return False, "the bot is out of disk space"
+    return True, ""
+
+def reserve_space(user_id: int, size: int) -> None:
+    """Hold disk space for an admitted download until it finishes."""
+    disk_reservations[user_id] = disk_reservations.get(user_id, 0) + (size or 0)
+
+def release_space(user_id: int, size: int = None) -> None:
+    """Release the disk space held for a user's download, or only size bytes of it."""
+    if size is None:
+        disk_reservations.pop(user_id, None)
+        return
+    remaining = disk_reservations.get(user_id, 0) - size
+    if remaining > 0:
+        disk_reservations[user_id] = remaining
+    else:
+        disk_reservations.pop(user_id, None)
+
+async def wait_for_space(user_id: int, expected_size: int, timeout: int = SPACE_WAIT_TIMEOUT) -> Tuple[bool, str]:
+    """Queue until a download fits, as long as other downloads are holding the space."""
+    deadline = time.time() + timeout
+    while True:
+        admitted, reason = await check_admission(user_id, expected_size)
+        if admitted or not disk_reservations or time.time() >= deadline:
+            return admitted, reason
+        await asyncio.sleep(5)
+
+async def download_janitor_task():
+    """Background task that keeps the downloads directory within its quotas."""
+    while True:
+        try:
+            await run_janitor()
+        except Exception as e:
+            logger.error(f"Download janitor failed: {e}")
+        await asyncio.sleep(JANITOR_INTERVAL)
+
+def start_download_janitor():
+    """Start the background download janitor task."""
+    asyncio.create_task(download_janitor_task())
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import aiosqlite
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DB = "db/yt_downloads.db"
+JOURNAL_MAX_AGE = 24 * 3600  # Entries older than this are abandoned instead of resumed
+
+async def init_journal_db():
+    """Create the download journal table if needed."""
+    os.makedirs('db', exist_ok=True)
+    async with aiosqlite.connect(JOURNAL_DB) as connection:
+        await connection.execute("""
+            CREATE TABLE IF NOT EXISTS download_journal (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT,
+                url TEXT,
+                format_id TEXT,
+                audio_format_id TEXT,
+                stream_type TEXT,
+                quality TEXT,
+                user_id INTEGER,
+                chat_id INTEGER,
+                message_id INTEGER,
+                reply_to INTEGER,
+                partial_paths TEXT DEFAULT '[]',
+                bytes_done INTEGER DEFAULT 0,
+                created_at REAL,
+                updated_at REAL
+            )
+        """)
+        await connection.commit()
+
+async def journal_start(kind: str, url: str, format_id: str, quality: str, user_id: int, chat_id: int,
+                        message_id: int, reply_to: Optional[int], stream_type: str = None,
+                        audio_format_id: str = None) -> str:
+    """Record a new download so it can be resumed after a restart. Returns its job id."""
+    await init_journal_db()
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    async with aiosqlite.connect(JOURNAL_DB) as connection:
+        await connection.execute(
+            """INSERT INTO download_journal
+               (job_id, kind, url, format_id, audio_format_id, stream_type, quality,
+                user_id, chat_id, message_id, reply_to, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (job_id, kind, url, format_id, audio_format_id, stream_type, quality,
+             user_id, chat_id, message_id, reply_to, now, now)
+        )
+        await connection.commit()
+    return job_id
+
+async def journal_progress(job_id: Optional[str], partial_paths: List[str], bytes_done: int) -> None:
+    """Persist the partial files and byte count of a running download."""
+    if not job_id:
+        return
+    try:
+        async with aiosqlite.connect(JOURNAL_DB) as connection:
+            await connection.execute(
+                "UPDATE download_journal SET partial_paths = ?, bytes_done = ?, updated_at = ? WHERE job_id = ?",
+                (json.dumps(sorted(set(partial_paths))), bytes_done, time.time(), job_id)
+            )
+            await connection.commit()
+    except Exception as e:
+        # Journaling must never break the download itself
+        logger.warning(f"Failed to update download journal for {job_id}: {e}")
+
+class ProgressJournal:
+    """Journals a download's progress from sync callbacks, one write at a time.
+
+    While a write runs only the newest progress is kept for the next one, so
+    writes land in order and an older offset never overwrites a newer one.
+    """
+    def __init__(self, job_id: Optional[str]):
+        self.job_id = job_id
+        self._latest = None
+        self._task = None
+
+    def update(self, partial_paths: List[str], bytes_done: int) -> None:
+        if not self.job_id:
+            return
+        self._latest = (partial_paths, bytes_done)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._write())
+
+    async def _write(self):
+        while self._latest is not None:
+            partial_paths, bytes_done = self._latest
+            self._latest = None
+            await journal_progress(self.job_id, partial_paths, bytes_done)
+
+async def journal_finish(job_id: Optional[str]) -> None:
+    """Remove a download from the journal once it completed, failed or was cancelled."""
+    if not job_id:
+        return
+    try:
+        async with aiosqlite.connect(JOURNAL_DB) as connection:
+            await connection.execute("DELETE FROM download_journal WHERE job_id = ?", (job_id,))
+            await connection.commit()
+    except Exception as e:
+        logger.warning(f"Failed to close download journal entry {job_id}: {e}")
+
+async def get_pending_downloads() -> List[Dict[str, Any]]:
+    """Return every journaled download that was still running when the bot stopped."""
+    await init_journal_db()
+    async with aiosqlite.connect(JOURNAL_DB) as connection:
+        connection.row_factory = aiosqlite.Row
+        async with connection.execute("SELECT * FROM download_journal ORDER BY created_at") as cursor:
+            rows = await cursor.fetchall()
+
+    entries = []
+    for row in rows:
+        entry = dict(row)
+        entry['partial_paths'] = json.loads(entry.get('partial_paths') or '[]')
+        entry['stale'] = time.time() - (entry.get('updated_at') or 0) > JOURNAL_MAX_AGE
+        entries.append(entry)
+    return entries
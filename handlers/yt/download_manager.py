@@ -1,4 +1,5 @@
 import os
+import copy
 import glob
 import asyncio
 import yt_dlp
@@ -7,17 +8,40 @@ import logging
 import random
 import socket
 import http.client
+import aiohttp
+from io import BytesIO
+from utils.http import get_session
 from typing import Dict, Optional, Tuple
-from .constants import MAX_FILESIZE, MAX_RETRIES, INITIAL_RETRY_DELAY, MAX_RETRY_DELAY, download_cancellations
-from .format_utils import add_cookies_to_opts, extract_info, get_size
-from .file_utils import sanitize_filename, get_user_downloads_dir, safe_delete
+from .constants import (
+    MAX_FILESIZE, MAX_RETRIES, INITIAL_RETRY_DELAY, MAX_RETRY_DELAY, HTTP_CHUNK_SIZE, MEMORY_AUDIO_MAX_SIZE,
+    download_cancellations
+)
+from .format_utils import add_cookies_to_opts, add_download_tuning_opts, extract_info, get_size
+from .file_utils import (
+    sanitize_filename, get_user_downloads_dir, safe_delete, format_speed,
+    path_exists, get_file_size, replace_file, glob_files, delete_matching
+)
 from .progress_tracker import ProgressTracker
+from .transcode import (
+    plan_transcode, probe_codecs, run_ffmpeg, record_transcode,
+    probe_video_metadata, generate_thumbnail, plan_audio_output, pipe_audio
+)
+from .download_journal import ProgressJournal
+from .stage_timing import timed_stage, record_span
+from .subtitles import pick_subtitle_track, convert_to_srt
 
 logger = logging.getLogger(__name__)
 
 async def download_video(url: str, video_format_id: str, best_audio: Optional[Dict], 
-                        stream_type: str, resolution: str, client, chat_id, message_id, user_id=None, cancel_markup=None) -> Tuple[str, str]:
-    """Download video at specified quality with progress updates."""
+                        stream_type: str, resolution: str, client, chat_id, message_id, user_id=None, cancel_markup=None, job=None,
+                        journal_id=None) -> Tuple[str, str, Dict]:
+    """Download video at specified quality with progress updates.
+    
+    File names are deterministic, so a retried or resumed download picks up the
+    partial files of an earlier attempt instead of starting over.
+    Returns the file path, the safe title and the video metadata (duration,
+    width, height and a thumbnail path) for the upload.
+    """
     if user_id is None:
         user_id = chat_id if chat_id > 0 else None
     
@@ -31,6 +55,9 @@ async def download_video(url: str, video_format_id: str, best_audio: Optional[Di
         f"Preparing {resolution} download...", 
         cancel_markup  # Pass the cancel button markup
     )
+    if job:
+        job.set_tracker(tracker)
+    job_id = job.id if job else None
     await tracker.update_progress(0, 1, 0, None, force=True)
     
     info = await extract_info(url)
@@ -44,223 +71,186 @@ async def download_video(url: str, video_format_id: str, best_audio: Optional[Di
     tracker.description = f"Initializing download for: {safe_title} [{resolution}]"
     await tracker.update_progress(0, 1, 0, None, force=True)
     
-    # Initialize progress state with simpler tracking
+    is_adaptive = "adaptive" in stream_type.lower()
+    
+    # Progress state, one entry per stream. Adaptive formats fetch video and
+    # audio concurrently, so overall progress is the sum of both streams.
     progress = {
-        "video_bytes": 0,      # Video bytes downloaded
-        "video_total": 0,      # Total video bytes
-        "audio_bytes": 0,      # Audio bytes downloaded
-        "audio_total": 0,      # Total audio bytes
-        "merged_bytes": 0,     # Post-processing bytes
-        "current_stage": "video",  # Current stage: 'video', 'audio', 'merging'
-        "speed": 0,            # Current download speed
-        "eta": None,           # Estimated time to completion
-        "last_update": 0,      # Last update time
-        "filename": "",        # Current file being downloaded
-        "event": asyncio.Event(), # Event for signaling progress updates
-        "finished": False      # Whether download is complete
+        "streams": {
+            "video": {"bytes": 0, "total": 0, "speed": 0, "done": False, "partial": None},
+        },
+        "current_stage": "downloading",  # Current stage: 'downloading', 'merging'
+        "finished": False,         # Whether download is complete
+        "abort": False,            # Set when one stream failed and the other should stop
     }
-    
-    # Estimate total size once at the beginning
-    total_size = 0
-    video_size = 0
-    audio_size = 0
-    
-    if "adaptive" in stream_type.lower():
-        # For adaptive formats, we need to know both video and audio size
-        if best_audio:
-            audio_size = get_size(best_audio) or 0
-        
-        # Try to get video size from formats
-        formats = info.get('formats', [])
-        for fmt in formats:
-            if fmt.get('format_id') == video_format_id:
-                video_size = get_size(fmt) or 0
-                break
-        
-        total_size = video_size + audio_size
-        progress["video_total"] = video_size
-        progress["audio_total"] = audio_size
+    if is_adaptive:
+        progress["streams"]["audio"] = {"bytes": 0, "total": 0, "speed": 0, "done": False, "partial": None}
+    
+    # Estimate sizes once at the beginning
+    video_fmt = {}
+    for fmt in info.get('formats', []):
+        if fmt.get('format_id') == video_format_id:
+            video_fmt = fmt
+            progress["streams"]["video"]["total"] = get_size(fmt) or 0
+            break
+    if is_adaptive and best_audio:
+        progress["streams"]["audio"]["total"] = get_size(best_audio) or 0
+    total_size = sum(stream["total"] for stream in progress["streams"].values())
     
     # Send initial progress message
     await tracker.update_progress(0, total_size or 1, 0, None, force=True)
     
-    # Define progress hook for yt-dlp
-    def progress_hook(d):
-        # Check for cancellation at each progress update
-        if user_id in download_cancellations:
-            # Use a custom exception instead of KeyboardInterrupt to avoid asyncio issues
-            raise Exception("DOWNLOAD_CANCELLED_BY_USER")
+    loop = asyncio.get_running_loop()
+    
+    def make_progress_hook(stream_name):
+        """Build a yt-dlp progress hook that feeds one stream's progress entry."""
+        stream = progress["streams"][stream_name]
+        
+        def progress_hook(d):
+            # Check for cancellation at each progress update
+            if user_id in download_cancellations or progress["abort"]:
+                # Use a custom exception instead of KeyboardInterrupt to avoid asyncio issues
+                raise Exception("DOWNLOAD_CANCELLED_BY_USER")
             
-        if d['status'] == 'downloading':
-            # Get download information
-            bytes_downloaded = d.get('downloaded_bytes', 0)
-            bytes_total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-            speed = d.get('speed', 0)
-            eta = d.get('eta')
-            filename = d.get('info_dict', {}).get('_filename', '')
+            if d['status'] == 'downloading':
+                stream["bytes"] = d.get('downloaded_bytes', 0)
+                bytes_total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
+                if bytes_total:
+                    stream["total"] = bytes_total
+                stream["speed"] = d.get('speed') or 0
+                stream["partial"] = d.get('tmpfilename') or stream["partial"]
+            elif d['status'] == 'finished':
+                stream["done"] = True
+                stream["speed"] = 0
+                if stream["total"]:
+                    stream["bytes"] = stream["total"]
+            elif d['status'] == 'error':
+                progress["abort"] = True
             
-            # Detect stage change by filename
-            if filename != progress["filename"]:
-                progress["filename"] = filename
-                
-                # If we have some video downloaded and now filename changed, we're in audio stage
-                if progress["video_bytes"] > 0 and "adaptive" in stream_type.lower():
-                    progress["current_stage"] = "audio"
-                    # Lock in video bytes for continuous progress calculation
-                    if progress["video_total"] > 0:
-                        progress["video_bytes"] = progress["video_total"]
+            # Hooks run in yt-dlp's worker thread
+            loop.call_soon_threadsafe(report_progress)
+        
+        return progress_hook
+    
+    last_journal_time = 0
+    journal = ProgressJournal(journal_id)
+    
+    def report_progress():
+        """Combine every stream into one figure and hand it to the progress service."""
+        nonlocal last_journal_time
+        if progress["finished"]:
+            return
+        
+        streams = progress["streams"].values()
+        total_bytes = max(1, sum(stream["total"] for stream in streams))
+        downloaded_bytes = sum(stream["bytes"] for stream in streams)
+        speed = sum(stream["speed"] for stream in streams)
+        eta = (total_bytes - downloaded_bytes) / speed if speed > 0 else None
+        
+        if progress["current_stage"] == "merging":
+            downloaded_bytes = total_bytes * 0.95  # 95% complete during processing
+            tracker.description = f"Processing {resolution} video [Merging]"
+        elif is_adaptive:
+            pending = [name.title() for name, stream in progress["streams"].items() if not stream["done"]]
+            tracker.description = f"Downloading {resolution} video [{' + '.join(pending) or 'Finishing'}]"
+        else:
+            tracker.description = f"Downloading {resolution} video"
+        tracker.report(downloaded_bytes, total_bytes, speed, eta)
+        
+        # Persist partial files so a restart can resume from them
+        now = time.time()
+        if journal_id and now - last_journal_time >= 10:
+            last_journal_time = now
+            partials = [stream["partial"] for stream in streams if stream["partial"]]
+            journal.update(partials, int(downloaded_bytes))
+    
+    def stream_opts(format_selector, outtmpl, stream_name):
+        """Build yt-dlp options for downloading one stream."""
+        return add_cookies_to_opts(add_download_tuning_opts({
+            'format': format_selector,
+            'windowsfilenames': True,
+            'outtmpl': outtmpl,
+            'max_filesize': MAX_FILESIZE,
+            'continuedl': True,  # Resume from existing .part files
+            'progress_hooks': [make_progress_hook(stream_name)],
+            'verbose': False,
+        }))
+    
+    async def fetch_stream(opts):
+        """Download one stream and return the path yt-dlp wrote it to."""
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            # The format option picks this stream from the already extracted info
+            result = await download_with_retry(ydl, info)
+            downloads = (result or {}).get('requested_downloads') or []
+            if downloads and downloads[0].get('filepath'):
+                return downloads[0]['filepath']
+            return ydl.prepare_filename(result)
+    
+    stream_files = []
+    try:
+        if is_adaptive:
+            # Fetch video and audio at the same time, then merge once both are done
+            audio_selector = best_audio.get('format_id') if best_audio else 'bestaudio'
+            base_path = os.path.join(user_downloads_dir, f"{safe_title} - {resolution}")
+            with timed_stage(job_id, 'download') as span:
+                tasks = [
+                    asyncio.create_task(fetch_stream(stream_opts(video_format_id, f"{base_path}.video.%(ext)s", "video"))),
+                    asyncio.create_task(fetch_stream(stream_opts(audio_selector, f"{base_path}.audio.%(ext)s", "audio"))),
+                ]
+                done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                if pending:
+                    # One stream failed, stop the other one before reporting the error
+                    progress["abort"] = True
+                    await asyncio.gather(*pending, return_exceptions=True)
+                stream_files = [task.result() for task in tasks if not task.exception()]
+                span['bytes'] = sum(stream["bytes"] for stream in progress["streams"].values())
+                for task in tasks:
+                    if task.exception():
+                        raise task.exception()
             
-            # Update appropriate stage metrics
-            if progress["current_stage"] == "video":
-                progress["video_bytes"] = bytes_downloaded
-                if bytes_total > 0 and progress["video_total"] == 0:
-                    progress["video_total"] = bytes_total
-            elif progress["current_stage"] == "audio":
-                progress["audio_bytes"] = bytes_downloaded
-                if bytes_total > 0 and progress["audio_total"] == 0:
-                    progress["audio_total"] = bytes_total
+            if user_id in download_cancellations:
+                raise Exception("DOWNLOAD_CANCELLED_BY_USER")
             
-            # Update speed and ETA
-            progress["speed"] = speed
-            progress["eta"] = eta
+            # Decide between stream copy and transcoding from the format fields
+            plan = plan_transcode(url, video_fmt.get('vcodec'), best_audio.get('acodec') if best_audio else None)
+            progress["current_stage"] = "merging"
+            report_progress()
+            with timed_stage(job_id, 'transcode') as span:
+                cpu_seconds = await merge_streams(stream_files[0], stream_files[1], expected_filename, plan)
+                span['bytes'] = await get_file_size(expected_filename) or 0
             
-            # Signal for progress update
-            progress["last_update"] = time.time()
-            progress["event"].set()
+            # The separate streams are only needed until they are merged. After a failed
+            # download or merge they stay for a resume, or for the janitor
+            for stream_file in stream_files:
+                await safe_delete(stream_file)
+        else:
+            with timed_stage(job_id, 'download') as span:
+                stream_path = await fetch_stream(stream_opts(video_format_id, expected_filename, "video"))
+                span['bytes'] = progress["streams"]["video"]["bytes"]
             
-        elif d['status'] == 'finished':
-            # If we finished downloading but we're not done yet, we're changing stages
-            if progress["current_stage"] == "video" and "adaptive" in stream_type.lower():
-                progress["current_stage"] = "audio"
-                # Lock in the video progress
-                if progress["video_total"] > 0:
-                    progress["video_bytes"] = progress["video_total"]
-            else:
-                # Both video and audio are done, now in processing stage
+            # Probe the file when the extractor didn't report its codecs
+            vcodec, acodec = video_fmt.get('vcodec'), video_fmt.get('acodec')
+            if not vcodec or not acodec:
+                vcodec, acodec = await probe_codecs(stream_path)
+            plan = plan_transcode(url, vcodec, acodec, video_fmt.get('ext'))
+            cpu_seconds = 0.0
+            if plan['needs_ffmpeg']:
                 progress["current_stage"] = "merging"
-            
-            progress["event"].set()
-            
-        elif d['status'] == 'error':
-            progress["finished"] = True
-            progress["event"].set()
-    
-    # Task to update progress UI
-    async def update_progress_ui():
-        last_update_time = 0
-        min_update_interval = 3  # Minimum seconds between updates
-        
-        while not progress["finished"]:
-            try:
-                # Check for cancellation
-                if user_id in download_cancellations:
-                    tracker.description = f"Cancelling download: {safe_title} [{resolution}]"
-                    await tracker.update_progress(0, 1, 0, 0, force=True)
-                    progress["finished"] = True
-                    break
-                
-                # Wait for event or timeout
+                report_progress()
+                processed_path = f"{expected_filename}.processing.mp4"
                 try:
-                    await asyncio.wait_for(progress["event"].wait(), 5)
-                    progress["event"].clear()
-                except asyncio.TimeoutError:
-                    # No updates for 5 seconds, check if we need to send a periodic update
-                    pass
-                
-                # Calculate current progress based on stage
-                current_time = time.time()
-                if current_time - last_update_time < min_update_interval:
-                    continue  # Too soon for another update
-                
-                # Calculate overall progress based on stage
-                total_bytes = max(1, progress["video_total"] + progress["audio_total"])
-                downloaded_bytes = 0
-                
-                if "adaptive" in stream_type.lower():
-                    # For adaptive format, combine video and audio progress
-                    if progress["current_stage"] == "video":
-                        downloaded_bytes = progress["video_bytes"]
-                        # Update description to show stage
-                        tracker.description = f"Downloading {resolution} video [Video]"
-                    elif progress["current_stage"] == "audio":
-                        # Video is complete, add audio progress
-                        downloaded_bytes = progress["video_total"] + progress["audio_bytes"]
-                        tracker.description = f"Downloading {resolution} video [Audio]"
-                    elif progress["current_stage"] == "merging":
-                        # Both downloads complete, show processing
-                        downloaded_bytes = total_bytes * 0.95  # 95% complete during processing
-                        tracker.description = f"Processing {resolution} video [Merging]"
-                else:
-                    # For progressive format, simpler calculation
-                    downloaded_bytes = progress["video_bytes"]
-                    tracker.description = f"Downloading {resolution} video"
-                
-                # Get current speed and ETA
-                speed = progress["speed"]
-                eta = progress["eta"]
-                
-                # Update the progress UI
-                await tracker.update_progress(downloaded_bytes, total_bytes, speed, eta)
-                last_update_time = current_time
-                
-            except Exception as e:
-                logger.error(f"Error in progress UI updater: {e}")
-                await asyncio.sleep(5)  # Wait before trying again
-    
-    # Start the UI updater task
-    updater_task = asyncio.create_task(update_progress_ui())
-    
-    # Check if this is an Instagram URL to determine encoding strategy
-    is_instagram = 'instagram.com' in url.lower() or 'instagr.am' in url.lower()
-    
-    # Configure yt-dlp options with optimized encoding
-    fmt_str = f"{video_format_id}+bestaudio/best" if "adaptive" in stream_type.lower() else video_format_id
-    
-    if is_instagram:
-        # For Instagram videos, use minimal re-encoding for WhatsApp compatibility
-        postprocessor_args = {
-            'ffmpeg': [
-                '-c:v', 'libx264',      # Re-encode video with H.264
-                '-preset', 'ultrafast', # Fastest encoding (less compression but faster)
-                '-crf', '28',           # Higher CRF for smaller files (was 23)
-                '-profile:v', 'main',   # Main profile instead of baseline
-                '-level', '4.0',        # Higher level for better compression
-                '-c:a', 'copy',         # Copy audio if already AAC
-                '-movflags', '+faststart',
-                '-pix_fmt', 'yuv420p',
-                '-maxrate', '2M',       # Limit bitrate to 2Mbps
-                '-bufsize', '4M'        # Buffer size
-            ]
-        }
-    else:
-        # For other videos, prioritize stream copying
-        postprocessor_args = {
-            'ffmpeg': [
-                '-c:v', 'copy',         # Copy video stream
-                '-c:a', 'aac',          # Convert audio to AAC only if needed
-                '-b:a', '128k',         # Limit audio bitrate
-                '-avoid_negative_ts', 'make_zero',
-                '-movflags', '+faststart'
-            ]
-        }
-    
-    ydl_opts = add_cookies_to_opts({
-        'format': fmt_str,
-        'merge_output_format': 'mp4',
-        'windowsfilenames': True,
-        'outtmpl': expected_filename,
-        'max_filesize': MAX_FILESIZE,
-        'postprocessor_args': postprocessor_args,
-        'prefer_ffmpeg': True,
-        'keepvideo': False,
-        'progress_hooks': [progress_hook],
-        'verbose': False,
-    })
-    
-    try:
-        # Perform the actual download
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            await download_with_retry(ydl, url)
+                    with timed_stage(job_id, 'transcode') as span:
+                        cpu_seconds = await run_ffmpeg([stream_path], processed_path, plan)
+                        span['bytes'] = await get_file_size(processed_path) or 0
+                    await replace_file(processed_path, expected_filename)
+                finally:
+                    await safe_delete(processed_path)
+            elif stream_path != expected_filename:
+                await replace_file(stream_path, expected_filename)
+        
+        file_size = await get_file_size(expected_filename)
+        if file_size is not None:
+            record_transcode(plan, cpu_seconds, file_size, job)
         
         # Check if cancelled during download
         if user_id in download_cancellations:
@@ -268,63 +258,54 @@ async def download_video(url: str, video_format_id: str, best_audio: Optional[Di
         
         # Mark as complete
         progress["finished"] = True
-        progress["event"].set()
         
         # Show complete status
         tracker.description = f"Download complete: {safe_title} [{resolution}]"
-        if os.path.exists(expected_filename):
-            file_size = os.path.getsize(expected_filename)
-            await tracker.update_progress(file_size, file_size, 0, 0, force=True)
-        
-        # Clean up updater task
-        if not updater_task.done():
-            updater_task.cancel()
-            try:
-                await updater_task
-            except asyncio.CancelledError:
-                pass
+        if file_size is not None:
+            average_speed, peak_speed = tracker.bandwidth_summary(file_size)
+            logger.info(f"Video download bandwidth for {safe_title} [{resolution}]: "
+                        f"avg {format_speed(average_speed)}, peak {format_speed(peak_speed)}")
+            await tracker.update_progress(file_size, file_size, average_speed, 0, force=True)
         
         # Check if file exists or find it if needed
-        if not os.path.exists(expected_filename):
-            pattern = os.path.join(user_downloads_dir, f"{safe_title}*.mp4")
-            matches = glob.glob(pattern)
+        if file_size is None:
+            matches = await glob_files(os.path.join(user_downloads_dir, f"{glob.escape(safe_title)}*.mp4"))
             if matches:
                 expected_filename = matches[0]
             else:
                 raise ValueError("Downloaded file not found")
+        
+        # Work out what Telegram would otherwise compute after the upload
+        metadata = {
+            'duration': int(info.get('duration') or 0),
+            'width': video_fmt.get('width') or 0,
+            'height': video_fmt.get('height') or 0,
+        }
+        if not all(metadata.values()):
+            probed = await probe_video_metadata(expected_filename)
+            metadata.update({key: value for key, value in probed.items() if value})
+        metadata['thumb'] = await generate_thumbnail(expected_filename, metadata['duration'])
     
     except Exception as e:
         # Handle errors and cancellation
         progress["finished"] = True
-        progress["event"].set()
-        
-        # Cancel the updater
-        if not updater_task.done():
-            updater_task.cancel()
-            try:
-                await updater_task
-            except asyncio.CancelledError:
-                pass
         
         # Check if this was a cancellation
         if "DOWNLOAD_CANCELLED_BY_USER" in str(e) or user_id in download_cancellations:
             # Clean up any partial files
             try:
-                if os.path.exists(expected_filename):
-                    await safe_delete(expected_filename)
+                await safe_delete(expected_filename)
                 
                 # Also clean up any temp files in the user directory
                 user_downloads_dir = await get_user_downloads_dir(user_id)
-                temp_patterns = [
-                    os.path.join(user_downloads_dir, f"*{safe_title}*.part"),
-                    os.path.join(user_downloads_dir, f"*{safe_title}*.tmp"),
-                    os.path.join(user_downloads_dir, f"*{safe_title}*.download"),
+                await delete_matching(
+                    os.path.join(user_downloads_dir, f"*{glob.escape(safe_title)}*.part"),
+                    os.path.join(user_downloads_dir, f"*{glob.escape(safe_title)}*.tmp"),
+                    os.path.join(user_downloads_dir, f"*{glob.escape(safe_title)}*.download"),
                     os.path.join(user_downloads_dir, f"*.f{video_format_id}.*"),
-                ]
-                
-                for pattern in temp_patterns:
-                    for temp_file in glob.glob(pattern):
-                        await safe_delete(temp_file)
+                    os.path.join(user_downloads_dir, f"{glob.escape(safe_title)} - {resolution}.video.*"),
+                    os.path.join(user_downloads_dir, f"{glob.escape(safe_title)} - {resolution}.audio.*"),
+                )
                         
             except Exception as cleanup_error:
                 logger.error(f"Error during file cleanup: {cleanup_error}")
@@ -342,7 +323,18 @@ async def download_video(url: str, video_format_id: str, best_audio: Optional[Di
             # Re-raise the error
             raise ValueError(f"Error downloading video: {str(e)}")
         
-    return expected_filename, safe_title
+    return expected_filename, safe_title, metadata
+
+async def merge_streams(video_path: str, audio_path: str, output_path: str, plan: dict) -> float:
+    """Merge separately downloaded video and audio streams into one MP4 file.
+    
+    Returns the CPU seconds ffmpeg spent, so copy and transcode jobs can be compared.
+    """
+    try:
+        return await run_ffmpeg([video_path, audio_path], output_path, plan)
+    except ValueError as e:
+        await safe_delete(output_path)
+        raise ValueError(f"Merging failed: {e}")
 
 async def download_with_retry(ydl, url, retries=MAX_RETRIES, initial_delay=INITIAL_RETRY_DELAY):
     """Download with retry logic for handling network errors."""
@@ -353,6 +345,10 @@ async def download_with_retry(ydl, url, retries=MAX_RETRIES, initial_delay=INITI
         try:
             if isinstance(url, list):
                 return await asyncio.to_thread(ydl.download, url)
+            elif isinstance(url, dict):
+                # An info dict from extract_info(download=False), downloaded without extracting again.
+                # Processing fills the dict in, so every attempt gets its own copy of the shared one
+                return await asyncio.to_thread(ydl.process_ie_result, copy.deepcopy(url), download=True)
             else:
                 return await asyncio.to_thread(ydl.extract_info, url, download=True)
         except Exception as e:
@@ -367,7 +363,8 @@ async def download_with_retry(ydl, url, retries=MAX_RETRIES, initial_delay=INITI
                 if attempt < retries:
                     jitter = random.uniform(0.1, 0.3) * delay
                     retry_delay = delay + jitter
-                    logger.warning(f"Download attempt {attempt+1}/{retries+1} failed: {str(e)}. Retrying in {retry_delay:.2f}s...")
+                    # The next attempt resumes from the .part files left by this one
+                    logger.warning(f"Download attempt {attempt+1}/{retries+1} failed: {str(e)}. Resuming in {retry_delay:.2f}s...")
                     
                     await asyncio.sleep(retry_delay)
                     delay = min(delay * 2, MAX_RETRY_DELAY)
@@ -377,7 +374,8 @@ async def download_with_retry(ydl, url, retries=MAX_RETRIES, initial_delay=INITI
                 # For other errors, don't retry
                 raise ValueError(f"Unexpected error during download: {str(e)}")
 
-async def download_audio_by_format(url: str, audio_format_id: str, quality_str: str, client, chat_id, message_id, user_id=None, cancel_markup=None) -> Tuple[str, str]:
+async def download_audio_by_format(url: str, audio_format_id: str, quality_str: str, client, chat_id, message_id, user_id=None, cancel_markup=None, job=None,
+                                   journal_id=None) -> Tuple[str, str]:
     """Download audio at specified quality with progress updates."""
     if user_id is None:
         user_id = chat_id if chat_id > 0 else None
@@ -401,29 +399,37 @@ async def download_audio_by_format(url: str, audio_format_id: str, quality_str:
         f"Downloading audio at {quality_str}...", 
         cancel_markup  # Pass the cancel button markup
     )
+    if job:
+        job.set_tracker(tracker)
     
     # Create a shared progress state
     progress_state = {
         "downloaded": 0,
         "total": 0,
-        "speed": 0,
-        "eta": None,
-        "last_update_time": 0,
-        "update_required": asyncio.Event(),
         "finished": False,
-        "last_update_attempt": 0,     
-        "min_update_interval": 5.0,   # Increased from 2.0 to 5.0 seconds
-        "min_bytes_change": 3 * 1024 * 1024,  # 3MB minimum bytes change
-        "last_bytes": 0,
-        "last_percent": 0,
+        "partial": None,              # Current .part file, journaled for resuming
+        "last_journal_time": 0,
+        "postprocess_start": None,    # When FFmpegExtractAudio started
+        "postprocess_seconds": 0,     # Time spent converting, for stage timing
     }
     
     # Send initial progress message
-    try:
-        await tracker.update_progress(0, 1, 0, None)
-    except Exception as e:
-        logger.error(f"Failed to send initial progress message: {e}")
-        # Continue anyway - download is more important than progress updates
+    await tracker.update_progress(0, 1, 0, None, force=True)
+    
+    loop = asyncio.get_running_loop()
+    journal = ProgressJournal(journal_id)
+    
+    def report_progress(downloaded, total, speed, eta):
+        """Hand progress to the progress service and journal the partial file."""
+        if progress_state["finished"]:
+            return
+        tracker.report(downloaded, total, speed, eta)
+        
+        # Persist the partial file so a restart can resume from it
+        now = time.time()
+        if journal_id and progress_state["partial"] and now - progress_state["last_journal_time"] >= 10:
+            progress_state["last_journal_time"] = now
+            journal.update([progress_state["partial"]], downloaded)
     
     def progress_hook(d):
         """Progress hook for yt-dlp."""
@@ -432,122 +438,28 @@ async def download_audio_by_format(url: str, audio_format_id: str, quality_str:
             raise Exception("DOWNLOAD_CANCELLED_BY_USER")
             
         if d['status'] == 'downloading':
-            current_time = time.time()
             progress_state["downloaded"] = d.get('downloaded_bytes', 0)
             progress_state["total"] = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-            progress_state["speed"] = d.get('speed')
-            progress_state["eta"] = d.get('eta')
-            
-            # More conservative update strategy with added bytes condition
-            time_condition = current_time - progress_state["last_update_time"] >= progress_state["min_update_interval"]
-            progress_condition = False
-            bytes_condition = False
-            
-            if progress_state["total"] > 0:
-                last_percent = progress_state.get("last_percent", 0)
-                curr_percent = (progress_state["downloaded"] / progress_state["total"]) * 100
-                progress_condition = abs(curr_percent - last_percent) >= 1  # 1% change threshold
-                progress_state["last_percent"] = curr_percent
-                
-            # Add check for minimum bytes downloaded
-            last_bytes = progress_state.get("last_bytes", 0)
-            bytes_condition = abs(progress_state["downloaded"] - last_bytes) >= progress_state["min_bytes_change"]
-            
-            if time_condition and (progress_condition or bytes_condition or 
-                                  progress_state["downloaded"] == 0 or 
-                                  progress_state["downloaded"] == progress_state["total"]):
-                progress_state["last_update_time"] = current_time
-                progress_state["last_bytes"] = progress_state["downloaded"]
-                progress_state["update_required"].set()
-        elif d['status'] == 'finished':
-            progress_state["finished"] = True
-            progress_state["update_required"].set()
-    
-    # Task to update progress display
-    async def progress_updater():
-        last_percent = 0
-        retry_interval = 3.0  # Start with 3 second retry (increased from 1)
-        
-        while not progress_state["finished"]:
-            try:
-                # Check for cancellation
-                if user_id in download_cancellations:
-                    tracker.description = f"Cancelling audio download: {quality_str}"
-                    await tracker.update_progress(0, 1, 0, 0, force=True)
-                    progress_state["finished"] = True
-                    break
-                
-                # Wait for event or timeout after retry_interval seconds
-                await asyncio.wait_for(progress_state["update_required"].wait(), retry_interval)
-                progress_state["update_required"].clear()
-                
-                # If we're in a rate limit backoff, check if we should increase the retry interval
-                if tracker.flood_wait_until > time.time():
-                    # Calculate remaining flood wait time
-                    remaining = tracker.flood_wait_until - time.time()
-                    if remaining > 0:
-                        # More conservative retry interval
-                        retry_interval = min(remaining * 0.75, 15.0)  # No more than 15 seconds
-                        logger.info(f"In flood wait period, adjusted retry interval to {retry_interval:.1f}s")
-                        # Skip this update but keep the download going
-                        continue
-                
-                # Send the update with more intelligent throttling
-                current_time = time.time()
-                current_percent = 0
-                if progress_state["total"] > 0:
-                    current_percent = (progress_state["downloaded"] / progress_state["total"]) * 100
-                    
-                # Only send update if there's been substantial change or it's been a while
-                should_update = (current_time - tracker.last_update_time >= tracker.update_interval or 
-                                abs(current_percent - last_percent) >= tracker.min_progress_change)
-                
-                if should_update:
-                    await tracker.update_progress(
-                        progress_state["downloaded"],
-                        progress_state["total"],
-                        progress_state["speed"],
-                        progress_state["eta"]
-                    )
-                    last_percent = current_percent
-                
-                # Adjust retry interval based on download speed and remaining percentage
-                if progress_state["speed"] and progress_state["speed"] > 0 and progress_state["total"] > 0:
-                    percent_remaining = 100 - current_percent
-                    # For fast downloads with little remaining, update more frequently
-                    if progress_state["speed"] > 500000 and percent_remaining < 20:  # 500KB/s
-                        retry_interval = 2.0
-                    # For slow downloads or lots remaining, check less frequently
-                    elif progress_state["speed"] < 100000 or percent_remaining > 80:  # 100KB/s
-                        retry_interval = 8.0
-                    else:
-                        retry_interval = 4.0
-                else:
-                    # Default retry interval
-                    retry_interval = 5.0
-                    
-            except asyncio.TimeoutError:
-                # Only send periodic updates if significant time has passed
-                if progress_state["total"] > 0 and progress_state["downloaded"] > 0:
-                    current_time = time.time()
-                    if current_time - tracker.last_update_time >= tracker.update_interval:
-                        current_percent = (progress_state["downloaded"] / progress_state["total"]) * 100
-                        if abs(current_percent - last_percent) >= 1:  # Only update if 1% change
-                            await tracker.update_progress(
-                                progress_state["downloaded"],
-                                progress_state["total"],
-                                progress_state["speed"],
-                                progress_state["eta"]
-                            )
-                            last_percent = current_percent
-            except Exception as e:
-                logger.error(f"Error updating progress: {e}")
-                retry_interval = min(retry_interval * 2.0, 20.0)  # More aggressive exponential backoff
-    
-    # Start the updater task
-    updater_task = asyncio.create_task(progress_updater())
-    
-    ydl_opts = add_cookies_to_opts({
+            progress_state["partial"] = d.get('tmpfilename') or progress_state["partial"]
+            # Hooks run in yt-dlp's worker thread
+            loop.call_soon_threadsafe(
+                report_progress,
+                progress_state["downloaded"],
+                progress_state["total"],
+                d.get('speed'),
+                d.get('eta')
+            )
+    
+    def postprocessor_hook(d):
+        """Time the MP3 conversion separately from the download."""
+        if d['postprocessor'] != 'ExtractAudio':
+            return
+        if d['status'] == 'started':
+            progress_state["postprocess_start"] = time.monotonic()
+        elif d['status'] == 'finished' and progress_state["postprocess_start"]:
+            progress_state["postprocess_seconds"] += time.monotonic() - progress_state["postprocess_start"]
+    
+    ydl_opts = add_cookies_to_opts(add_download_tuning_opts({
         'format': audio_format_id,
         'windowsfilenames': True,
         'outtmpl': expected_template,
@@ -558,79 +470,69 @@ async def download_audio_by_format(url: str, audio_format_id: str, quality_str:
             'preferredquality': '192',
         }],
         'progress_hooks': [progress_hook],
+        'postprocessor_hooks': [postprocessor_hook],
         'verbose': False,
         'socket_timeout': 30,
+        'continuedl': True,  # Resume from existing .part files
         'retries': 10,
         'fragment_retries': 10,
-    })
+    }))
     
     try:
         tracker.description = f"Downloading audio at {quality_str}..."
+        started = time.monotonic()
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             # Use our custom retry function instead of direct call
             await download_with_retry(ydl, [url])
         
+        # yt-dlp converts right after downloading, so split the elapsed time in two
+        job_id = job.id if job else None
+        elapsed = time.monotonic() - started
+        record_span(job_id, 'download', elapsed - progress_state["postprocess_seconds"], progress_state["total"])
+        if progress_state["postprocess_seconds"]:
+            record_span(job_id, 'transcode', progress_state["postprocess_seconds"], await get_file_size(expected_filename) or 0)
+        
         # Check if cancelled during download
         if user_id in download_cancellations:
             raise Exception("DOWNLOAD_CANCELLED_BY_USER")
         
         # Update with final progress (100%)
+        progress_state["finished"] = True
         if progress_state["total"] > 0:
+            average_speed, peak_speed = tracker.bandwidth_summary(progress_state["total"])
+            logger.info(f"Audio download bandwidth for {safe_title} [{quality_str}]: "
+                        f"avg {format_speed(average_speed)}, peak {format_speed(peak_speed)}")
             await tracker.update_progress(
                 progress_state["total"],  # Set downloaded = total for 100%
                 progress_state["total"],
-                progress_state["speed"],
-                0  # ETA is now 0
+                average_speed,
+                0,  # ETA is now 0
+                force=True
             )
         
-        # Mark as finished and clean up the updater task
-        progress_state["finished"] = True
-        progress_state["update_required"].set()  # Wake up the updater one last time
-        await asyncio.sleep(0.5)  # Give it time to process
-        
-        if not updater_task.done():
-            updater_task.cancel()
-            try:
-                await updater_task
-            except asyncio.CancelledError:
-                pass
-                
-        if not os.path.exists(expected_filename):
+        if not await path_exists(expected_filename):
             # Try to find the actual file if outtmpl didn't work as expected
-            pattern = os.path.join(user_downloads_dir, f"{safe_title}*.mp3")
-            matches = glob.glob(pattern)
+            matches = await glob_files(os.path.join(user_downloads_dir, f"{glob.escape(safe_title)}*.mp3"))
             if matches:
                 expected_filename = matches[0]
     except Exception as e:
-        # Cancel the updater task in case of error
+        # Stop reporting progress in case of error
         progress_state["finished"] = True
-        progress_state["update_required"].set()
-        if not updater_task.done():
-            updater_task.cancel()
-            try:
-                await updater_task
-            except asyncio.CancelledError:
-                pass
         
         # Check if this was a cancellation
         if "DOWNLOAD_CANCELLED_BY_USER" in str(e) or user_id in download_cancellations:
             # Clean up any partial files
             try:
-                if os.path.exists(expected_filename):
-                    await safe_delete(expected_filename)
+                await safe_delete(expected_filename)
                 
                 # Clean up temp files
                 user_downloads_dir = await get_user_downloads_dir(user_id)
-                temp_patterns = [
-                    os.path.join(user_downloads_dir, f"*{safe_title}*.part"),
-                    os.path.join(user_downloads_dir, f"*{safe_title}*.tmp"),
-                    os.path.join(user_downloads_dir, f"*{safe_title}*.download"),
+                await delete_matching(
+                    os.path.join(user_downloads_dir, f"*{glob.escape(safe_title)}*.part"),
+                    os.path.join(user_downloads_dir, f"*{glob.escape(safe_title)}*.tmp"),
+                    os.path.join(user_downloads_dir, f"*{glob.escape(safe_title)}*.download"),
                     os.path.join(user_downloads_dir, f"*.f{audio_format_id}.*"),
-                ]
-                
-                for pattern in temp_patterns:
-                    for temp_file in glob.glob(pattern):
-                        await safe_delete(temp_file)
+                )
                         
             except Exception as cleanup_error:
                 logger.error(f"Error during file cleanup: {cleanup_error}")
@@ -638,7 +540,7 @@ async def download_audio_by_format(url: str, audio_format_id: str, quality_str:
             # Update progress message with cancellation info
             try:
                 tracker.description = "Audio download cancelled"
-                await tracker.update_progress(0, 1, 0, 0)
+                await tracker.update_progress(0, 1, 0, 0, force=True)
             except:
                 pass
                 
@@ -650,7 +552,7 @@ async def download_audio_by_format(url: str, audio_format_id: str, quality_str:
                 logger.error(f"Network connection was reset during audio download: {error_msg}")
                 try:
                     tracker.description = "Audio download failed - connection reset"
-                    await tracker.update_progress(0, 1, 0, 0)
+                    await tracker.update_progress(0, 1, 0, 0, force=True)
                 except:
                     pass
             
@@ -658,42 +560,122 @@ async def download_audio_by_format(url: str, audio_format_id: str, quality_str:
         
     return expected_filename, safe_title
 
-async def download_subtitles(url: str, lang: str, safe_title: str, user_id: int) -> Optional[str]:
-    """Download subtitles in specified language."""
-    user_downloads_dir = await get_user_downloads_dir(user_id)
-    outtmpl = os.path.join(user_downloads_dir, safe_title)
-    
-    # Handle language formatting
-    sub_lang = lang
-    if "auto-generated" in lang:
-        sub_lang = lang.split(" ")[0]
-    
-    ydl_opts = add_cookies_to_opts({
-        'skip_download': True,
-        'writesubtitles': True,
-        'writeautomaticsub': True,
-        'subtitleslangs': [sub_lang],
-        'subtitlesformat': 'srt',
-        'outtmpl': outtmpl,
-        'quiet': True,
-    })
+def audio_fits_in_memory(fmt: Optional[Dict]) -> bool:
+    """Small audio served over plain HTTP(S) can be handled without touching disk."""
+    if not fmt or not fmt.get('url') or fmt.get('protocol') not in ('http', 'https'):
+        return False
+    size = get_size(fmt) or 0
+    return 0 < size <= MEMORY_AUDIO_MAX_SIZE
+
+async def fetch_to_memory(fmt: Dict, on_progress, user_id=None) -> bytes:
+    """Download a format's URL into memory in ranged chunks, like yt-dlp's http_chunk_size."""
+    session = get_session()
+    headers = dict(fmt.get('http_headers') or {})
+    total = get_size(fmt) or 0
+    buffer = bytearray()
+    while True:
+        start = len(buffer)
+        headers['Range'] = f"bytes={start}-{start + HTTP_CHUNK_SIZE - 1}"
+        async with session.get(fmt['url'], headers=headers, timeout=aiohttp.ClientTimeout(total=None, sock_read=30)) as response:
+            response.raise_for_status()
+            if response.status != 206:
+                # The server ignored the range and sends the whole file
+                del buffer[:]
+            content_range = response.headers.get('Content-Range', '')
+            if '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+                total = int(content_range.rsplit('/', 1)[1])
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                if user_id in download_cancellations:
+                    raise Exception("DOWNLOAD_CANCELLED_BY_USER")
+                buffer.extend(chunk)
+                if len(buffer) > MEMORY_AUDIO_MAX_SIZE:
+                    raise ValueError("Audio is larger than expected for an in-memory download")
+                on_progress(len(buffer), total)
+        if response.status != 206 or len(buffer) - start < HTTP_CHUNK_SIZE or (total and len(buffer) >= total):
+            return bytes(buffer)
+
+async def download_audio_to_memory(url: str, audio_format_id: str, quality_str: str, client, chat_id, message_id, user_id=None,
+                                   cancel_markup=None, job=None) -> Optional[Tuple[BytesIO, str, Dict]]:
+    """Download small audio straight into memory and return (file, safe_title, metadata).
+
+    The bytes are converted through ffmpeg pipes only when the source isn't
+    already sendable. Returns None when the format can't be handled this way,
+    in which case download_audio_by_format should be used.
+    """
+    info = await extract_info(url)
+    fmt = next((f for f in info.get('formats', []) if f.get('format_id') == audio_format_id), None)
+    if not audio_fits_in_memory(fmt):
+        return None
+    
+    download_cancellations.pop(user_id, None)
+    safe_title = sanitize_filename(info.get("title", "audio"))
+    tracker = ProgressTracker(client, chat_id, message_id, f"Downloading audio at {quality_str}...", cancel_markup)
+    if job:
+        job.set_tracker(tracker)
+    await tracker.update_progress(0, 1, 0, None, force=True)
+    
+    start_time = time.time()
     
+    def report_progress(downloaded, total):
+        elapsed = time.time() - start_time
+        speed = downloaded / elapsed if elapsed > 0 else 0
+        eta = (total - downloaded) / speed if speed > 0 and total else None
+        tracker.report(downloaded, total, speed, eta)
+    
+    job_id = job.id if job else None
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            await asyncio.to_thread(ydl.download, [url])
+        with timed_stage(job_id, 'download') as span:
+            data = await fetch_to_memory(fmt, report_progress, user_id)
+            span['bytes'] = len(data)
+        average_speed, peak_speed = tracker.bandwidth_summary(len(data))
+        logger.info(f"In-memory audio download for {safe_title} [{quality_str}]: {len(data)} bytes, "
+                    f"avg {format_speed(average_speed)}, peak {format_speed(peak_speed)}")
+        
+        ext, ffmpeg_args = plan_audio_output(fmt)
+        if ffmpeg_args:
+            tracker.description = f"Converting audio to {ext}..."
+            await tracker.update_progress(len(data), len(data), average_speed, 0, force=True)
+            with timed_stage(job_id, 'transcode') as span:
+                data = await pipe_audio(data, ffmpeg_args)
+                span['bytes'] = len(data)
     except Exception as e:
-        print(f"Error downloading subtitles: {e}")
+        if "DOWNLOAD_CANCELLED_BY_USER" in str(e) or user_id in download_cancellations:
+            try:
+                tracker.description = "Audio download cancelled"
+                await tracker.update_progress(0, 1, 0, 0, force=True)
+            except:
+                pass
+            raise ValueError("Download cancelled by user")
+        raise ValueError(f"Error downloading audio: {str(e)}")
+    
+    bio = BytesIO(data)
+    bio.name = f"{safe_title}.{quality_str}.{ext}"
+    return bio, safe_title, {'duration': int(info.get('duration') or 0)}
+
+async def download_subtitles(url: str, lang: str, safe_title: str) -> Optional[BytesIO]:
+    """Fetch a subtitle track as an in-memory SRT file.
+    
+    The track URL comes from the cached info dict and is fetched over the shared
+    HTTP session, so nothing is re-extracted or written to disk.
+    """
+    info = await extract_info(url)
+    track = pick_subtitle_track(info, lang)
+    if not track:
         return None
     
-    # Try different patterns to find the subtitle file
-    pattern = os.path.join(user_downloads_dir, f"{safe_title}.{sub_lang}.*")
-    matches = glob.glob(pattern)
+    try:
+        async with get_session().get(track['url'], headers=track.get('http_headers')) as response:
+            response.raise_for_status()
+            data = await response.read()
+    except Exception as e:
+        logger.error(f"Error downloading subtitles: {e}")
+        return None
     
-    if not matches:
-        pattern = os.path.join(user_downloads_dir, f"{safe_title}.*.{sub_lang}.*")
-        matches = glob.glob(pattern)
-        
-    if matches:
-        return matches[0]
-    else:
+    srt_text = convert_to_srt(data, track.get('ext'), track.get('automatic', False))
+    if not srt_text.strip():
         return None
+    
+    sub_lang = lang.split(" ")[0]
+    bio = BytesIO(srt_text.encode('utf-8'))
+    bio.name = f"{safe_title}.{sub_lang}.srt"
+    return bio
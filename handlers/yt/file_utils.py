@@ -1,7 +1,10 @@
 import os
 import re
+import glob
+import asyncio
 import aiofiles
 import aiofiles.os
+from typing import List, Optional
 from .constants import DOWNLOADS_DIR
 
 def sanitize_filename(filename: str) -> str:
@@ -20,6 +23,39 @@ async def safe_delete(filepath: str) -> None:
     except Exception as e:
         print(f"Error deleting file {filepath}: {e}")
 
+async def path_exists(filepath: str) -> bool:
+    """Check whether a file exists without blocking the event loop."""
+    return await aiofiles.os.path.exists(filepath)
+
+async def get_file_size(filepath: str) -> Optional[int]:
+    """Return a file's size, or None if it doesn't exist."""
+    try:
+        return await aiofiles.os.path.getsize(filepath)
+    except OSError:
+        return None
+
+async def replace_file(source: str, destination: str) -> None:
+    """Move a file over another without blocking the event loop."""
+    await aiofiles.os.replace(source, destination)
+
+async def glob_files(*patterns: str) -> List[str]:
+    """Expand several glob patterns in a single executor call, keeping order and dropping duplicates."""
+    def expand():
+        matches = []
+        for pattern in patterns:
+            for path in sorted(glob.glob(pattern)):
+                if path not in matches:
+                    matches.append(path)
+        return matches
+    return await asyncio.to_thread(expand)
+
+async def delete_matching(*patterns: str) -> int:
+    """Delete every file matching any of the patterns. Returns how many were deleted."""
+    matches = await glob_files(*patterns)
+    for path in matches:
+        await safe_delete(path)
+    return len(matches)
+
 async def get_user_downloads_dir(user_id: int) -> str:
     """Create and return a user-specific download directory."""
     user_dir = os.path.join(DOWNLOADS_DIR, str(user_id))
@@ -1,8 +1,15 @@
 import os
+import time
+import shutil
 import asyncio
 import yt_dlp
 from typing import Dict, List, Optional, Any, Tuple
-from .constants import COOKIES_FILE
+from .constants import COOKIES_FILE, DOWNLOAD_CONNECTIONS, HTTP_CHUNK_SIZE, EXTERNAL_DOWNLOADER, INFO_CACHE_TTL, INFO_CACHE_SIZE
+from .job_registry import normalize_url
+
+# Extracted info dicts by normalized URL, and extractions currently running
+info_cache = {}  # key -> (expires_at, info)
+info_in_flight = {}  # key -> Task
 
 def add_cookies_to_opts(opts: dict) -> dict:
     """Add cookies to yt-dlp options if cookie file exists."""
@@ -12,8 +19,66 @@ def add_cookies_to_opts(opts: dict) -> dict:
         opts['restrictfilenames'] = True
     return opts
 
+def add_download_tuning_opts(opts: dict, allow_external: bool = True) -> dict:
+    """Add multi-connection download options to yt-dlp options.
+    
+    Plain HTTP formats only get several connections through EXTERNAL_DOWNLOADER,
+    so without aria2c installed they are fetched over one connection.
+    """
+    # DASH/HLS formats are fetched as several fragments in parallel
+    opts.setdefault('concurrent_fragment_downloads', DOWNLOAD_CONNECTIONS)
+    # Plain HTTP formats are fetched as ranged chunks, which avoids per-connection throttling
+    opts.setdefault('http_chunk_size', HTTP_CHUNK_SIZE)
+    
+    # Hand plain HTTP formats to an external multi-connection downloader when it is installed.
+    # It writes segments out of order, so callers that read the file while it grows opt out.
+    if allow_external and EXTERNAL_DOWNLOADER and shutil.which(EXTERNAL_DOWNLOADER):
+        opts['external_downloader'] = {'http': EXTERNAL_DOWNLOADER}
+        if EXTERNAL_DOWNLOADER == 'aria2c':
+            opts['external_downloader_args'] = {'aria2c': [
+                '-x', str(DOWNLOAD_CONNECTIONS),
+                '-s', str(DOWNLOAD_CONNECTIONS),
+                '-k', '1M',
+                '--summary-interval=1',
+            ]}
+    return opts
+
 async def extract_info(url: str, download: bool = False) -> Dict[str, Any]:
-    """Extract video info using yt-dlp with error handling."""
+    """Extract video info using yt-dlp with error handling.
+    
+    Plain lookups are cached for INFO_CACHE_TTL and concurrent lookups of the
+    same video share one extraction.
+    """
+    if download:
+        return await _extract_info(url, download)
+    
+    key = normalize_url(url)
+    cached = info_cache.get(key)
+    if cached and cached[0] > time.time():
+        return cached[1]
+    
+    # The extraction runs in its own task, so a cancelled caller doesn't
+    # leave the others waiting on it forever
+    task = info_in_flight.get(key)
+    if task is None:
+        task = info_in_flight[key] = asyncio.create_task(_extract_shared(key, url))
+        # Nobody may be left waiting when it fails
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return await asyncio.shield(task)
+
+async def _extract_shared(key: str, url: str) -> Dict[str, Any]:
+    try:
+        info = await _extract_info(url)
+        if len(info_cache) >= INFO_CACHE_SIZE:
+            # Drop the entry closest to expiry
+            del info_cache[min(info_cache, key=lambda k: info_cache[k][0])]
+        info_cache[key] = (time.time() + INFO_CACHE_TTL, info)
+        return info
+    finally:
+        info_in_flight.pop(key, None)
+
+async def _extract_info(url: str, download: bool = False) -> Dict[str, Any]:
+    """Run one yt-dlp extraction in a worker thread."""
     try:
         with yt_dlp.YoutubeDL(add_cookies_to_opts({'quiet': True})) as ydl:
             return await asyncio.to_thread(ydl.extract_info, url, download)
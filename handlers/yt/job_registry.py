@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Any, Tuple
+from urllib.parse import urlparse, parse_qs, urlencode
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from .constants import active_jobs
+from .progress_service import progress_service
+from .stage_timing import new_job_id
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that never change which media a link points to
+TRACKING_PARAMS = {'si', 'feature', 'igshid', 'igsh', 'fbclid', 'pp', 'ab_channel'}
+YOUTUBE_HOSTS = {'youtube.com', 'music.youtube.com', 'youtube-nocookie.com'}
+
+def normalize_url(url: str) -> str:
+    """Reduce a media URL to a canonical form so equivalent links share a job."""
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    query = parse_qs(parsed.query)
+    path_parts = [part for part in parsed.path.split('/') if part]
+
+    # Every YouTube link shape collapses to the video id
+    if host in YOUTUBE_HOSTS:
+        if query.get('v'):
+            return f"youtube:{query['v'][0]}"
+        if len(path_parts) >= 2 and path_parts[0] in ('shorts', 'live', 'embed'):
+            return f"youtube:{path_parts[1]}"
+    if host == 'youtu.be' and path_parts:
+        return f"youtube:{path_parts[0]}"
+
+    # Everything else: drop the fragment and tracking params, sort the rest
+    kept = sorted(
+        (key, value)
+        for key, values in query.items()
+        if key not in TRACKING_PARAMS and not key.startswith('utm_')
+        for value in values
+    )
+    normalized = f"{host}/{'/'.join(path_parts)}"
+    if kept:
+        normalized += f"?{urlencode(kept)}"
+    return normalized
+
+def get_media_file_id(message) -> Optional[str]:
+    """Return the file_id of the media attached to a sent message."""
+    for attr in ('video', 'audio', 'document'):
+        media = getattr(message, attr, None)
+        if media:
+            return media.file_id
+    return None
+
+class DownloadJob:
+    """An in-flight download that later identical requests can attach to."""
+    def __init__(self, key: Tuple[str, str], owner_id: int, job_id: Optional[str] = None):
+        self.key = key
+        self.id = job_id or new_job_id()  # Ties this job's stage timings together
+        self.owner_id = owner_id
+        self.started_by = owner_id  # The download checks this user's cancellation flag
+        self.followers: List[Dict[str, Any]] = []
+        self.recipient: Optional[Dict[str, Any]] = None  # Follower that took over when the owner cancelled
+        self.tracker = None
+        self.transcode = None  # Remux/transcode decision recorded by the download step
+        self.upload_throughput = None  # Bytes per second achieved by the upload step
+        self.result = asyncio.get_running_loop().create_future()
+
+    def attach(self, chat_id, message_id, reply_to, user_id) -> Dict[str, Any]:
+        """Register another requester that wants the same file."""
+        follower = {
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'reply_to': reply_to,
+            'user_id': user_id,
+        }
+        self.followers.append(follower)
+        if self.tracker:
+            self.tracker.add_watcher(chat_id, message_id)
+        return follower
+
+    def set_tracker(self, tracker):
+        """Mirror a stage's progress tracker to every follower's status message."""
+        self.tracker = tracker
+        if self.recipient:
+            self._retarget(tracker)
+        for follower in self.followers:
+            tracker.add_watcher(follower['chat_id'], follower['message_id'])
+
+    def hand_over(self) -> Optional[Dict[str, Any]]:
+        """Make the first follower the job's owner when the owner cancels.
+
+        The download keeps running and its file goes to that follower instead.
+        Returns the new owner, or None when nobody else is waiting.
+        """
+        if not self.followers or self.result.done():
+            return None
+        self.recipient = self.followers.pop(0)
+        self.owner_id = self.recipient['user_id']
+        if self.tracker:
+            self._retarget(self.tracker)
+        logger.info(f"Shared download {self.key} was handed over to user {self.owner_id}")
+        return self.recipient
+
+    def _retarget(self, tracker):
+        cancel_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton("❌ Cancel Download", callback_data=f"cancel_{self.owner_id}")]
+        ])
+        tracker.retarget(self.recipient['chat_id'], self.recipient['message_id'], cancel_markup)
+
+    def destination(self, chat_id, message_id, reply_to) -> Tuple[Any, Any, Any]:
+        """Where to send the file and which status message to replace: the owner's
+        unless a follower took over. Call it right before sending."""
+        if not self.recipient:
+            return chat_id, message_id, reply_to
+        self.recipient['delivered'] = True
+        return self.recipient['chat_id'], self.recipient['message_id'], self.recipient['reply_to']
+
+    def finish(self, sent_message):
+        """Publish the uploaded message so followers can reuse its file."""
+        if not self.result.done():
+            self.result.set_result(sent_message)
+
+    def fail(self, error: Exception):
+        """Propagate a failure to every follower."""
+        if not self.result.done():
+            self.result.set_exception(error)
+            # Mark the exception as retrieved in case nobody is waiting
+            self.result.exception()
+
+def get_job(url: str, format_key: str) -> Optional[DownloadJob]:
+    """Return the in-flight job for this URL and format, if any."""
+    return active_jobs.get((normalize_url(url), format_key))
+
+def create_job(url: str, format_key: str, owner_id: int, job_id: Optional[str] = None) -> DownloadJob:
+    """Register a new job. Must be called without awaiting after get_job."""
+    key = (normalize_url(url), format_key)
+    job = DownloadJob(key, owner_id, job_id)
+    active_jobs[key] = job
+    return job
+
+def get_owned_job(user_id: int) -> Optional[DownloadJob]:
+    """Return the in-flight job this user started, if any."""
+    for job in active_jobs.values():
+        if job.owner_id == user_id and not job.result.done():
+            return job
+    return None
+
+def remove_job(job: DownloadJob) -> None:
+    """Drop a job from the registry once it has finished or failed."""
+    if active_jobs.get(job.key) is job:
+        del active_jobs[job.key]
+
+async def follow_job(client, job: DownloadJob, chat_id, message_id, reply_to, user_id) -> None:
+    """Wait for a shared job and deliver its uploaded file to another requester."""
+    follower = job.attach(chat_id, message_id, reply_to, user_id)
+    logger.info(f"User {user_id} attached to shared download {job.key} ({len(job.followers)} follower(s))")
+
+    try:
+        sent_message = await asyncio.shield(job.result)
+    except Exception as e:
+        progress_service.discard(chat_id, message_id)
+        if "cancelled" in str(e).lower() and follower is job.recipient:
+            await client.edit_message_text(chat_id, message_id, "❌ Download cancelled by user.")
+        elif "cancelled" in str(e).lower():
+            await client.edit_message_text(chat_id, message_id, "❌ The shared download was cancelled by its requester.")
+        else:
+            await client.edit_message_text(chat_id, message_id, f"Error: {str(e)}")
+        return
+
+    # The mirrored progress for this message is over
+    progress_service.discard(chat_id, message_id)
+    if follower.get('delivered'):
+        # This requester took over the job and the file was sent to them directly
+        return
+    file_id = get_media_file_id(sent_message)
+    if not file_id:
+        await client.edit_message_text(chat_id, message_id, "Error: Shared file is no longer available.")
+        return
+
+    await client.send_cached_media(
+        chat_id,
+        file_id,
+        caption=sent_message.caption,
+        reply_to_message_id=reply_to
+    )
+    await client.delete_messages(chat_id, message_id)
@@ -0,0 +1,174 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from pyrogram.errors import FloodWait, MessageNotModified
+from utils.outbound import send_priority, PRIORITY_PROGRESS
+from .constants import PROGRESS_MIN_INTERVAL, PROGRESS_CHAT_EDITS_PER_MINUTE, PROGRESS_GLOBAL_EDITS_PER_SECOND
+
+logger = logging.getLogger(__name__)
+
+class ProgressService:
+    """Single editor for every progress message.
+
+    Callers submit the latest rendered text for a message; only the newest text
+    per message is kept, and one worker edits messages as the per-chat and
+    global edit budgets allow. The more progress messages are active in a chat,
+    the longer each one waits between edits.
+    """
+    def __init__(self):
+        self.pending = {}       # (chat_id, message_id) -> (client, text, reply_markup)
+        self.last_text = {}     # (chat_id, message_id) -> last text shown
+        self.last_edit = {}     # (chat_id, message_id) -> time of the last edit
+        self.chat_edits = {}    # chat_id -> deque of recent edit times
+        self.global_edits = deque()
+        self.flood_until = {}   # chat_id -> time until which the chat is paused
+        self.in_flight = set()  # Messages with an edit currently being sent
+        self.wakeup = None
+        self.worker = None
+
+    def submit(self, client, chat_id, message_id, text, reply_markup=None):
+        """Queue the newest text for a message. Unchanged text is dropped."""
+        key = (chat_id, message_id)
+        if key not in self.pending and self.last_text.get(key) == text:
+            return
+        is_new = key not in self.pending
+        self.pending[key] = (client, text, reply_markup)
+        self._ensure_worker()
+        if is_new:
+            # Replacing queued text doesn't change when the message is due
+            self.wakeup.set()
+
+    async def send_now(self, client, chat_id, message_id, text, reply_markup=None):
+        """Edit a message right away (final states), unless its chat is flood-waiting."""
+        key = (chat_id, message_id)
+        self.pending.pop(key, None)
+        if self.last_text.get(key) == text:
+            return True
+        now = time.time()
+        if now < self.flood_until.get(chat_id, 0):
+            self.submit(client, chat_id, message_id, text, reply_markup)
+            return False
+        self.last_edit[key] = now
+        self._record_edit(chat_id, now)
+        return await self._edit(key, client, text, reply_markup)
+
+    def discard(self, chat_id, message_id):
+        """Forget a message, e.g. after it was deleted."""
+        key = (chat_id, message_id)
+        self.pending.pop(key, None)
+        self.last_text.pop(key, None)
+        self.last_edit.pop(key, None)
+
+    def _ensure_worker(self):
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+
+    def _interval(self, chat_id, now):
+        """Seconds between edits of one message, stretched by the number of active messages."""
+        recent = [key for key, edited in self.last_edit.items() if now - edited < 30]
+        active = set(recent) | set(self.pending)
+        in_chat = sum(1 for key in active if key[0] == chat_id)
+        return max(
+            PROGRESS_MIN_INTERVAL,
+            in_chat * 60 / PROGRESS_CHAT_EDITS_PER_MINUTE,
+            len(active) / PROGRESS_GLOBAL_EDITS_PER_SECOND
+        )
+
+    def _due_time(self, key, now):
+        chat_id = key[0]
+        due = max(
+            self.last_edit.get(key, 0) + self._interval(chat_id, now),
+            self.flood_until.get(chat_id, 0)
+        )
+        # Stay inside the rolling per-chat and global budgets
+        chat_edits = self.chat_edits.get(chat_id)
+        if chat_edits and len(chat_edits) >= PROGRESS_CHAT_EDITS_PER_MINUTE:
+            due = max(due, chat_edits[0] + 60)
+        if len(self.global_edits) >= PROGRESS_GLOBAL_EDITS_PER_SECOND:
+            due = max(due, self.global_edits[0] + 1)
+        return due
+
+    def _record_edit(self, chat_id, now):
+        chat_edits = self.chat_edits.setdefault(chat_id, deque())
+        chat_edits.append(now)
+        while chat_edits and now - chat_edits[0] > 60:
+            chat_edits.popleft()
+        self.global_edits.append(now)
+        while self.global_edits and now - self.global_edits[0] > 1:
+            self.global_edits.popleft()
+
+    async def _edit(self, key, client, text, reply_markup):
+        chat_id, message_id = key
+        try:
+            # Progress edits yield to command replies in the outbound scheduler
+            with send_priority(PRIORITY_PROGRESS):
+                await client.edit_message_text(chat_id, message_id, text, reply_markup=reply_markup)
+            self.last_text[key] = text
+            return True
+        except MessageNotModified:
+            self.last_text[key] = text
+            return True
+        except FloodWait as e:
+            # Only this chat pauses; the newest text is shown once the wait is over
+            self.flood_until[chat_id] = time.time() + e.value
+            self.pending.setdefault(key, (client, text, reply_markup))
+            logger.info(f"Progress updates in chat {chat_id} rate limited for {e.value}s")
+            return False
+        except Exception as e:
+            logger.debug(f"Failed to update progress message {key}: {e}")
+            return False
+
+    async def _edit_in_background(self, key, client, text, reply_markup):
+        self.in_flight.add(key)
+        try:
+            await self._edit(key, client, text, reply_markup)
+        finally:
+            self.in_flight.discard(key)
+            self.wakeup.set()
+
+    def _prune(self, now):
+        """Drop bookkeeping for messages that haven't been edited in a while."""
+        for key, edited in list(self.last_edit.items()):
+            if now - edited > 600 and key not in self.pending:
+                self.discard(*key)
+        for chat_id, until in list(self.flood_until.items()):
+            if until < now:
+                del self.flood_until[chat_id]
+        for chat_id, chat_edits in list(self.chat_edits.items()):
+            if not chat_edits or now - chat_edits[-1] > 60:
+                del self.chat_edits[chat_id]
+
+    async def _run(self):
+        while True:
+            try:
+                self.wakeup.clear()
+                now = time.time()
+                next_due = None
+                for key in list(self.pending):
+                    if key in self.in_flight:
+                        continue  # Picked up again once the current edit finishes
+                    due = self._due_time(key, now)
+                    if due <= now:
+                        # Edits run concurrently so one slow chat doesn't hold up the rest
+                        entry = self.pending.pop(key)
+                        self.last_edit[key] = now
+                        self._record_edit(key[0], now)
+                        asyncio.create_task(self._edit_in_background(key, *entry))
+                    else:
+                        next_due = due if next_due is None else min(next_due, due)
+
+                self._prune(now)
+                timeout = None if next_due is None else max(0.05, next_due - time.time())
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except Exception as e:
+                logger.error(f"Error in progress service: {e}")
+                await asyncio.sleep(1)
+
+# Shared by every download, stream and upload
+progress_service = ProgressService()
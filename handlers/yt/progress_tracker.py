@@ -1,87 +1,94 @@
 import time
 import logging
-from pyrogram.errors import FloodWait
 from .file_utils import format_bytes, format_speed, format_eta
+from .progress_service import progress_service
 
 logger = logging.getLogger(__name__)
 
 class ProgressTracker:
-    """Handles progress message updates with rate limiting and intelligent updates."""
+    """Renders progress for one job and hands it to the shared progress service."""
     def __init__(self, client, chat_id, message_id, description, reply_markup=None):
         self.client = client
         self.chat_id = chat_id
         self.message_id = message_id
         self.description = description
         self.reply_markup = reply_markup  # Store the reply markup (cancel button)
-        self.last_update_time = 0
         self.start_time = time.time()
-        self.flood_wait_until = 0
-        self.update_interval = 5  # Seconds between regular updates
-        self.min_progress_change = 1  # Minimum percentage change to trigger update
-        
+        self.watchers = []  # (chat_id, message_id) of requesters sharing this job
+        self.peak_speed = 0  # Highest reported speed, for bandwidth reporting
+        self.bytes_done = 0  # Highest reported byte count
+
+    def add_watcher(self, chat_id, message_id):
+        """Mirror progress updates to another status message (without the cancel button)."""
+        if (chat_id, message_id) not in self.watchers:
+            self.watchers.append((chat_id, message_id))
+
+    def retarget(self, chat_id, message_id, reply_markup=None):
+        """Move the main progress message, e.g. to a follower that took over the job,
+        with that owner's cancel button."""
+        progress_service.discard(self.chat_id, self.message_id)
+        if (chat_id, message_id) in self.watchers:
+            self.watchers.remove((chat_id, message_id))
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.reply_markup = reply_markup
+
+    def report(self, current, total, speed=None, eta=None):
+        """Queue a progress update. Cheap enough to call on every progress event."""
+        msg = self._render(current, total, speed, eta)
+        progress_service.submit(self.client, self.chat_id, self.message_id, msg, self.reply_markup)
+        for chat_id, message_id in self.watchers:
+            progress_service.submit(self.client, chat_id, message_id, msg)
+
     async def update_progress(self, current, total, speed=None, eta=None, force=False):
-        """Update progress message if conditions are met."""
-        current_time = time.time()
-        
-        # Skip update during flood wait period
-        if current_time < self.flood_wait_until:
-            return False
-        
-        # Calculate percentage for progress bar
-        percentage = 0
+        """Update the progress message; forced updates are sent right away."""
+        if not force:
+            self.report(current, total, speed, eta)
+            return True
+
+        msg = self._render(current, total, speed, eta)
+        sent = await progress_service.send_now(self.client, self.chat_id, self.message_id, msg, self.reply_markup)
+        for chat_id, message_id in self.watchers:
+            await progress_service.send_now(self.client, chat_id, message_id, msg)
+        return sent
+
+    def close(self):
+        """Stop editing this job's messages, e.g. once they were deleted."""
+        progress_service.discard(self.chat_id, self.message_id)
+        for chat_id, message_id in self.watchers:
+            progress_service.discard(chat_id, message_id)
+
+    def bandwidth_summary(self, total_bytes=None):
+        """Return (average, peak) throughput in bytes per second for this job."""
+        elapsed = time.time() - self.start_time
+        total = total_bytes if total_bytes is not None else self.bytes_done
+        average = total / elapsed if elapsed > 0 else 0
+        return average, self.peak_speed
+
+    def _render(self, current, total, speed, eta):
+        """Format the progress message text."""
+        if speed:
+            self.peak_speed = max(self.peak_speed, speed)
+        if current:
+            self.bytes_done = max(self.bytes_done, current)
+
+        speed_str = format_speed(speed) if speed else "Calculating..."
         if total and total > 0:
             percentage = min(100, (current / total) * 100)
-        
-        # Decide whether to update based on time passed or significant progress
-        time_since_update = current_time - self.last_update_time
-        should_update = force or (
-            time_since_update >= self.update_interval or 
-            (total > 0 and time_since_update >= 2 and (percentage >= 99 or percentage <= 1)) or
-            (self.last_update_time == 0)  # First update
+            progress_bar = self._get_progress_bar(percentage)
+            eta_str = format_eta(eta) if eta is not None else "Calculating..."
+            return (
+                f"{self.description}\n"
+                f"{progress_bar} {percentage:.1f}%\n"
+                f"{format_bytes(current)} / {format_bytes(total)}\n"
+                f"Speed: {speed_str} | ETA: {eta_str}"
+            )
+        return (
+            f"{self.description}\n"
+            f"Downloaded: {format_bytes(current)}\n"
+            f"Speed: {speed_str}"
         )
-        
-        if should_update:
-            # Format progress message
-            if total > 0:
-                progress_bar = self._get_progress_bar(percentage)
-                speed_str = format_speed(speed) if speed else "Calculating..."
-                eta_str = format_eta(eta) if eta is not None else "Calculating..."
-                
-                msg = (
-                    f"{self.description}\n"
-                    f"{progress_bar} {percentage:.1f}%\n"
-                    f"{format_bytes(current)} / {format_bytes(total)}\n"
-                    f"Speed: {speed_str} | ETA: {eta_str}"
-                )
-            else:
-                speed_str = format_speed(speed) if speed else "Calculating..."
-                msg = (
-                    f"{self.description}\n"
-                    f"Downloaded: {format_bytes(current)}\n"
-                    f"Speed: {speed_str}"
-                )
-            
-            try:
-                # Include the reply markup (cancel button) in the update
-                await self.client.edit_message_text(
-                    self.chat_id, 
-                    self.message_id, 
-                    msg, 
-                    reply_markup=self.reply_markup
-                )
-                self.last_update_time = current_time
-                return True
-            except FloodWait as e:
-                # Handle rate limiting
-                self.flood_wait_until = current_time + e.x
-                logger.info(f"Progress update rate limited for {e.x}s")
-                return False
-            except Exception as e:
-                logger.error(f"Failed to update progress: {e}")
-                return False
-        
-        return False
-    
+
     def _get_progress_bar(self, percentage, length=20):
         """Generate a text-based progress bar."""
         filled_length = int(length * percentage / 100)
@@ -0,0 +1,100 @@
+import math
+import time
+import uuid
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from .constants import STATS_WINDOW, STATS_MAX_SPANS
+from .file_utils import format_speed
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages in the order a request goes through them
+STAGES = ('extract', 'format_selection', 'queue_wait', 'download', 'transcode', 'upload', 'stream')
+
+# Finished spans, oldest first
+stage_spans = deque(maxlen=STATS_MAX_SPANS)
+
+def new_job_id() -> str:
+    """Short random ID tying together the spans of one /yt request."""
+    return uuid.uuid4().hex[:12]
+
+def record_span(job_id: Optional[str], stage: str, duration: float, nbytes: int = 0, ok: bool = True) -> Dict[str, Any]:
+    """Store one timed stage and log it as a structured line."""
+    nbytes = int(nbytes or 0)
+    throughput = nbytes / duration if nbytes and duration > 0 else 0
+    span = {
+        'job_id': job_id,
+        'stage': stage,
+        'ended': time.time(),
+        'duration': duration,
+        'bytes': nbytes,
+        'throughput': throughput,
+        'ok': ok,
+    }
+    stage_spans.append(span)
+    logger.info(
+        f"yt span job={job_id} stage={stage} ok={ok} duration={duration:.3f}s "
+        f"bytes={nbytes} throughput={format_speed(throughput)}"
+    )
+    return span
+
+@contextmanager
+def timed_stage(job_id: Optional[str], stage: str):
+    """Time the block as one stage of a job. Set span['bytes'] inside the block when known."""
+    span = {'bytes': 0}
+    start = time.monotonic()
+    ok = False
+    try:
+        yield span
+        ok = True
+    finally:
+        record_span(job_id, stage, time.monotonic() - start, span['bytes'], ok)
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    rank = math.ceil(percent / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+def stage_stats(window: int = STATS_WINDOW) -> Dict[str, Dict[str, Any]]:
+    """Duration and throughput percentiles per stage over the last window seconds."""
+    cutoff = time.time() - window
+    grouped = {}
+    for span in stage_spans:
+        if span['ended'] >= cutoff:
+            grouped.setdefault(span['stage'], []).append(span)
+
+    stats = {}
+    for stage, spans in grouped.items():
+        succeeded = [span for span in spans if span['ok']]
+        durations = sorted(span['duration'] for span in succeeded)
+        throughputs = sorted(span['throughput'] for span in succeeded if span['throughput'])
+        stats[stage] = {
+            'count': len(succeeded),
+            'failed': len(spans) - len(succeeded),
+            'duration': {p: _percentile(durations, p) for p in (50, 90, 99)} if durations else None,
+            'throughput': {p: _percentile(throughputs, p) for p in (50, 90)} if throughputs else None,
+        }
+    return stats
+
+def render_stage_stats(window: int = STATS_WINDOW) -> str:
+    """Format stage percentiles for the /ytstats command."""
+    stats = stage_stats(window)
+    if not stats:
+        return f"No /yt activity in the last {window // 60} minutes."
+
+    lines = [f"📊 /yt stage timings, last {window // 60} minutes"]
+    for stage in sorted(stats, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+        entry = stats[stage]
+        line = f"\n{stage}: {entry['count']} ok"
+        if entry['failed']:
+            line += f", {entry['failed']} failed"
+        if entry['duration']:
+            duration = entry['duration']
+            line += f"\n  p50 {duration[50]:.2f}s | p90 {duration[90]:.2f}s | p99 {duration[99]:.2f}s"
+        if entry['throughput']:
+            throughput = entry['throughput']
+            line += f"\n  throughput p50 {format_speed(throughput[50])} | p90 {format_speed(throughput[90])}"
+        lines.append(line)
+    return "\n".join(lines)
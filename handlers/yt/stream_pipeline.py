@@ -0,0 +1,257 @@
+import os
+import time
+import asyncio
+import logging
+import yt_dlp
+import aiofiles
+import aiofiles.os
+from typing import Dict, Optional, Any, AsyncIterator
+from .constants import MAX_FILESIZE, STREAMING_PIPELINE_ENABLED, STREAMING_MIN_SIZE, UPLOAD_PART_SIZE, download_cancellations
+from .format_utils import add_cookies_to_opts, add_download_tuning_opts, extract_info
+from .file_utils import sanitize_filename, get_user_downloads_dir, safe_delete, format_speed
+from .progress_tracker import ProgressTracker
+from .upload_manager import StreamingUploader, send_uploaded_video
+from .stage_timing import record_span
+from .transcode import requires_h264, is_h264, generate_thumbnail
+
+logger = logging.getLogger(__name__)
+
+class StreamingUnavailable(Exception):
+    """Raised when a job can't be pipelined and should use the regular path."""
+
+def can_stream(url: str, selected: Dict[str, Any]) -> bool:
+    """Decide whether a selected video option is worth pipelining."""
+    if not STREAMING_PIPELINE_ENABLED:
+        return False
+    # Videos that need a full H.264 re-encode can't be stream-copied
+    if requires_h264(url) and not is_h264(selected['format'].get('vcodec')):
+        return False
+    size = selected.get('total_size') or 0
+    if size < STREAMING_MIN_SIZE or size > MAX_FILESIZE:
+        return False
+    if selected['stream_type'] == "Progressive":
+        return selected['format'].get('ext') == 'mp4'
+    # ffmpeg reads adaptive streams directly, so they must be plain HTTP(S) files
+    return bool(selected['format'].get('url')) and selected['format'].get('protocol') in ('http', 'https')
+
+def pick_stream_audio(info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Pick the audio stream to mux with an adaptive video, preferring AAC in m4a."""
+    audio_formats = [
+        fmt for fmt in info.get('formats', [])
+        if fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none')
+        and fmt.get('url') and fmt.get('protocol') in ('http', 'https')
+    ]
+    if not audio_formats:
+        return None
+    return max(audio_formats, key=lambda f: (f.get('ext') == 'm4a', f.get('abr') or 0))
+
+def _ffmpeg_input_args(fmt: Dict[str, Any]) -> list:
+    """Build the ffmpeg arguments for one remote input, including its HTTP headers."""
+    args = []
+    headers = fmt.get('http_headers') or {}
+    if headers:
+        args += ['-headers', ''.join(f"{key}: {value}\r\n" for key, value in headers.items())]
+    return args + ['-i', fmt['url']]
+
+async def _tail_file(path: str, finished: asyncio.Event, user_id) -> AsyncIterator[bytes]:
+    """Yield bytes from a file while another task is still writing it."""
+    while not await aiofiles.os.path.exists(path):
+        if finished.is_set():
+            return
+        await asyncio.sleep(0.2)
+
+    async with aiofiles.open(path, 'rb') as f:
+        while True:
+            if user_id in download_cancellations:
+                raise ValueError("Download cancelled by user")
+            chunk = await f.read(UPLOAD_PART_SIZE)
+            if chunk:
+                yield chunk
+                continue
+            if finished.is_set():
+                # Drain whatever landed between the last read and completion
+                chunk = await f.read()
+                if chunk:
+                    yield chunk
+                return
+            await asyncio.sleep(0.25)
+
+async def _progressive_source(url: str, fmt: Dict[str, Any], path: str, user_id) -> AsyncIterator[bytes]:
+    """Download a progressive format with yt-dlp and yield its bytes as they arrive."""
+    finished = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    stop_requested = False  # Set when the consumer stops reading early
+
+    def progress_hook(d):
+        if user_id in download_cancellations or stop_requested:
+            raise Exception("DOWNLOAD_CANCELLED_BY_USER")
+
+    ydl_opts = add_cookies_to_opts(add_download_tuning_opts({
+        'format': fmt['format_id'],
+        'outtmpl': path,
+        'nopart': True,        # Write straight to the final file so it can be tailed
+        'continuedl': False,
+        'max_filesize': MAX_FILESIZE,
+        'progress_hooks': [progress_hook],
+        'quiet': True,
+    }, allow_external=False))
+
+    def run_download():
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.download([url])
+        finally:
+            loop.call_soon_threadsafe(finished.set)
+
+    await safe_delete(path)
+    download_task = asyncio.create_task(asyncio.to_thread(run_download))
+    try:
+        async for chunk in _tail_file(path, finished, user_id):
+            yield chunk
+        await download_task
+    except Exception as e:
+        if "DOWNLOAD_CANCELLED_BY_USER" in str(e):
+            raise ValueError("Download cancelled by user")
+        raise
+    finally:
+        if not download_task.done():
+            stop_requested = True
+            try:
+                await download_task
+            except Exception:
+                pass
+
+async def _adaptive_source(video_fmt: Dict[str, Any], audio_fmt: Dict[str, Any], user_id) -> AsyncIterator[bytes]:
+    """Fetch and remux video and audio with ffmpeg into fragmented MP4 on stdout."""
+    audio_codec = ['-c:a', 'copy'] if audio_fmt.get('ext') == 'm4a' else ['-c:a', 'aac', '-b:a', '128k']
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        *_ffmpeg_input_args(video_fmt),
+        *_ffmpeg_input_args(audio_fmt),
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c:v', 'copy', *audio_codec,
+        # Fragmented MP4 puts the moov box first, so the output can be streamed
+        '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+        '-f', 'mp4', 'pipe:1',
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        while True:
+            if user_id in download_cancellations:
+                raise ValueError("Download cancelled by user")
+            chunk = await process.stdout.read(UPLOAD_PART_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        return_code = await process.wait()
+        if return_code != 0:
+            error = (await process.stderr.read()).decode(errors='ignore').strip()
+            raise StreamingUnavailable(f"ffmpeg exited with code {return_code}: {error[-300:]}")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+async def stream_video(url: str, selected: Dict[str, Any], client, chat_id, message_id,
+                       reply_to, user_id, cancel_markup=None, job=None):
+    """Download, remux and upload a video in one overlapped pipeline.
+
+    Raises StreamingUnavailable before anything is sent if the job has to fall
+    back to the regular download-then-upload path. Failures after the first
+    part went out are raised as they are, falling back would repeat the download.
+    """
+    info = await extract_info(url)
+    video_fmt = selected['format']
+    resolution = selected['resolution']
+    safe_title = sanitize_filename(info.get("title", "video"))
+    file_name = f"{safe_title} - {resolution}.mp4"
+    expected_size = selected.get('total_size') or 0
+    duration = int(info.get('duration') or 0)
+    user_downloads_dir = await get_user_downloads_dir(user_id)
+    base_path = os.path.join(user_downloads_dir, f"{safe_title} - {resolution}")
+
+    tracker = ProgressTracker(client, chat_id, message_id, f"Streaming {resolution}: {safe_title}", cancel_markup)
+    if job:
+        job.set_tracker(tracker)
+    start_time = time.time()
+
+    async def progress(uploaded):
+        elapsed = time.time() - start_time
+        speed = uploaded / elapsed if elapsed > 0 else 0
+        eta = (expected_size - uploaded) / speed if speed > 0 and expected_size > uploaded else None
+        tracker.report(uploaded, expected_size, speed, eta)
+
+    stream_path = None
+    if selected['stream_type'] == "Progressive":
+        stream_path = f"{base_path}.stream.mp4"
+        source = _progressive_source(url, video_fmt, stream_path, user_id)
+    else:
+        audio_fmt = pick_stream_audio(info)
+        if not audio_fmt:
+            raise StreamingUnavailable("No streamable audio format")
+        source = _adaptive_source(video_fmt, audio_fmt, user_id)
+
+    # The thumbnail is grabbed from the remote format while the stream runs
+    thumb_task = asyncio.create_task(generate_thumbnail(base_path, duration, _ffmpeg_input_args(video_fmt)))
+    try:
+        uploader = StreamingUploader(client, file_name, progress)
+        try:
+            async with uploader:
+                async for chunk in source:
+                    await uploader.write(chunk)
+                    if uploader.bytes_queued > MAX_FILESIZE:
+                        raise ValueError("File size exceeds Telegram's limit of 2 GB.")
+                input_file = await uploader.finish()
+        except Exception as e:
+            if "cancelled" in str(e).lower():
+                raise
+            if uploader.parts_queued:
+                # Parts already went out, a fallback would start the whole download over
+                if isinstance(e, StreamingUnavailable):
+                    raise ValueError(f"Streaming failed: {e}") from e
+                raise
+            if isinstance(e, StreamingUnavailable):
+                raise
+            raise StreamingUnavailable(str(e)) from e
+        finally:
+            # Fallbacks and errors rewrite the status message, so drop queued progress
+            tracker.close()
+            await source.aclose()
+            if stream_path:
+                await safe_delete(stream_path)
+
+        elapsed = time.time() - start_time
+        throughput = uploader.bytes_sent / elapsed if elapsed > 0 else 0
+        logger.info(
+            f"Streamed {file_name} ({uploader.bytes_sent} bytes, {uploader.parts_sent} parts) "
+            f"in {elapsed:.1f}s at {format_speed(throughput)}"
+        )
+        if job:
+            job.upload_throughput = throughput
+        # Download, remux and upload overlap here, so they are timed as one stage
+        record_span(job.id if job else None, 'stream', elapsed, uploader.bytes_sent)
+
+        thumb_path = await thumb_task
+        thumb = await client.save_file(thumb_path) if thumb_path else None
+        if job:
+            chat_id, message_id, reply_to = job.destination(chat_id, message_id, reply_to)
+        sent_message = await send_uploaded_video(
+            client,
+            chat_id,
+            input_file,
+            file_name,
+            f"{safe_title} [{resolution}]",
+            reply_to,
+            duration=duration,
+            width=video_fmt.get('width'),
+            height=video_fmt.get('height'),
+            thumb=thumb
+        )
+    finally:
+        # Let ffmpeg finish so its thumbnail can be cleaned up
+        thumb_path = (await asyncio.gather(thumb_task, return_exceptions=True))[0]
+        if isinstance(thumb_path, str):
+            await safe_delete(thumb_path)
+    await client.delete_messages(chat_id, message_id)
+    return sent_message
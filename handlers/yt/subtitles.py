@@ -0,0 +1,93 @@
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# Track formats we can turn into SRT, in order of preference. Automatic captions
+# prefer json3, whose events don't repeat the rolling lines their VTT does
+SUPPORTED_SUBTITLE_EXTS = ('srt', 'vtt', 'json3')
+AUTOMATIC_CAPTION_EXTS = ('json3', 'srt', 'vtt')
+
+def pick_subtitle_track(info: Dict[str, Any], lang: str) -> Optional[Dict[str, Any]]:
+    """Find the best convertible track for a language in an info dict.
+
+    Languages shown as "xx (auto-generated)" come from the automatic captions.
+    Tracks taken from the automatic captions are returned with 'automatic' set.
+    """
+    if "auto-generated" in lang:
+        sources = [(info.get('automatic_captions') or {}, True)]
+        lang = lang.split(" ")[0]
+    else:
+        sources = [(info.get('subtitles') or {}, False), (info.get('automatic_captions') or {}, True)]
+
+    for source, automatic in sources:
+        tracks = [track for track in source.get(lang) or [] if track.get('url')]
+        for ext in AUTOMATIC_CAPTION_EXTS if automatic else SUPPORTED_SUBTITLE_EXTS:
+            for track in tracks:
+                if track.get('ext') == ext:
+                    return dict(track, automatic=automatic)
+    return None
+
+def _format_srt_time(milliseconds: int) -> str:
+    hours, rest = divmod(int(milliseconds), 3600000)
+    minutes, rest = divmod(rest, 60000)
+    seconds, millis = divmod(rest, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{millis:03d}"
+
+def _parse_vtt_time(value: str) -> int:
+    """Convert a WebVTT timestamp (mm:ss.ttt or hh:mm:ss.ttt) to milliseconds."""
+    parts = value.strip().replace(',', '.').split(':')
+    seconds = float(parts[-1])
+    minutes = int(parts[-2]) if len(parts) > 1 else 0
+    hours = int(parts[-3]) if len(parts) > 2 else 0
+    return int(round((hours * 3600 + minutes * 60 + seconds) * 1000))
+
+def _build_srt(cues: List[Tuple[int, int, List[str]]]) -> str:
+    blocks = []
+    for index, (start, end, lines) in enumerate(cues, 1):
+        blocks.append(f"{index}\n{_format_srt_time(start)} --> {_format_srt_time(end)}\n" + "\n".join(lines))
+    return "\n\n".join(blocks) + "\n"
+
+def vtt_to_srt(text: str, rolling: bool = False) -> str:
+    """Convert WebVTT to SRT, dropping styling tags.
+
+    rolling drops the repeats of automatic captions, where each cue starts with
+    the previous cue's line. Manual tracks are converted cue for cue.
+    """
+    cues = []
+    previous_lines = []
+    for block in re.split(r'\n\s*\n', text.replace('\r\n', '\n')):
+        lines = block.strip().split('\n')
+        for i, line in enumerate(lines):
+            if '-->' not in line:
+                continue
+            start, end = line.split('-->', 1)
+            body = [re.sub(r'<[^>]+>', '', body_line).strip() for body_line in lines[i + 1:]]
+            body = [body_line for body_line in body if body_line and not (rolling and body_line in previous_lines)]
+            if body:
+                cues.append((_parse_vtt_time(start), _parse_vtt_time(end.split()[0]), body))
+                previous_lines = body
+            break
+    return _build_srt(cues)
+
+def json3_to_srt(text: str) -> str:
+    """Convert YouTube's json3 caption format to SRT."""
+    cues = []
+    for event in json.loads(text).get('events', []):
+        segments = event.get('segs')
+        if not segments:
+            continue
+        caption = ''.join(segment.get('utf8', '') for segment in segments).strip()
+        if not caption:
+            continue
+        start = event.get('tStartMs', 0)
+        cues.append((start, start + event.get('dDurationMs', 0), caption.split('\n')))
+    return _build_srt(cues)
+
+def convert_to_srt(data: bytes, ext: str, automatic: bool = False) -> str:
+    """Turn a downloaded subtitle track into SRT text."""
+    text = data.decode('utf-8', errors='replace')
+    if ext == 'vtt':
+        return vtt_to_srt(text, rolling=automatic)
+    if ext == 'json3':
+        return json3_to_srt(text)
+    return text
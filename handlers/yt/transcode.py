@@ -0,0 +1,211 @@
+import re
+import json
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, List, Optional, Any, Tuple
+from .file_utils import format_bytes
+
+logger = logging.getLogger(__name__)
+
+# Recent transcode decisions, used to track CPU spent per delivered byte
+transcode_stats = deque(maxlen=200)
+
+# Pure copy: container change only, no decoding at all
+COPY_ARGS = ['-c', 'copy', '-avoid_negative_ts', 'make_zero', '-movflags', '+faststart']
+# Audio-only transcode: keep the video stream, convert audio to AAC
+AUDIO_ARGS = ['-c:v', 'copy', '-c:a', 'aac', '-b:a', '128k', '-avoid_negative_ts', 'make_zero', '-movflags', '+faststart']
+# Full transcode to H.264, for targets that can't play other video codecs (Instagram → WhatsApp)
+FULL_VIDEO_ARGS = [
+    '-c:v', 'libx264',      # Re-encode video with H.264
+    '-preset', 'ultrafast', # Fastest encoding (less compression but faster)
+    '-crf', '28',           # Higher CRF for smaller files
+    '-profile:v', 'main',   # Main profile instead of baseline
+    '-level', '4.0',        # Higher level for better compression
+    '-pix_fmt', 'yuv420p',
+    '-maxrate', '2M',       # Limit bitrate to 2Mbps
+    '-bufsize', '4M',       # Buffer size
+    '-movflags', '+faststart',
+]
+
+def is_h264(vcodec: Optional[str]) -> bool:
+    """Check whether a codec string describes H.264 video."""
+    return bool(vcodec) and (vcodec.startswith('avc') or 'h264' in vcodec)
+
+def is_aac(acodec: Optional[str]) -> bool:
+    """Check whether a codec string describes AAC audio."""
+    return bool(acodec) and (acodec.startswith('mp4a') or 'aac' in acodec)
+
+def requires_h264(url: str) -> bool:
+    """Instagram videos are re-encoded to H.264 for WhatsApp compatibility."""
+    return 'instagram.com' in url.lower() or 'instagr.am' in url.lower()
+
+def plan_transcode(url: str, vcodec: Optional[str], acodec: Optional[str], container: Optional[str] = 'mp4') -> Dict[str, Any]:
+    """Pick the cheapest ffmpeg pipeline that yields a valid MP4 for this job.
+
+    Returns a dict with the mode ('copy', 'audio' or 'full'), the reason, the
+    ffmpeg arguments, and whether ffmpeg has to run at all.
+    """
+    has_audio = acodec not in (None, 'none')
+    audio_ok = not has_audio or is_aac(acodec)
+    video_ok = is_h264(vcodec) or not requires_h264(url)
+
+    if not video_ok:
+        mode = 'full'
+        reason = f"video codec {vcodec or 'unknown'} must become H.264"
+        args = FULL_VIDEO_ARGS + (['-c:a', 'copy'] if audio_ok else ['-c:a', 'aac', '-b:a', '128k'])
+    elif not audio_ok:
+        mode = 'audio'
+        reason = f"audio codec {acodec} must become AAC"
+        args = AUDIO_ARGS
+    else:
+        mode = 'copy'
+        reason = f"{vcodec or 'video'} + {acodec or 'no audio'} can be stream-copied"
+        args = COPY_ARGS
+
+    return {
+        'mode': mode,
+        'reason': reason,
+        'ffmpeg_args': args,
+        # A single MP4 that only needs copying is already deliverable as-is
+        'needs_ffmpeg': mode != 'copy' or container != 'mp4',
+    }
+
+def plan_audio_output(fmt: Dict[str, Any]) -> Tuple[str, Optional[List[str]]]:
+    """Pick the extension an audio format is sent as, and the ffmpeg arguments to get there.
+
+    m4a is sent as it is and opus is only remuxed into ogg; anything else becomes
+    MP3. The arguments are None when no ffmpeg run is needed.
+    """
+    if fmt.get('ext') == 'm4a':
+        return 'm4a', None
+    if fmt.get('acodec') == 'opus':
+        return 'ogg', ['-c:a', 'copy', '-f', 'ogg']
+    return 'mp3', ['-c:a', 'libmp3lame', '-b:a', '192k', '-f', 'mp3']
+
+async def probe_codecs(path: str) -> Tuple[Optional[str], Optional[str]]:
+    """Read the first video and audio codec names of a file with ffprobe."""
+    process = await asyncio.create_subprocess_exec(
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'stream=codec_type,codec_name',
+        '-of', 'json', path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        return None, None
+
+    vcodec = acodec = None
+    for stream in json.loads(stdout or b'{}').get('streams', []):
+        if stream.get('codec_type') == 'video' and vcodec is None:
+            vcodec = stream.get('codec_name')
+        elif stream.get('codec_type') == 'audio' and acodec is None:
+            acodec = stream.get('codec_name')
+    return vcodec, acodec or 'none'
+
+async def probe_video_metadata(path: str) -> Dict[str, int]:
+    """Read duration, width and height of a video file with ffprobe."""
+    process = await asyncio.create_subprocess_exec(
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height:format=duration',
+        '-of', 'json', path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        return {}
+
+    data = json.loads(stdout or b'{}')
+    stream = (data.get('streams') or [{}])[0]
+    return {
+        'duration': int(float(data.get('format', {}).get('duration') or 0)),
+        'width': stream.get('width') or 0,
+        'height': stream.get('height') or 0,
+    }
+
+async def generate_thumbnail(path: str, duration: int = 0, input_args: Optional[List[str]] = None) -> Optional[str]:
+    """Grab a frame as a JPEG thumbnail within Telegram's 320px limit. Returns its path.
+
+    input_args replace '-i path' to read the frame from a remote source; the
+    thumbnail is still written next to path.
+    """
+    thumb_path = f"{path}.thumb.jpg"
+    # A frame a little into the video is more representative than the first one
+    offset = min(duration * 0.1, 30) if duration else 0
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+        '-ss', f"{offset:.2f}", *(input_args or ['-i', path]),
+        '-frames:v', '1',
+        '-vf', 'scale=320:320:force_original_aspect_ratio=decrease',
+        '-q:v', '5',
+        thumb_path,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    await process.wait()
+    return thumb_path if process.returncode == 0 else None
+
+async def run_ffmpeg(inputs: List[str], output_path: str, plan: Dict[str, Any]) -> float:
+    """Run ffmpeg for a plan and return the CPU seconds it used."""
+    input_args = []
+    for path in inputs:
+        input_args += ['-i', path]
+    # Merges take video from the first input and audio from the second
+    map_args = ['-map', '0:v:0', '-map', '1:a:0'] if len(inputs) > 1 else []
+
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-y', '-hide_banner', '-nostats', '-loglevel', 'info', '-benchmark',
+        *input_args,
+        *map_args,
+        *plan['ffmpeg_args'],
+        output_path,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+    output = stderr.decode(errors='ignore')
+    if process.returncode != 0:
+        raise ValueError(f"ffmpeg failed ({plan['mode']}): {output.strip()[-300:]}")
+
+    # -benchmark reports the process's own user and system CPU time
+    match = re.search(r'bench: utime=([\d.]+)s stime=([\d.]+)s', output)
+    return float(match.group(1)) + float(match.group(2)) if match else 0.0
+
+def record_transcode(plan: Dict[str, Any], cpu_seconds: float, output_bytes: int, job=None) -> Dict[str, Any]:
+    """Store a job's transcode decision and its CPU cost per delivered byte."""
+    record = {
+        'job': job.key if job else None,
+        'mode': plan['mode'],
+        'reason': plan['reason'],
+        'ran_ffmpeg': plan['needs_ffmpeg'],
+        'cpu_seconds': cpu_seconds,
+        'output_bytes': output_bytes,
+        'cpu_seconds_per_mb': cpu_seconds / (output_bytes / (1024 * 1024)) if output_bytes else 0.0,
+    }
+    transcode_stats.append(record)
+    if job:
+        job.transcode = record
+    logger.info(
+        f"Transcode decision: {plan['mode']} ({plan['reason']}), "
+        f"{cpu_seconds:.2f}s CPU for {format_bytes(output_bytes)}"
+    )
+    return record
+
+async def pipe_audio(data: bytes, ffmpeg_args: List[str]) -> bytes:
+    """Convert audio held in memory through ffmpeg's stdin and stdout."""
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error',
+        '-i', 'pipe:0', '-vn',
+        *ffmpeg_args,
+        'pipe:1',
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate(data)
+    if process.returncode != 0:
+        raise ValueError(f"ffmpeg audio pipe failed: {stderr.decode(errors='ignore').strip()[-300:]}")
+    return stdout
@@ -1,69 +1,244 @@
 import os
 import time
+import asyncio
+import logging
+from io import BytesIO
+from pyrogram import raw, types, utils
+from pyrogram.session import Session
+from .constants import UPLOAD_PART_SIZE, STREAM_UPLOAD_WORKERS
 from .progress_tracker import ProgressTracker
+from .file_utils import get_file_size, safe_delete, format_speed
+from .stage_timing import record_span
 
-async def upload_file_with_progress(client, chat_id, message_id, file_path, caption, reply_to):
-    """Upload a file with progress updates."""
-    file_size = os.path.getsize(file_path)
+logger = logging.getLogger(__name__)
+
+class StreamingUploader:
+    """Upload a byte stream of unknown final size as Telegram big file parts.
+
+    Every part except the last is sent with file_total_parts=-1, the last one
+    carries the real part count, so parts can go out while the source is still
+    being produced. Like Pyrogram's save_file, parts are sent by several workers
+    over a dedicated media session. Use it as an async context manager.
+    """
+    def __init__(self, client, file_name, progress=None):
+        self.client = client
+        self.file_name = file_name
+        self.progress = progress  # async callable(uploaded_bytes)
+        self.file_id = client.rnd_id()
+        self.parts_queued = 0
+        self.bytes_queued = 0
+        self.parts_sent = 0
+        self.bytes_sent = 0
+        self._buffer = bytearray()
+        self._pending = None  # Last full part, held back until we know if it is the final one
+        self._queue = asyncio.Queue(STREAM_UPLOAD_WORKERS)
+        self._session = None
+        self._workers = []
+        self._error = None  # First failed part, raised to the writer
+
+    async def __aenter__(self):
+        storage = self.client.storage
+        self._session = Session(
+            self.client, await storage.dc_id(), await storage.auth_key(),
+            await storage.test_mode(), is_media=True
+        )
+        await self._session.start()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(STREAM_UPLOAD_WORKERS)]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await self._session.stop()
+
+    async def _worker(self):
+        while True:
+            part, chunk, total_parts = await self._queue.get()
+            try:
+                # After a failure the remaining parts are only drained
+                if self._error is None:
+                    await self._session.invoke(
+                        raw.functions.upload.SaveBigFilePart(
+                            file_id=self.file_id,
+                            file_part=part,
+                            file_total_parts=total_parts,
+                            bytes=bytes(chunk)
+                        )
+                    )
+                    self.parts_sent += 1
+                    self.bytes_sent += len(chunk)
+                    if self.progress:
+                        await self.progress(self.bytes_sent)
+            except Exception as e:
+                self._error = self._error or e
+            finally:
+                self._queue.task_done()
+
+    async def _send_part(self, chunk, total_parts=-1):
+        if self._error is not None:
+            raise self._error
+        await self._queue.put((self.parts_queued, chunk, total_parts))
+        self.parts_queued += 1
+        self.bytes_queued += len(chunk)
+
+    async def write(self, data: bytes):
+        """Queue bytes from the source and upload every completed part."""
+        self._buffer.extend(data)
+        while len(self._buffer) >= UPLOAD_PART_SIZE:
+            part = self._buffer[:UPLOAD_PART_SIZE]
+            del self._buffer[:UPLOAD_PART_SIZE]
+            if self._pending is not None:
+                await self._send_part(self._pending)
+            self._pending = part
+
+    async def finish(self):
+        """Flush the remaining bytes, wait for every part and return the InputFileBig for sending."""
+        remaining = [part for part in (self._pending, self._buffer) if part]
+        if not remaining:
+            raise ValueError("Nothing was uploaded")
+        total_parts = self.parts_queued + len(remaining)
+        for part in remaining[:-1]:
+            await self._send_part(part)
+        await self._send_part(remaining[-1], total_parts)
+        await self._queue.join()
+        if self._error is not None:
+            raise self._error
+        return raw.types.InputFileBig(id=self.file_id, parts=total_parts, name=self.file_name)
+
+async def send_uploaded_video(client, chat_id, input_file, file_name, caption, reply_to,
+                              duration=0, width=0, height=0, thumb=None):
+    """Send an already uploaded video file and return the parsed message."""
+    media = raw.types.InputMediaUploadedDocument(
+        mime_type="video/mp4",
+        file=input_file,
+        thumb=thumb,
+        attributes=[
+            raw.types.DocumentAttributeVideo(
+                supports_streaming=True,
+                duration=duration or 0,
+                w=width or 0,
+                h=height or 0
+            ),
+            raw.types.DocumentAttributeFilename(file_name=file_name)
+        ]
+    )
+    reply_to = await utils.get_reply_to(client=client, chat_id=chat_id, reply_to_message_id=reply_to)
+    r = await client.invoke(
+        raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=media,
+            reply_to=reply_to,
+            random_id=client.rnd_id(),
+            **await utils.parse_text_entities(client, caption, None, None)
+        )
+    )
+    for update in r.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(
+                client,
+                update.message,
+                {user.id: user for user in r.users},
+                {chat.id: chat for chat in r.chats}
+            )
+    return None
+
+async def _get_upload_size(file_path) -> int:
+    """Size of a file on disk or of an in-memory BytesIO."""
+    if isinstance(file_path, BytesIO):
+        return file_path.getbuffer().nbytes
+    return await get_file_size(file_path) or 0
+
+async def send_media_file(client, chat_id, file_path, caption, reply_to, metadata=None, progress=None):
+    """Send a downloaded file with the sender that fits its type and return the message.
+    
+    Known metadata is passed along so Telegram doesn't have to process the file.
+    """
+    metadata = metadata or {}
+    # In-memory files carry their name on the BytesIO
+    file_name = getattr(file_path, 'name', file_path)
+    
+    # Determine file type and use appropriate sender
+    # Pyrogram's save_file uploads big files with several workers on a dedicated media
+    # session, so large uploads don't compete with bot traffic on the main one
+    if file_name.endswith('.mp4'):
+        sent_message = await client.send_video(
+            chat_id,
+            video=file_path,
+            caption=caption,
+            reply_to_message_id=reply_to,
+            supports_streaming=True,
+            duration=metadata.get('duration') or 0,
+            width=metadata.get('width') or 0,
+            height=metadata.get('height') or 0,
+            thumb=metadata.get('thumb'),
+            progress=progress
+        )
+    elif file_name.endswith(('.mp3', '.m4a', '.ogg')):
+        sent_message = await client.send_audio(
+            chat_id,
+            audio=file_path,
+            caption=caption,
+            reply_to_message_id=reply_to,
+            duration=metadata.get('duration') or 0,
+            progress=progress
+        )
+    else:
+        sent_message = await client.send_document(
+            chat_id,
+            document=file_path,
+            caption=caption,
+            reply_to_message_id=reply_to,
+            progress=progress
+        )
+    return sent_message
+
+async def upload_file_with_progress(client, chat_id, message_id, file_path, caption, reply_to, job=None, metadata=None):
+    """Upload a file with progress updates and return the sent message.
+    
+    file_path may also be a named BytesIO for files that were never written to disk.
+    metadata holds the video's duration, width, height and thumbnail path when
+    the download step already knows them.
+    """
+    file_size = await _get_upload_size(file_path)
+    metadata = metadata or {}
+    if job:
+        chat_id, message_id, reply_to = job.destination(chat_id, message_id, reply_to)
     tracker = ProgressTracker(client, chat_id, message_id, "Uploading file...")
+    if job:
+        job.set_tracker(tracker)
     
-    # Create a custom callback to update progress during upload
+    # Every callback goes to the progress service, which decides when to edit
     upload_start_time = time.time()
-    last_update_time = 0
-    last_bytes = 0
-    min_bytes_change = 3 * 1024 * 1024  # 3MB minimum change
     
     async def progress_callback(current, total):
-        nonlocal last_update_time, last_bytes
-        current_time = time.time()
-        bytes_change = abs(current - last_bytes)
-        
-        # More conservative update strategy - update every 5 seconds or after 3MB
-        if (current_time - last_update_time >= 5 or 
-            bytes_change >= min_bytes_change or
-            current == total):  # Final update
-            
-            last_update_time = current_time
-            last_bytes = current
-            elapsed = current_time - upload_start_time
-            speed = current / elapsed if elapsed > 0 else 0
-            remaining = (total - current) / speed if speed > 0 else None
-            
-            await tracker.update_progress(current, total, speed, remaining)
+        elapsed = time.time() - upload_start_time
+        speed = current / elapsed if elapsed > 0 else 0
+        remaining = (total - current) / speed if speed > 0 else None
+        tracker.report(current, total, speed, remaining)
     
     try:
-        # Determine file type and use appropriate sender
-        if file_path.endswith('.mp4'):
-            await client.send_video(
-                chat_id,
-                video=file_path,
-                caption=caption,
-                reply_to_message_id=reply_to,
-                supports_streaming=True,
-                progress=progress_callback
-            )
-        elif file_path.endswith('.mp3'):
-            await client.send_audio(
-                chat_id,
-                audio=file_path,
-                caption=caption,
-                reply_to_message_id=reply_to,
-                progress=progress_callback
-            )
-        else:
-            await client.send_document(
-                chat_id,
-                document=file_path,
-                caption=caption,
-                reply_to_message_id=reply_to,
-                progress=progress_callback
-            )
+        sent_message = await send_media_file(client, chat_id, file_path, caption, reply_to, metadata, progress_callback)
+        
+        elapsed = time.time() - upload_start_time
+        throughput = file_size / elapsed if elapsed > 0 else 0
+        logger.info(f"Uploaded {os.path.basename(getattr(file_path, 'name', file_path))} ({file_size} bytes) in {elapsed:.1f}s at {format_speed(throughput)}")
+        if job:
+            job.upload_throughput = throughput
+        record_span(job.id if job else None, 'upload', elapsed, file_size)
+        
         # Delete the status message after successful upload
+        tracker.close()
         await client.delete_messages(chat_id, message_id)
+        return sent_message
     except Exception as e:
+        tracker.close()
         await client.edit_message_text(
             chat_id, 
             message_id, 
             f"Error during upload: {str(e)}"
         )
         raise e
+    finally:
+        if metadata.get('thumb'):
+            await safe_delete(metadata['thumb'])
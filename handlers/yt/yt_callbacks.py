@@ -1,13 +1,39 @@
 import os
+import time
 import asyncio
-from io import BytesIO
+import logging
 from pyrogram import Client
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from .constants import active_downloads, download_locks, MAX_FILESIZE, download_cancellations
+from .constants import active_downloads, download_locks, MAX_FILESIZE, download_cancellations, disk_reservations
 from .format_utils import extract_info
-from .download_manager import download_video, download_audio_by_format, download_subtitles
+from .download_manager import (
+    download_video, download_audio_by_format, download_audio_to_memory, audio_fits_in_memory, download_subtitles
+)
 from .upload_manager import upload_file_with_progress
-from .file_utils import safe_delete
+from .file_utils import safe_delete, get_file_size
+from .job_registry import get_job, get_owned_job, create_job, remove_job, follow_job
+from .stream_pipeline import can_stream, stream_video, StreamingUnavailable
+from .download_journal import journal_start, journal_finish, get_pending_downloads
+from .disk_quota import check_admission, wait_for_space, reserve_space, release_space
+from .stage_timing import record_span
+from .progress_service import progress_service
+
+logger = logging.getLogger(__name__)
+
+async def _admit_download(edit, user_id, expected_size) -> bool:
+    """Reserve disk space for a download, queueing while other downloads hold it.
+    
+    edit shows a status text to the user, e.g. the status message's edit method.
+    """
+    admitted, reason = await check_admission(user_id, expected_size)
+    if not admitted and disk_reservations:
+        await edit("⏳ Waiting for disk space held by other downloads...")
+        admitted, reason = await wait_for_space(user_id, expected_size)
+    if not admitted:
+        await edit(f"❌ Can't start this download: {reason}.")
+        return False
+    reserve_space(user_id, expected_size)
+    return True
 
 async def yt_quality_button(client: Client, callback_query):
     """Handle video quality selection callback."""
@@ -28,6 +54,8 @@ async def yt_quality_button(client: Client, callback_query):
         if user_id not in download_locks:
             download_locks[user_id] = asyncio.Lock()
         
+        # Time spent waiting for the user's lock and for disk space
+        queued_at = time.monotonic()
         async with download_locks[user_id]:
             if user_id in active_downloads:
                 await callback_query.message.edit(f"⚠️ You already have an active download in progress:\n\n{active_downloads[user_id]}\n\nPlease wait for it to complete before starting a new one.")
@@ -48,74 +76,154 @@ async def yt_quality_button(client: Client, callback_query):
             video_format_id = selected['format'].get('format_id')
             stream_type = selected['stream_type']
             
-            await callback_query.message.edit(f"⏳ Fetching video metadata for {resolution} download...")
-            
-            try:
-                info = await extract_info(video_url)
-                video_title = info.get('title', 'Unknown video')
-                active_downloads[user_id] = f"{video_title} [{resolution}]"
-            except Exception as e:
-                await callback_query.message.edit(f"❌ Error fetching video information: {str(e)}")
+            # Attach to an identical download that is already in flight
+            job = get_job(video_url, video_format_id)
+            if not job:
+                if not await _admit_download(callback_query.message.edit, user_id, selected.get('total_size') or 0):
+                    return
+                # The same download may have started while this one waited for disk space
+                job = get_job(video_url, video_format_id)
+                if job:
+                    release_space(user_id)
+            if job:
+                active_downloads[user_id] = f"Shared download [{resolution}]"
+                try:
+                    await callback_query.message.edit(f"🔗 This video is already being downloaded in {resolution}, joining that download...")
+                    await follow_job(
+                        client,
+                        job,
+                        callback_query.message.chat.id,
+                        callback_query.message.id,
+                        yt_data.get('original_msg_id'),
+                        user_id
+                    )
+                finally:
+                    active_downloads.pop(user_id, None)
                 return
             
-            await callback_query.message.edit(f"⚙️ Initializing download for {resolution} quality...\n{video_title}")
-            
-            # Add cancel button
-            cancel_button = InlineKeyboardMarkup([
-                [InlineKeyboardButton("❌ Cancel Download", callback_data=f"cancel_{user_id}")]
-            ])
+            job = create_job(video_url, video_format_id, user_id, yt_data.get('job_id'))
+            record_span(job.id, 'queue_wait', time.monotonic() - queued_at)
             
             try:
-                # Update message with cancel button - this will be preserved during progress updates
-                await callback_query.message.edit(
-                    f"⬇️ Starting download: {video_title} [{resolution}]",
-                    reply_markup=cancel_button
-                )
+                await callback_query.message.edit(f"⏳ Fetching video metadata for {resolution} download...")
                 
-                filename, safe_title = await download_video(
-                    video_url, 
-                    video_format_id, 
-                    best_audio, 
-                    stream_type, 
-                    resolution,
-                    client,
-                    callback_query.message.chat.id,
-                    callback_query.message.id,
-                    user_id,
-                    cancel_button  # Pass the cancel button to download_video
-                )
-                
-                if os.path.exists(filename):
-                    file_size = os.path.getsize(filename)
-                    if file_size > MAX_FILESIZE:
-                        await callback_query.message.edit(f"Error: File size ({file_size/(1024*1024):.1f} MB) exceeds Telegram's limit of 2 GB.")
-                        await safe_delete(filename)
-                        return
-                else:
-                    await callback_query.message.edit("Error: Downloaded file not found.")
+                try:
+                    info = await extract_info(video_url)
+                    video_title = info.get('title', 'Unknown video')
+                    active_downloads[user_id] = f"{video_title} [{resolution}]"
+                except Exception as e:
+                    await callback_query.message.edit(f"❌ Error fetching video information: {str(e)}")
+                    job.fail(e)
                     return
                 
-                await upload_file_with_progress(
-                    client,
+                await callback_query.message.edit(f"⚙️ Initializing download for {resolution} quality...\n{video_title}")
+                
+                # Add cancel button
+                cancel_button = InlineKeyboardMarkup([
+                    [InlineKeyboardButton("❌ Cancel Download", callback_data=f"cancel_{user_id}")]
+                ])
+                
+                journal_id = await journal_start(
+                    'video',
+                    video_url,
+                    video_format_id,
+                    resolution,
+                    user_id,
                     callback_query.message.chat.id,
                     callback_query.message.id,
-                    filename,
-                    f"{safe_title} [{resolution}]",
-                    yt_data.get('original_msg_id')
+                    yt_data.get('original_msg_id'),
+                    stream_type=stream_type,
+                    audio_format_id=best_audio.get('format_id') if best_audio else None
                 )
                 
-                await safe_delete(filename)
-                
-            except Exception as e:
-                if "cancelled" in str(e).lower():
-                    await callback_query.message.edit("❌ Download cancelled by user.")
-                else:
-                    await callback_query.message.edit(f"Error: {str(e)}")
+                try:
+                    # Update message with cancel button - this will be preserved during progress updates
+                    await callback_query.message.edit(
+                        f"⬇️ Starting download: {video_title} [{resolution}]",
+                        reply_markup=cancel_button
+                    )
+                    
+                    # Large videos are uploaded while they download when possible
+                    sent_message = None
+                    if can_stream(video_url, selected):
+                        try:
+                            sent_message = await stream_video(
+                                video_url,
+                                selected,
+                                client,
+                                callback_query.message.chat.id,
+                                callback_query.message.id,
+                                yt_data.get('original_msg_id'),
+                                user_id,
+                                cancel_button,
+                                job
+                            )
+                        except StreamingUnavailable as e:
+                            logger.warning(f"Streaming pipeline unavailable, falling back to regular download: {e}")
+                    
+                    if sent_message is None:
+                        filename, safe_title, metadata = await download_video(
+                            video_url, 
+                            video_format_id, 
+                            best_audio, 
+                            stream_type, 
+                            resolution,
+                            client,
+                            callback_query.message.chat.id,
+                            callback_query.message.id,
+                            user_id,
+                            cancel_button,  # Pass the cancel button to download_video
+                            job,
+                            journal_id
+                        )
+                        
+                        file_size = await get_file_size(filename)
+                        if file_size is None:
+                            await callback_query.message.edit("Error: Downloaded file not found.")
+                            return
+                        if file_size > MAX_FILESIZE:
+                            await callback_query.message.edit(f"Error: File size ({file_size/(1024*1024):.1f} MB) exceeds Telegram's limit of 2 GB.")
+                            await safe_delete(filename)
+                            if metadata.get('thumb'):
+                                await safe_delete(metadata['thumb'])
+                            return
+                        
+                        sent_message = await upload_file_with_progress(
+                            client,
+                            callback_query.message.chat.id,
+                            callback_query.message.id,
+                            filename,
+                            f"{safe_title} [{resolution}]",
+                            yt_data.get('original_msg_id'),
+                            job,
+                            metadata
+                        )
+                        
+                        await safe_delete(filename)
+                    
+                    job.finish(sent_message)
+                    
+                except asyncio.CancelledError:
+                    # The bot is shutting down: keep the journal entry so the download resumes on restart
+                    journal_id = None
+                    raise
+                except Exception as e:
+                    job.fail(e)
+                    if "cancelled" in str(e).lower():
+                        await callback_query.message.edit("❌ Download cancelled by user.")
+                    else:
+                        await callback_query.message.edit(f"Error: {str(e)}")
+                finally:
+                    if user_id in active_downloads:
+                        del active_downloads[user_id]
+                    # Clean up cancellation state
+                    download_cancellations.pop(user_id, None)
+                    await journal_finish(journal_id)
             finally:
-                if user_id in active_downloads:
-                    del active_downloads[user_id]
-                # Clean up cancellation state
-                download_cancellations.pop(user_id, None)
+                # Followers still waiting get an error if we bailed out early
+                job.fail(ValueError("The shared download did not complete."))
+                remove_job(job)
+                release_space(user_id)
             
     except Exception as e:
         if 'user_id' in locals() and user_id in active_downloads:
@@ -142,6 +250,8 @@ async def yt_audio_button(client: Client, callback_query):
         if user_id not in download_locks:
             download_locks[user_id] = asyncio.Lock()
         
+        # Time spent waiting for the user's lock and for disk space
+        queued_at = time.monotonic()
         async with download_locks[user_id]:
             if user_id in active_downloads:
                 await callback_query.message.edit(f"⚠️ You already have an active download in progress:\n\n{active_downloads[user_id]}\n\nPlease wait for it to complete before starting a new one.")
@@ -167,69 +277,160 @@ async def yt_audio_button(client: Client, callback_query):
                 await callback_query.message.edit("Session expired. Please use /yt command again.")
                 return
             
-            info = await extract_info(video_url)
-            audio_title = info.get('title', 'Unknown audio')
-            active_downloads[user_id] = f"{audio_title} - {selected['abr']} kbps (audio)"
-            
             audio_format_id = selected["format"].get("format_id")
             quality_str = f"{selected['abr']}kbps"
+            job_format = f"audio-{audio_format_id}"
+            
+            # Attach to an identical download that is already in flight
+            job = get_job(video_url, job_format)
+            # Small audio never touches disk, so it needs no disk reservation
+            in_memory = audio_fits_in_memory(selected["format"])
+            if not job and not in_memory:
+                if not await _admit_download(callback_query.message.edit, user_id, selected.get('filesize') or 0):
+                    return
+                # The same download may have started while this one waited for disk space
+                job = get_job(video_url, job_format)
+                if job:
+                    release_space(user_id)
+            if job:
+                active_downloads[user_id] = f"Shared audio download [{selected['abr']} kbps]"
+                try:
+                    await callback_query.message.edit(f"🔗 This audio is already being downloaded at {selected['abr']} kbps, joining that download...")
+                    await follow_job(
+                        client,
+                        job,
+                        callback_query.message.chat.id,
+                        callback_query.message.id,
+                        original_msg_id,
+                        user_id
+                    )
+                finally:
+                    active_downloads.pop(user_id, None)
+                return
             
-            await callback_query.message.edit(f"⚙️ Initializing audio download: {selected['abr']} kbps\n{audio_title}")
-            
-            # Add cancel button
-            cancel_button = InlineKeyboardMarkup([
-                [InlineKeyboardButton("❌ Cancel Download", callback_data=f"cancel_{user_id}")]
-            ])
+            job = create_job(video_url, job_format, user_id, main_data.get('job_id'))
+            record_span(job.id, 'queue_wait', time.monotonic() - queued_at)
             
             try:
-                # Update message with cancel button - this will be preserved during progress updates
-                await callback_query.message.edit(
-                    f"⬇️ Starting download: {audio_title} [{selected['abr']} kbps]",
-                    reply_markup=cancel_button
-                )
+                info = await extract_info(video_url)
+                audio_title = info.get('title', 'Unknown audio')
+                active_downloads[user_id] = f"{audio_title} - {selected['abr']} kbps (audio)"
                 
-                filename, safe_title = await download_audio_by_format(
-                    video_url, 
-                    audio_format_id, 
-                    quality_str, 
-                    client, 
-                    callback_query.message.chat.id, 
-                    callback_query.message.id,
-                    user_id,
-                    cancel_button  # Pass the cancel button to download_audio_by_format
-                )
+                await callback_query.message.edit(f"⚙️ Initializing audio download: {selected['abr']} kbps\n{audio_title}")
                 
-                if not os.path.exists(filename):
-                    await callback_query.message.edit("Error: Downloaded file not found.")
-                    return
+                # Add cancel button
+                cancel_button = InlineKeyboardMarkup([
+                    [InlineKeyboardButton("❌ Cancel Download", callback_data=f"cancel_{user_id}")]
+                ])
+                
+                # Only disk downloads are journaled, in-memory audio leaves nothing to resume
+                journal_id = None
+                
+                try:
+                    # Update message with cancel button - this will be preserved during progress updates
+                    await callback_query.message.edit(
+                        f"⬇️ Starting download: {audio_title} [{selected['abr']} kbps]",
+                        reply_markup=cancel_button
+                    )
+                    
+                    in_memory_audio = None
+                    if in_memory:
+                        in_memory_audio = await download_audio_to_memory(
+                            video_url,
+                            audio_format_id,
+                            quality_str,
+                            client,
+                            callback_query.message.chat.id,
+                            callback_query.message.id,
+                            user_id,
+                            cancel_button,
+                            job
+                        )
+                    if in_memory_audio:
+                        bio, safe_title, metadata = in_memory_audio
+                        sent_message = await upload_file_with_progress(
+                            client,
+                            callback_query.message.chat.id,
+                            callback_query.message.id,
+                            bio,
+                            f"{safe_title} - {selected['abr']} kbps",
+                            original_msg_id,
+                            job,
+                            metadata
+                        )
+                        job.finish(sent_message)
+                        return
+                    if in_memory and not await _admit_download(callback_query.message.edit, user_id, selected.get('filesize') or 0):
+                        return
+                    
+                    journal_id = await journal_start(
+                        'audio',
+                        video_url,
+                        audio_format_id,
+                        quality_str,
+                        user_id,
+                        callback_query.message.chat.id,
+                        callback_query.message.id,
+                        original_msg_id
+                    )
+                    
+                    filename, safe_title = await download_audio_by_format(
+                        video_url, 
+                        audio_format_id, 
+                        quality_str, 
+                        client, 
+                        callback_query.message.chat.id, 
+                        callback_query.message.id,
+                        user_id,
+                        cancel_button,  # Pass the cancel button to download_audio_by_format
+                        job,
+                        journal_id
+                    )
+                    
+                    file_size = await get_file_size(filename)
+                    if file_size is None:
+                        await callback_query.message.edit("Error: Downloaded file not found.")
+                        return
+                        
+                    if file_size > MAX_FILESIZE:
+                        await callback_query.message.edit(f"Error: File size ({file_size/(1024*1024):.1f} MB) exceeds Telegram's limit.")
+                        await safe_delete(filename)
+                        return
+                        
+                    sent_message = await upload_file_with_progress(
+                        client,
+                        callback_query.message.chat.id,
+                        callback_query.message.id,
+                        filename,
+                        f"{safe_title} - {selected['abr']} kbps",
+                        original_msg_id,
+                        job
+                    )
+                    job.finish(sent_message)
                     
-                file_size = os.path.getsize(filename)
-                if file_size > MAX_FILESIZE:
-                    await callback_query.message.edit(f"Error: File size ({file_size/(1024*1024):.1f} MB) exceeds Telegram's limit.")
                     await safe_delete(filename)
-                    return
                     
-                await upload_file_with_progress(
-                    client,
-                    callback_query.message.chat.id,
-                    callback_query.message.id,
-                    filename,
-                    f"{safe_title} - {selected['abr']} kbps",
-                    original_msg_id
-                )
-                
-                await safe_delete(filename)
-                
-            except Exception as e:
-                if "cancelled" in str(e).lower():
-                    await callback_query.message.edit("❌ Download cancelled by user.")
-                else:
-                    await callback_query.message.edit(f"Error: {str(e)}")
+                except asyncio.CancelledError:
+                    # The bot is shutting down: keep the journal entry so the download resumes on restart
+                    journal_id = None
+                    raise
+                except Exception as e:
+                    job.fail(e)
+                    if "cancelled" in str(e).lower():
+                        await callback_query.message.edit("❌ Download cancelled by user.")
+                    else:
+                        await callback_query.message.edit(f"Error: {str(e)}")
+                finally:
+                    if user_id in active_downloads:
+                        del active_downloads[user_id]
+                    # Clean up cancellation state
+                    download_cancellations.pop(user_id, None)
+                    await journal_finish(journal_id)
             finally:
-                if user_id in active_downloads:
-                    del active_downloads[user_id]
-                # Clean up cancellation state
-                download_cancellations.pop(user_id, None)
+                # Followers still waiting get an error if we bailed out early
+                job.fail(ValueError("The shared download did not complete."))
+                remove_job(job)
+                release_space(user_id)
             
     except Exception as e:
         if 'user_id' in locals() and user_id in active_downloads:
@@ -267,24 +468,12 @@ async def yt_subs_callback(client: Client, callback_query):
         await callback_query.message.edit(f"Downloading subtitles for language: {lang}...")
         
         try:
-            filename = await download_subtitles(video_url, lang, safe_title, user_id)
+            bio = await download_subtitles(video_url, lang, safe_title)
             
-            if not filename or not os.path.exists(filename):
+            if bio is None:
                 await callback_query.message.edit(f"Error: Subtitles for {lang} not available or could not be downloaded.")
                 return
             
-            file_size = os.path.getsize(filename)
-            if file_size == 0:
-                await callback_query.message.edit(f"Error: Downloaded subtitle file is empty.")
-                await safe_delete(filename)
-                return
-            
-            with open(filename, "rb") as f:
-                file_bytes = f.read()
-                
-            bio = BytesIO(file_bytes)
-            bio.name = os.path.basename(filename)
-            
             await client.send_document(
                 chat_id=callback_query.message.chat.id,
                 document=bio,
@@ -292,7 +481,6 @@ async def yt_subs_callback(client: Client, callback_query):
                 reply_to_message_id=original_msg_id,
             )
             
-            await safe_delete(filename)
             await callback_query.message.delete()
             
         except Exception as e:
@@ -301,6 +489,114 @@ async def yt_subs_callback(client: Client, callback_query):
     except Exception as e:
         await callback_query.message.edit(f"An unexpected error occurred: {str(e)}")
 
+async def _resume_download(client: Client, entry):
+    """Re-run a journaled download, reusing the partial files it left behind."""
+    user_id = entry['user_id']
+    chat_id = entry['chat_id']
+    message_id = entry['message_id']
+    url = entry['url']
+    quality = entry['quality']
+    is_audio = entry['kind'] == 'audio'
+    job_format = f"audio-{entry['format_id']}" if is_audio else entry['format_id']
+    journal_id = entry['job_id']
+    
+    active_downloads[user_id] = f"Resumed download [{quality}]"
+    job = create_job(url, job_format, user_id)
+    
+    cancel_button = InlineKeyboardMarkup([
+        [InlineKeyboardButton("❌ Cancel Download", callback_data=f"cancel_{user_id}")]
+    ])
+    
+    try:
+        try:
+            await client.edit_message_text(chat_id, message_id, "♻️ Resuming interrupted download...", reply_markup=cancel_button)
+        except Exception:
+            # The status message is gone, post a new one
+            status = await client.send_message(
+                chat_id,
+                "♻️ Resuming interrupted download...",
+                reply_to_message_id=entry['reply_to'],
+                reply_markup=cancel_button
+            )
+            message_id = status.id
+        
+        # Resumed downloads hold disk space like new ones, minus what is already on disk
+        info = await extract_info(url)
+        formats = {f.get('format_id'): f for f in info.get('formats', [])}
+        def format_size(format_id):
+            fmt = formats.get(format_id) or {}
+            return fmt.get('filesize') or fmt.get('filesize_approx') or 0
+        expected_size = format_size(entry['format_id']) + (0 if is_audio else format_size(entry['audio_format_id']))
+        
+        async def edit_status(text):
+            await client.edit_message_text(chat_id, message_id, text)
+        if not await _admit_download(edit_status, user_id, max(expected_size - (entry['bytes_done'] or 0), 0)):
+            return
+        
+        if is_audio:
+            filename, safe_title = await download_audio_by_format(
+                url, entry['format_id'], quality, client, chat_id, message_id,
+                user_id, cancel_button, job, journal_id
+            )
+            caption = f"{safe_title} - {quality.replace('kbps', ' kbps')}"
+            metadata = None
+        else:
+            best_audio = formats.get(entry['audio_format_id'])
+            filename, safe_title, metadata = await download_video(
+                url, entry['format_id'], best_audio, entry['stream_type'], quality, client,
+                chat_id, message_id, user_id, cancel_button, job, journal_id
+            )
+            caption = f"{safe_title} [{quality}]"
+        
+        if await get_file_size(filename) is None:
+            await client.edit_message_text(chat_id, message_id, "Error: Downloaded file not found.")
+            return
+        
+        sent_message = await upload_file_with_progress(
+            client, chat_id, message_id, filename, caption, entry['reply_to'], job, metadata
+        )
+        job.finish(sent_message)
+        await safe_delete(filename)
+        
+    except asyncio.CancelledError:
+        journal_id = None
+        raise
+    except Exception as e:
+        job.fail(e)
+        logger.warning(f"Resumed download {entry['job_id']} failed: {e}")
+        try:
+            if "cancelled" in str(e).lower():
+                await client.edit_message_text(chat_id, message_id, "❌ Download cancelled by user.")
+            else:
+                await client.edit_message_text(chat_id, message_id, f"Error: {str(e)}")
+        except Exception:
+            pass
+    finally:
+        active_downloads.pop(user_id, None)
+        download_cancellations.pop(user_id, None)
+        job.fail(ValueError("The shared download did not complete."))
+        remove_job(job)
+        release_space(user_id)
+        await journal_finish(journal_id)
+
+async def resume_pending_downloads(client: Client):
+    """Resume downloads that were interrupted by a restart, dropping stale ones."""
+    try:
+        entries = await get_pending_downloads()
+    except Exception as e:
+        logger.error(f"Failed to read the download journal: {e}")
+        return
+    
+    for entry in entries:
+        if entry['stale'] or entry['user_id'] in active_downloads:
+            for path in entry['partial_paths']:
+                await safe_delete(path)
+            await journal_finish(entry['job_id'])
+            continue
+        
+        logger.info(f"Resuming {entry['kind']} download {entry['job_id']} ({entry['bytes_done']} bytes already on disk)")
+        asyncio.create_task(_resume_download(client, entry))
+
 async def ignore_callback(client: Client, callback_query):
     """Handle ignore callback for header buttons."""
     await callback_query.answer("This is just a header, not a button.")
@@ -319,8 +615,15 @@ async def cancel_download_callback(client: Client, callback_query):
             await callback_query.answer("❌ You can only cancel your own downloads.", show_alert=True)
             return
         
-        # Mark download for cancellation
-        download_cancellations[user_id] = True
+        # Others are waiting for the same file: let one of them take the download over
+        job = get_owned_job(user_id)
+        if job and job.hand_over():
+            progress_service.discard(callback_query.message.chat.id, callback_query.message.id)
+            await callback_query.message.edit("❌ Download cancelled. It keeps running for the other users who requested it.")
+            return
+        
+        # Mark download for cancellation, under the user a handed over download still runs as
+        download_cancellations[job.started_by if job else user_id] = True
         
         # Update the message to show cancellation is in progress
         await callback_query.message.edit("⏳ Cancelling download, please wait...")
@@ -1,12 +1,13 @@
-import os
-import time
 import logging
 from pyrogram import Client, types
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from utils.usage import save_usage
 from .constants import active_downloads, DOWNLOADS_DIR
 from .format_utils import extract_info, list_video_options, list_audio_options
-from .file_utils import sanitize_filename
+from .file_utils import sanitize_filename, format_bytes
+from .disk_quota import check_admission, run_janitor
+from .batch import run_batch, is_playlist_url
+from .stage_timing import new_job_id, timed_stage, render_stage_stats
 
 logger = logging.getLogger(__name__)
 
@@ -25,20 +26,33 @@ async def yt_command(client: Client, message: types.Message):
     args = message_text.split()[1:]
     
     if not args:
-        await message.reply('Usage: /yt [video url] (+ "subs" if wanted)')
+        await message.reply('Usage: /yt [video url] (+ "subs" if wanted)\nBatch: /yt [playlist url or several urls] (+ "audio" for audio only)')
         return
 
     subs_requested = "subs" in [arg.lower() for arg in args]
-    video_url = None
-    for arg in args:
-        if arg.startswith("http"):
-            video_url = arg
-            break
+    audio_requested = "audio" in [arg.lower() for arg in args]
+    urls = [arg for arg in args if arg.startswith("http")]
+    video_url = urls[0] if urls else None
 
     if not video_url:
         await message.reply("No valid video URL provided.")
         return
 
+    # Refuse early when the downloads directory can't take another job
+    admitted, reason = await check_admission(user_id)
+    if not admitted:
+        await message.reply(f"⚠️ Downloads are unavailable right now: {reason}. Please try again later.")
+        return
+    
+    # Playlists and several links are handled as one batch
+    if not subs_requested and (len(urls) > 1 or is_playlist_url(video_url)):
+        status_msg = await message.reply("📦 Preparing batch download...")
+        try:
+            await run_batch(client, message.chat.id, status_msg.id, message.id, user_id, urls, audio_requested)
+        except Exception as e:
+            await status_msg.edit(f"Error: {str(e)}")
+        return
+
     if subs_requested:
         status_msg = await message.reply("Fetching subtitle info, please wait...")
         try:
@@ -90,7 +104,13 @@ async def yt_command(client: Client, message: types.Message):
     status_msg = await message.reply("Fetching video info, please wait...")
     
     try:
-        info, video_options, best_audio = await list_video_options(video_url)
+        job_id = new_job_id()
+        with timed_stage(job_id, 'extract'):
+            await extract_info(video_url)
+        # The info is cached now, so this times only picking the formats
+        with timed_stage(job_id, 'format_selection'):
+            info, video_options, best_audio = await list_video_options(video_url)
+            audio_options = await list_audio_options(video_url)
         
         if not hasattr(client, 'user_data'):
             client.user_data = {}
@@ -102,6 +122,7 @@ async def yt_command(client: Client, message: types.Message):
             'best_audio': best_audio,
             'message_id': status_msg.id,
             'original_msg_id': message.id,
+            'job_id': job_id,
         }
         
         buttons = []
@@ -114,7 +135,6 @@ async def yt_command(client: Client, message: types.Message):
             button_text = f"{resolution} ({stream_type}, {size_str})"
             buttons.append([InlineKeyboardButton(button_text, callback_data=f"yt_{i}")])
         
-        audio_options = await list_audio_options(video_url)
         if audio_options:
             buttons.append([InlineKeyboardButton("🎵 Audio Options:", callback_data="ignore")])
             for i, option in enumerate(audio_options):
@@ -133,32 +153,25 @@ async def yt_command(client: Client, message: types.Message):
         await status_msg.edit(f"Error: {str(e)}")
 
 async def cleanup_downloads(client: Client, message: types.Message):
-    """Admin command to clean up old downloads."""
+    """Admin command to run the download janitor now."""
     if not await is_admin_or_owner(client, message.from_user.id):
         await message.reply("You don't have permission to use this command.")
         return
     
     try:
-        cutoff_time = time.time() - 86400  # 24 hours
-        deleted_count = 0
-        
-        for user_dir in os.listdir(DOWNLOADS_DIR):
-            user_path = os.path.join(DOWNLOADS_DIR, user_dir)
-            if not os.path.isdir(user_path):
-                continue
-                
-            for file in os.listdir(user_path):
-                file_path = os.path.join(user_path, file)
-                if os.path.isfile(file_path):
-                    file_time = os.path.getmtime(file_path)
-                    if file_time < cutoff_time:
-                        os.remove(file_path)
-                        deleted_count += 1
-        
-        await message.reply(f"Cleanup complete. Deleted {deleted_count} old files.")
+        result = await run_janitor()
+        await message.reply(f"Cleanup complete. Deleted {result['deleted']} files ({format_bytes(result['freed'])}).")
     except Exception as e:
         await message.reply(f"Error during cleanup: {str(e)}")
 
+async def yt_stats(client: Client, message: types.Message):
+    """Admin command showing per-stage /yt timing percentiles."""
+    if not await is_admin_or_owner(client, message.from_user.id):
+        await message.reply("You don't have permission to use this command.")
+        return
+    
+    await message.reply(render_stage_stats())
+
 async def is_admin_or_owner(client: Client, user_id):
     """Check if user is an admin or the bot owner."""
     try:
@@ -3,11 +3,16 @@ import logging.config
 import asyncio
 import sys
 from pyrogram import Client
+from utils.outbound import OutboundClient
+from utils.http import init_session, close_session
 from utils.command_registry import register_handlers
 from utils.logger import LOGGING_CONFIG
-from config import BOT_TOKEN, API_ID, API_HASH, BOT_USERNAME
-from handlers import check_pending_timers
+from config import BOT_TOKEN, API_ID, API_HASH, BOT_USERNAME, ENABLE_MEME_COMMAND
+from handlers import check_pending_timers, resume_pending_downloads
 from handlers.moderation.mute_system import start_unmute_checker
+from handlers.yt.disk_quota import start_download_janitor
+from handlers.trivia.content_pool import start_content_pools
+from handlers.trivia.meme_pool import start_meme_refresher
 
 # Set up exception handler for unhandled exceptions
 def handle_exception(exc_type, exc_value, exc_traceback):
@@ -23,6 +28,11 @@ sys.excepthook = handle_exception
 async def startup(client: Client):
     await check_pending_timers(client)
     start_unmute_checker(client)  # Start the unmute checker
+    start_content_pools()  # Have jokes, animals and advice ready before they are asked for
+    if ENABLE_MEME_COMMAND:
+        start_meme_refresher()  # Keep the /meme pools fresh
+    await resume_pending_downloads(client)  # Resume yt downloads interrupted by a restart
+    start_download_janitor()  # Keep the downloads directory within its quotas, after resumes claimed their files
     
     # Get bot info for debugging
     me = await client.get_me()
@@ -51,17 +61,23 @@ async def main():
     asyncio_logger = logging.getLogger('asyncio')
     asyncio_logger.setLevel(logging.WARNING)
 
-    # Initialize Pyrogram client for a bot.
-    client = Client(f'{BOT_USERNAME}_session', api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
+    # Initialize Pyrogram client for a bot. Its sends go through the outbound rate limiter.
+    client = OutboundClient(f'{BOT_USERNAME}_session', api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
 
     # Register command handlers
     register_handlers(client)
 
-    async with client:
-        print("Bot is running...")
-        await startup(client)
-        # Keep the bot running
-        await asyncio.Future()
+    # One pooled HTTP session for every outbound API call
+    await init_session()
+
+    try:
+        async with client:
+            print("Bot is running...")
+            await startup(client)
+            # Keep the bot running
+            await asyncio.Future()
+    finally:
+        await close_session()
 
 if __name__ == '__main__':
     try:
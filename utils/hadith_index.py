@@ -0,0 +1,195 @@
+"""Optional local full-text index of hadiths, searched before the Dorar API.
+
+Build it from a dataset dump (a JSON array or JSON lines of records shaped like
+the API's search results, with at least a 'hadith' field):
+
+    python -m utils.hadith_index hadiths.jsonl [output.db]
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import logging
+import aiosqlite
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from config import HADITH_INDEX_DB
+
+logger = logging.getLogger(__name__)
+
+HADITH_INDEX_LIMIT = 100  # Results returned by one local search
+
+# Harakat, tanween, sukun, superscript alef and tatweel
+ARABIC_DIACRITICS = re.compile(r"[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+ARABIC_FOLDING = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ؤ": "و", "ئ": "ي", "ى": "ي", "ة": "ه",
+})
+HTML_TAGS = re.compile(r"<[^>]+>")
+
+# Dorar's d[]=1 keeps hadiths the scholars judged authentic. Grade words are matched
+# as whole words after normalization, with attached prefixes (بثابت, الصحيح) removed
+AUTHENTIC_WORDS = {"صحيح", "حسن", "ثابت", "جيد", "يصح", "يثبت", "اصل", "ثقات", "ثقه"}
+WEAK_WORDS = {"ضعيف", "ضعيفه", "موضوع", "باطل", "منكر", "شاذ", "كذب", "مكذوب", "واه", "متروك"}
+# A negation makes every grade word after it in the same clause count against the hadith
+NEGATIONS = {"غير", "ليس", "ليست", "لا", "لم", "ما", "بغير"}
+WORD_PREFIXES = ("وال", "فال", "بال", "كال", "لل", "ال", "و", "ف", "ب", "ك", "ل")
+# Only the article forms are stripped from query words, a leading letter alone is too
+# often part of the word itself
+ARTICLE_PREFIXES = tuple(prefix for prefix in WORD_PREFIXES if len(prefix) > 1)
+GRADE_CLAUSES = re.compile(r"[،,؛;.:\-()\[\]]")
+
+def normalize_arabic(text: str) -> str:
+    """Drop diacritics and fold hamza, alef maqsura and taa marbuta forms."""
+    text = ARABIC_DIACRITICS.sub("", text).translate(ARABIC_FOLDING)
+    return " ".join(text.lower().split())
+
+def _strip_prefix(word: str, prefixes: Tuple[str, ...] = WORD_PREFIXES) -> str:
+    """word without its attached prefix, when at least three letters are left."""
+    for prefix in prefixes:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+            return word[len(prefix):]
+    return word
+
+def index_text(text: str) -> str:
+    """The searchable text of a hadith: its normalized words followed by the stems
+    of words with an attached prefix, so searching اعمال finds الاعمال.
+
+    >>> index_text("إنما الأعمال بالنيات")
+    'انما الاعمال بالنيات اعمال نيات'
+    """
+    words = normalize_arabic(HTML_TAGS.sub(" ", text)).split()
+    stems = [stem for word, stem in zip(words, map(_strip_prefix, words)) if stem != word]
+    return " ".join(words + stems)
+
+def _grade_word(token: str) -> str:
+    """token, or token without an attached prefix when that is a grade word."""
+    if token in AUTHENTIC_WORDS or token in WEAK_WORDS or token in NEGATIONS:
+        return token
+    for prefix in WORD_PREFIXES:
+        stem = token[len(prefix):]
+        if token.startswith(prefix) and len(stem) >= 3 and (stem in AUTHENTIC_WORDS or stem in WEAK_WORDS):
+            return stem
+    return token
+
+def is_authentic(record: Dict[str, Any]) -> bool:
+    """Whether a record passes the default grade filter, judged from its grade text
+    unless the dump says so explicitly.
+
+    >>> is_authentic({'grade': 'إسناده صحيح'}), is_authentic({'grade': 'صحيح لغيره'})
+    (True, True)
+    >>> is_authentic({'grade': 'غير صحيح'}), is_authentic({'grade': 'ليس بثابت'})
+    (False, False)
+    >>> is_authentic({'grade': 'لا يصح'}), is_authentic({'grade': 'إسناده ضعيف'})
+    (False, False)
+    >>> is_authentic({'grade': 'رجاله ثقات'}), is_authentic({'grade': 'فيه راو ليس بثقة'})
+    (True, False)
+    """
+    if 'authentic' in record:
+        return bool(record['authentic'])
+    found = False
+    for clause in GRADE_CLAUSES.split(normalize_arabic(record.get('grade') or "")):
+        negated = False
+        for word in map(_grade_word, clause.split()):
+            if word in NEGATIONS:
+                negated = True
+            elif word in WEAK_WORDS:
+                return False
+            elif word in AUTHENTIC_WORDS:
+                if negated:
+                    return False
+                # "له اصل" alone doesn't make a hadith authentic
+                found = found or word != "اصل"
+    return found
+
+def _match_expression(query: str) -> Optional[str]:
+    """Every word of the query, each matching as a word prefix, with the article removed
+    like it is from the indexed stems.
+
+    >>> _match_expression("الأعمال بالنيات")
+    '"اعمال"* "نيات"*'
+    """
+    words = [_strip_prefix(word.replace('"', ""), ARTICLE_PREFIXES) for word in normalize_arabic(query).split()]
+    words = [word for word in words if word]
+    return " ".join(f'"{word}"*' for word in words) or None
+
+async def search_local(query: str, grade_filter: str) -> Optional[List[Dict[str, Any]]]:
+    """Search the local index, or return None when it is missing or has no match."""
+    if not HADITH_INDEX_DB or not os.path.exists(HADITH_INDEX_DB):
+        return None
+    match = _match_expression(query)
+    if match is None:
+        return None
+
+    started = time.perf_counter()
+    async with aiosqlite.connect(f"file:{HADITH_INDEX_DB}?mode=ro", uri=True) as connection:
+        async with connection.execute(
+            "SELECT hadiths.data FROM hadith_fts JOIN hadiths ON hadiths.id = hadith_fts.rowid "
+            "WHERE hadith_fts MATCH ? AND (? = 0 OR hadiths.authentic = 1) ORDER BY hadith_fts.rank LIMIT ?",
+            (match, 1 if grade_filter == "1" else 0, HADITH_INDEX_LIMIT)
+        ) as cursor:
+            rows = await cursor.fetchall()
+    logger.info(f"Local hadith index: {len(rows)} results for '{query}' in {(time.perf_counter() - started) * 1000:.1f}ms")
+    return [json.loads(row[0]) for row in rows] or None
+
+def read_dump(path: str) -> Iterator[Dict[str, Any]]:
+    """Records from a JSON array, an object with a 'data' array, or JSON lines."""
+    with open(path, encoding="utf-8") as file:
+        first = file.read(1)
+        while first and first.isspace():
+            first = file.read(1)
+        file.seek(0)
+        if first in ("[", "{"):
+            try:
+                data = json.load(file)
+            except json.JSONDecodeError:
+                # A JSON lines file whose lines are objects
+                file.seek(0)
+            else:
+                yield from data.get('data', [data]) if isinstance(data, dict) else data
+                return
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+def build_index(records: Iterable[Dict[str, Any]], output: str) -> int:
+    """Write a fresh index to output and return the number of hadiths in it.
+
+    The index is built next to output and moved into place at the end, so a
+    running bot keeps searching the previous one until then.
+    """
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    building = output + ".building"
+    if os.path.exists(building):
+        os.remove(building)
+
+    connection = sqlite3.connect(building)
+    try:
+        connection.execute("CREATE TABLE hadiths (id INTEGER PRIMARY KEY, authentic INTEGER, data TEXT)")
+        # Contentless: the searchable text is normalized, the original record lives in hadiths
+        connection.execute("CREATE VIRTUAL TABLE hadith_fts USING fts5(text, content='', tokenize='unicode61')")
+        count = 0
+        for record in records:
+            text = index_text(record.get('hadith') or "")
+            if not text:
+                continue
+            count += 1
+            connection.execute(
+                "INSERT INTO hadiths (id, authentic, data) VALUES (?, ?, ?)",
+                (count, int(is_authentic(record)), json.dumps(record, separators=(",", ":"), ensure_ascii=False))
+            )
+            connection.execute("INSERT INTO hadith_fts (rowid, text) VALUES (?, ?)", (count, text))
+        connection.execute("INSERT INTO hadith_fts (hadith_fts) VALUES ('optimize')")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(building, output)
+    return count
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("Usage: python -m utils.hadith_index <dump.json|dump.jsonl> [output.db]")
+    output = sys.argv[2] if len(sys.argv) == 3 else HADITH_INDEX_DB
+    count = build_index(read_dump(sys.argv[1]), output)
+    print(f"Indexed {count} hadiths into {output}")
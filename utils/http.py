@@ -0,0 +1,49 @@
+import aiohttp
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Connection pool shared by every outbound HTTP call
+POOL_SIZE = 100  # Open connections across all hosts
+POOL_SIZE_PER_HOST = 10  # Open connections to one host
+DNS_CACHE_TTL = 300  # Seconds a resolved host is reused
+KEEPALIVE_TIMEOUT = 30  # Seconds an idle connection stays open
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10)
+
+_session: Optional[aiohttp.ClientSession] = None
+
+def _create_session() -> aiohttp.ClientSession:
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=POOL_SIZE,
+            limit_per_host=POOL_SIZE_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT
+        ),
+        timeout=DEFAULT_TIMEOUT
+    )
+
+async def init_session() -> aiohttp.ClientSession:
+    """Create the application's HTTP session. Called once from main.main."""
+    return get_session()
+
+def get_session() -> aiohttp.ClientSession:
+    """Return the shared HTTP session, creating it on first use.
+
+    Reusing one session keeps connections alive between requests instead of
+    paying for a new TCP/TLS handshake every time. Requests that need other
+    headers or timeouts pass them per call.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
+
+async def close_session() -> None:
+    """Close the shared session and its pooled connections on shutdown."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("Closed shared HTTP session")
+    _session = None
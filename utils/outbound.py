@@ -0,0 +1,203 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pyrogram import Client, raw
+from pyrogram.errors import FloodWait
+
+logger = logging.getLogger(__name__)
+
+# Priorities, lower goes first
+PRIORITY_COMMAND = 0     # Replies to commands and callbacks
+PRIORITY_PROGRESS = 1    # Progress message edits
+PRIORITY_BACKGROUND = 2  # Timers, unmutes, scheduled events
+
+# Telegram's documented limits: ~1 message/s per private chat, 20/min per group, 30/s overall
+PRIVATE_RATE, PRIVATE_BURST = 1.0, 3
+GROUP_RATE, GROUP_BURST = 20 / 60, 5
+GLOBAL_RATE, GLOBAL_BURST = 30.0, 30
+MAX_AUTO_FLOOD_WAIT = 60  # Longer FloodWaits are raised to the caller instead of retried
+
+# Requests that count against the send limits
+LIMITED_QUERIES = (
+    raw.functions.messages.SendMessage,
+    raw.functions.messages.SendMedia,
+    raw.functions.messages.SendMultiMedia,
+    raw.functions.messages.EditMessage,
+    raw.functions.messages.ForwardMessages,
+)
+
+outbound_priority = ContextVar("outbound_priority", default=PRIORITY_COMMAND)
+
+@contextmanager
+def send_priority(priority: int):
+    """Send everything inside the block at the given priority."""
+    token = outbound_priority.set(priority)
+    try:
+        yield
+    finally:
+        outbound_priority.reset(token)
+
+class TokenBucket:
+    """Token bucket that can also be paused, e.g. for a FloodWait."""
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class OutboundScheduler:
+    """Grants send slots by priority while respecting per-chat and global buckets."""
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.chat_buckets = {}
+        self.waiting = []  # heap of (priority, sequence, chat_key, future)
+        self.sequence = itertools.count()
+        self.wakeup = None
+        self.dispatcher = None
+
+    def bucket_for(self, chat_key) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_key)
+        if bucket is None:
+            is_private = chat_key[0] == "user"
+            bucket = TokenBucket(*(
+                (PRIVATE_RATE, PRIVATE_BURST) if is_private else (GROUP_RATE, GROUP_BURST)
+            ))
+            self.chat_buckets[chat_key] = bucket
+        return bucket
+
+    async def acquire(self, chat_key, priority: int):
+        """Wait until this request may be sent."""
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (priority, next(self.sequence), chat_key, future))
+        self.wakeup.set()
+        await future
+
+    def pause(self, chat_key, seconds: float):
+        """Pause one chat's bucket, or every send if the chat is unknown."""
+        bucket = self.bucket_for(chat_key) if chat_key else self.global_bucket
+        bucket.pause(seconds)
+        if self.wakeup:
+            self.wakeup.set()
+
+    def _grant_ready(self) -> float:
+        """Release every request that can go now. Returns seconds until the next one might."""
+        now = time.monotonic()
+        next_delay = None
+        still_waiting = []
+        while self.waiting:
+            entry = heapq.heappop(self.waiting)
+            priority, _, chat_key, future = entry
+            if future.done():
+                continue  # The caller gave up
+            chat_bucket = self.bucket_for(chat_key) if chat_key else None
+            chat_delay = chat_bucket.delay(now) if chat_bucket else 0
+            if chat_delay > 0:
+                # Blocked on its own chat only; other chats may still go
+                still_waiting.append(entry)
+                next_delay = chat_delay if next_delay is None else min(next_delay, chat_delay)
+                continue
+            global_delay = self.global_bucket.delay(now)
+            if global_delay > 0:
+                # Everything after this is lower priority and needs the global bucket too
+                still_waiting.append(entry)
+                next_delay = global_delay if next_delay is None else min(next_delay, global_delay)
+                break
+            self.global_bucket.take()
+            if chat_bucket:
+                chat_bucket.take()
+            future.set_result(None)
+
+        for entry in still_waiting:
+            heapq.heappush(self.waiting, entry)
+        return next_delay
+
+    def _prune(self):
+        """Drop buckets of chats that are idle and full again."""
+        if len(self.chat_buckets) < 1000:
+            return
+        now = time.monotonic()
+        waiting_keys = {entry[2] for entry in self.waiting}
+        for chat_key, bucket in list(self.chat_buckets.items()):
+            if chat_key not in waiting_keys and bucket.delay(now) == 0 and bucket.tokens >= bucket.capacity:
+                del self.chat_buckets[chat_key]
+
+    async def _dispatch(self):
+        while True:
+            try:
+                self.wakeup.clear()
+                next_delay = self._grant_ready()
+                self._prune()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), next_delay)
+                except asyncio.TimeoutError:
+                    pass
+            except Exception as e:
+                logger.error(f"Error in outbound scheduler: {e}")
+                await asyncio.sleep(1)
+
+def _chat_key(query):
+    """Identify the chat a request goes to, from its input peer."""
+    peer = getattr(query, "peer", None) or getattr(query, "to_peer", None)
+    if isinstance(peer, raw.types.InputPeerUser):
+        return ("user", peer.user_id)
+    if isinstance(peer, raw.types.InputPeerSelf):
+        return ("user", "self")
+    if isinstance(peer, raw.types.InputPeerChat):
+        return ("chat", peer.chat_id)
+    if isinstance(peer, raw.types.InputPeerChannel):
+        return ("channel", peer.channel_id)
+    return None
+
+class OutboundClient(Client):
+    """Pyrogram client whose sends and edits go through the outbound scheduler.
+
+    FloodWaits on limited requests pause only the affected chat's bucket and the
+    request is retried; progress edits are not retried, since a newer edit will
+    replace them anyway.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outbound = OutboundScheduler()
+
+    async def invoke(self, query, *args, **kwargs):
+        if not isinstance(query, LIMITED_QUERIES):
+            return await super().invoke(query, *args, **kwargs)
+
+        # Raise FloodWait here instead of sleeping inside the session
+        if len(args) < 3:
+            kwargs.setdefault("sleep_threshold", 0)
+        chat_key = _chat_key(query)
+        priority = outbound_priority.get()
+
+        while True:
+            await self.outbound.acquire(chat_key, priority)
+            try:
+                return await super().invoke(query, *args, **kwargs)
+            except FloodWait as e:
+                self.outbound.pause(chat_key, e.value)
+                logger.warning(f"FloodWait of {e.value}s for {chat_key or 'all chats'}, pausing that bucket")
+                if priority == PRIORITY_PROGRESS or e.value > MAX_AUTO_FLOOD_WAIT:
+                    raise
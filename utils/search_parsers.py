@@ -0,0 +1,156 @@
+"""Result page parsers for /search, kept free of bot imports so they can run in a
+worker thread and be benchmarked on their own (see benchmarks/search_parsers.py).
+
+selectolax is used when it is installed. Otherwise BeautifulSoup parses the page,
+with lxml as its tree builder when that is installed.
+"""
+import urllib.parse
+from typing import List, Optional
+from bs4 import BeautifulSoup
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml  # noqa: F401
+    SOUP_PARSER = "lxml"
+except ImportError:
+    SOUP_PARSER = "html.parser"
+
+# "selectolax", "lxml" or "html.parser", fastest installed first
+HTML_BACKEND = "selectolax" if LexborHTMLParser else SOUP_PARSER
+
+MAX_RESULTS = 15  # Results kept per page, enough for three pages of pagination
+MAX_SNIPPET_LENGTH = 150
+
+def _format_result(title: str, link: str, snippet: str) -> str:
+    if len(snippet) > MAX_SNIPPET_LENGTH:
+        snippet = snippet[:MAX_SNIPPET_LENGTH] + "..."
+    return f"🔹 [{title}]({link})\n_{snippet}_\n"
+
+def _clean_duckduckgo_link(link: str) -> Optional[str]:
+    """The target of a result link, DuckDuckGo wraps them in /l/?uddg=<url> redirects."""
+    if "/l/?uddg=" in link:
+        try:
+            parsed_url = urllib.parse.parse_qs(urllib.parse.urlparse(link).query)
+        except ValueError:
+            return None
+        return urllib.parse.unquote(parsed_url['uddg'][0]) if 'uddg' in parsed_url else link
+    if link.startswith("//"):
+        return "https:" + link
+    return link if link.startswith("http") else None
+
+def _duckduckgo_results(candidates) -> List[str]:
+    """Format (title, link, snippet) candidates, skipping unusable ones."""
+    results = []
+    for title, link, snippet in candidates:
+        link = _clean_duckduckgo_link(link) if link else None
+        if title and link and len(title) > 3:
+            results.append(_format_result(title, link, snippet))
+    return results
+
+# Multiple selector strategies for DuckDuckGo
+DUCKDUCKGO_SELECTORS = (".result", ".web-result", "[class*='result']", ".links_main")
+DUCKDUCKGO_SNIPPET_SELECTORS = (".result__snippet", ".snippet", "[class*='snippet']")
+
+def _parse_duckduckgo_soup(html: str, parser: str) -> List[str]:
+    soup = BeautifulSoup(html, parser)
+
+    search_results = []
+    for selector in DUCKDUCKGO_SELECTORS:
+        search_results = soup.select(selector, limit=MAX_RESULTS)
+        if search_results:
+            break
+
+    if not search_results:
+        # Try finding any links with titles
+        search_results = [a for a in soup.find_all("a", href=True) if len(a.get_text(strip=True)) > 10]
+
+    candidates = []
+    for result in search_results[:MAX_RESULTS]:
+        title = link = None
+        snippet = "No description available"
+        if result.name == "a":
+            title = result.get_text(strip=True)
+            link = result.get("href", "")
+        else:
+            # Try to find title and link within result
+            title_elem = result.select_one("a[href]")
+            if title_elem:
+                title = title_elem.get_text(strip=True)
+                link = title_elem.get("href", "")
+            for selector in DUCKDUCKGO_SNIPPET_SELECTORS:
+                snippet_elem = result.select_one(selector)
+                if snippet_elem:
+                    snippet = snippet_elem.get_text(strip=True)
+                    break
+        candidates.append((title, link, snippet))
+    return _duckduckgo_results(candidates)
+
+def _parse_duckduckgo_lexbor(html: str) -> List[str]:
+    tree = LexborHTMLParser(html)
+
+    search_results = []
+    for selector in DUCKDUCKGO_SELECTORS:
+        search_results = tree.css(selector)
+        if search_results:
+            break
+
+    if not search_results:
+        # Try finding any links with titles
+        search_results = [a for a in tree.css("a[href]") if len(a.text(strip=True)) > 10]
+
+    candidates = []
+    for result in search_results[:MAX_RESULTS]:
+        title = link = None
+        snippet = "No description available"
+        if result.tag == "a":
+            title = result.text(strip=True)
+            link = result.attributes.get("href") or ""
+        else:
+            # Try to find title and link within result
+            title_elem = result.css_first("a[href]")
+            if title_elem:
+                title = title_elem.text(strip=True)
+                link = title_elem.attributes.get("href") or ""
+            for selector in DUCKDUCKGO_SNIPPET_SELECTORS:
+                snippet_elem = result.css_first(selector)
+                if snippet_elem:
+                    snippet = snippet_elem.text(strip=True)
+                    break
+        candidates.append((title, link, snippet))
+    return _duckduckgo_results(candidates)
+
+def parse_duckduckgo(html: str, backend: str = HTML_BACKEND) -> List[str]:
+    """Results from DuckDuckGo's HTML endpoint."""
+    if backend == "selectolax":
+        return _parse_duckduckgo_lexbor(html)
+    return _parse_duckduckgo_soup(html, backend)
+
+def parse_bing(html: str, backend: str = HTML_BACKEND) -> List[str]:
+    """Results from a Bing search page."""
+    results = []
+    if backend == "selectolax":
+        for result in LexborHTMLParser(html).css(".b_algo")[:MAX_RESULTS]:
+            title_elem = result.css_first("h2 a")
+            if title_elem:
+                snippet_elem = result.css_first(".b_caption p") or result.css_first(".b_snippet")
+                title = title_elem.text(strip=True)
+                link = title_elem.attributes.get("href") or ""
+                snippet = snippet_elem.text(strip=True) if snippet_elem else "No description available"
+                if title and link.startswith("http"):
+                    results.append(_format_result(title, link, snippet))
+        return results
+
+    for result in BeautifulSoup(html, backend).select(".b_algo", limit=MAX_RESULTS):
+        title_elem = result.select_one("h2 a")
+        if title_elem:
+            snippet_elem = result.select_one(".b_caption p") or result.select_one(".b_snippet")
+            title = title_elem.get_text(strip=True)
+            link = title_elem.get("href", "")
+            snippet = snippet_elem.get_text(strip=True) if snippet_elem else "No description available"
+            if title and link and link.startswith("http"):
+                results.append(_format_result(title, link, snippet))
+    return results